@@ -0,0 +1,62 @@
+"""商店解析、展示文本和购买按钮的基准测试"""
+
+import os
+import sys
+from contextlib import contextmanager
+from typing import Iterator, List
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.utils.shop_parser import ShopParser
+from src.utils.menu_helper import MenuHelper
+from src.services.callback_registry import CallbackRegistry
+from benchmarks.harness import Benchmark
+from benchmarks.synthetic import RARITY_MIXES, generate_shop_text, iter_shop_lines
+
+
+@contextmanager
+def suite(item_counts: List[int]) -> Iterator[List[Benchmark]]:
+    benchmarks = []
+    parser = ShopParser()
+    registry = CallbackRegistry()
+
+    for count in item_counts:
+        for mix_name, mix in RARITY_MIXES.items():
+            text = generate_shop_text(count, mix)
+            params = {"items": count, "mix": mix_name}
+            benchmarks.append(Benchmark(
+                f"parser.parse_shop_text[items={count},mix={mix_name}]",
+                lambda text=text: parser.parse_shop_text(text),
+                group="parser", params=params
+            ))
+
+        text = generate_shop_text(count)
+        items = parser.parse_shop_text(text)["items"]
+        params = {"items": count}
+        benchmarks.extend([
+            Benchmark(
+                f"parser.iter_items_stream[items={count}]",
+                lambda count=count: sum(1 for _ in parser.iter_items(iter_shop_lines(count))),
+                group="parser", params=params
+            ),
+            Benchmark(
+                f"parser.extract_refresh_time[items={count}]",
+                lambda text=text: ShopParser.extract_refresh_time(text),
+                group="parser", params=params
+            ),
+            Benchmark(
+                f"render.format_items_for_display[items={count}]",
+                lambda items=items: ShopParser.format_items_for_display(items),
+                group="render", params=params
+            ),
+            Benchmark(
+                f"render.create_shop_items_keyboard[items={count}]",
+                lambda items=items: MenuHelper.create_shop_items_keyboard(items, registry),
+                group="render", params=params
+            ),
+        ])
+
+    yield benchmarks
@@ -0,0 +1,182 @@
+"""数据库服务层基准测试（内存 SQLite）
+
+同步服务（UserService / ShopService / OperationService）使用 sqlite://，
+Bot 实际使用的异步服务使用 sqlite+aiosqlite://。每次操作使用一个新会话，与处理器中的用法相同。
+"""
+
+import itertools
+import logging
+import os
+import sys
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.database.models import AsyncDatabase, Database
+from src.services.db_service import (
+    AsyncOperationService,
+    AsyncShopService,
+    OperationService,
+    ShopService,
+    UserService,
+)
+from src.utils.shop_parser import ShopParser
+from benchmarks.harness import Benchmark, get_loop
+from benchmarks.synthetic import generate_shop_text
+
+# 预先写入的历史快照数量（查询类基准测试在有历史数据的库上运行）
+HISTORY_SNAPSHOTS = 50
+USER_ID = 1
+# 批量更新用户的基准测试中每批的用户数
+USER_BATCH_SIZE = 100
+
+
+def _shop_data(item_count: int, seed: int = 42) -> dict:
+    return ShopParser().parse_shop_text(generate_shop_text(item_count, seed=seed))
+
+
+def _sync_benchmarks(item_count: int, include_common: bool) -> Tuple[List[Benchmark], Database]:
+    """include_common: 是否包含与商品数量无关的用户/操作日志基准测试"""
+    db = Database("sqlite://")
+    db.init_db()
+
+    with db.get_session() as session:
+        UserService.get_or_create_user(session, USER_ID)
+        for seed in range(HISTORY_SNAPSHOTS):
+            ShopService.save_shop_snapshot(session, USER_ID, _shop_data(item_count, seed))
+        for i in range(HISTORY_SNAPSHOTS):
+            OperationService.log_operation(session, USER_ID, "command", f"指令 {i}")
+
+    shop_data = _shop_data(item_count)
+    item_name = shop_data["items"][0]["name"]
+    new_users = itertools.count(1000)
+    params = {"items": item_count}
+
+    def get_or_create_user():
+        with db.get_session() as session:
+            UserService.get_or_create_user(session, USER_ID)
+
+    def update_user_info():
+        with db.get_session() as session:
+            UserService.update_user_info(session, USER_ID, {"spiritual_stones": 100})
+
+    user_updates = {USER_ID + i: {"spiritual_stones": 100} for i in range(USER_BATCH_SIZE)}
+
+    def upsert_users():
+        with db.get_session() as session:
+            UserService.upsert_users(session, user_updates)
+
+    def save_snapshot_new():
+        with db.get_session() as session:
+            ShopService.save_shop_snapshot(session, next(new_users), shop_data)
+
+    def save_snapshot_dedup():
+        with db.get_session() as session:
+            ShopService.save_shop_snapshot(session, USER_ID, shop_data)
+
+    def get_latest_snapshot():
+        with db.get_session() as session:
+            ShopService.get_latest_shop_snapshot(session, USER_ID)
+
+    def price_history():
+        with db.get_session() as session:
+            ShopService.get_item_price_history(session, item_name)
+
+    def log_operation():
+        with db.get_session() as session:
+            OperationService.log_operation(session, USER_ID, "command", "签到")
+
+    def get_user_operations():
+        with db.get_session() as session:
+            OperationService.get_user_operations(session, USER_ID)
+
+    benchmarks = [
+        Benchmark(f"db.shop.save_shop_snapshot[new,items={item_count}]", save_snapshot_new, group="db", params=params),
+        Benchmark(f"db.shop.save_shop_snapshot[dedup,items={item_count}]", save_snapshot_dedup, group="db", params=params),
+        Benchmark(f"db.shop.get_latest_shop_snapshot[items={item_count}]", get_latest_snapshot, group="db", params=params),
+        Benchmark(f"db.shop.get_item_price_history[items={item_count}]", price_history, group="db", params=params),
+    ]
+    if include_common:
+        benchmarks = [
+            Benchmark("db.user.get_or_create_user", get_or_create_user, group="db"),
+            Benchmark("db.user.update_user_info", update_user_info, group="db"),
+            Benchmark(f"db.user.upsert_users[batch={USER_BATCH_SIZE}]", upsert_users, group="db", params={"batch": USER_BATCH_SIZE}),
+            Benchmark("db.operation.log_operation", log_operation, group="db"),
+            Benchmark("db.operation.get_user_operations", get_user_operations, group="db"),
+        ] + benchmarks
+    return benchmarks, db
+
+
+def _async_benchmarks(item_count: int, include_common: bool, batch_size: int = 100) -> Tuple[List[Benchmark], AsyncDatabase]:
+    loop = get_loop()
+    db = AsyncDatabase("sqlite://")
+
+    async def seed():
+        await db.init_db()
+        async with db.get_session() as session:
+            for i in range(HISTORY_SNAPSHOTS):
+                await AsyncShopService.save_shop_snapshot(session, USER_ID, _shop_data(item_count, i))
+
+    loop.run_until_complete(seed())
+
+    shop_data = _shop_data(item_count)
+    new_users = itertools.count(1000)
+    records = [
+        {"user_id": USER_ID, "operation_type": "command", "operation_content": f"指令 {i}"}
+        for i in range(batch_size)
+    ]
+    params = {"items": item_count}
+
+    async def save_snapshot_new():
+        async with db.get_session() as session:
+            await AsyncShopService.save_shop_snapshot(session, next(new_users), shop_data)
+
+    async def get_latest_snapshot():
+        async with db.get_session() as session:
+            await AsyncShopService.get_latest_shop_snapshot(session, USER_ID)
+
+    async def log_operations_batch():
+        async with db.get_session() as session:
+            await AsyncOperationService.log_operations(session, records)
+
+    benchmarks = [
+        Benchmark(f"db_async.shop.save_shop_snapshot[new,items={item_count}]", save_snapshot_new, group="db_async", params=params),
+        Benchmark(f"db_async.shop.get_latest_shop_snapshot[items={item_count}]", get_latest_snapshot, group="db_async", params=params),
+    ]
+    if include_common:
+        benchmarks.append(Benchmark(
+            f"db_async.operation.log_operations[batch={batch_size}]", log_operations_batch,
+            group="db_async", params={"batch": batch_size}
+        ))
+    return benchmarks, db
+
+
+@contextmanager
+def suite(item_counts: List[int]) -> Iterator[List[Benchmark]]:
+    # 服务层每次调用都会记录 INFO 日志，基准测试中关闭
+    logging.disable(logging.INFO)
+
+    benchmarks = []
+    sync_dbs = []
+    async_dbs = []
+    for i, count in enumerate(item_counts):
+        sync_benchmarks, db = _sync_benchmarks(count, include_common=(i == 0))
+        benchmarks.extend(sync_benchmarks)
+        sync_dbs.append(db)
+        async_benchmarks, async_db = _async_benchmarks(count, include_common=(i == 0))
+        benchmarks.extend(async_benchmarks)
+        async_dbs.append(async_db)
+
+    try:
+        yield benchmarks
+    finally:
+        for db in sync_dbs:
+            db.close()
+        loop = get_loop()
+        for async_db in async_dbs:
+            loop.run_until_complete(async_db.close())
+        logging.disable(logging.NOTSET)
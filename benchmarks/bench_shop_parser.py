@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""商店解析器吞吐量基准测试
+
+用法: python benchmarks/bench_shop_parser.py [--items 10000] [--repeat 5]
+
+分别测试整段文本输入和行生成器（流式）输入，并通过 1x/2x/4x
+规模的输入验证耗时随输入长度线性增长。
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.utils.shop_parser import ShopParser
+from benchmarks.synthetic import generate_shop_text, iter_shop_lines
+
+
+def best_of(repeat: int, func) -> float:
+    """多次运行取最短耗时"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_text(item_count: int, repeat: int) -> float:
+    """整段文本输入"""
+    text = generate_shop_text(item_count)
+    parser = ShopParser()
+    elapsed = best_of(repeat, lambda: parser.parse_shop_text(text))
+    size_mb = len(text.encode("utf-8")) / 1024 / 1024
+    print(f"parse_shop_text  {item_count:>7} 件: {elapsed * 1000:8.2f} ms  "
+          f"{item_count / elapsed:>12,.0f} 件/秒  {size_mb / elapsed:6.1f} MB/秒")
+    return elapsed
+
+
+def bench_stream(item_count: int, repeat: int) -> float:
+    """行生成器输入（包含生成文本本身的开销）"""
+    parser = ShopParser()
+
+    def run():
+        for _ in parser.iter_items(iter_shop_lines(item_count)):
+            pass
+
+    elapsed = best_of(repeat, run)
+    print(f"iter_items(流式) {item_count:>7} 件: {elapsed * 1000:8.2f} ms  "
+          f"{item_count / elapsed:>12,.0f} 件/秒")
+    return elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="商店解析器基准测试")
+    arg_parser.add_argument("--items", type=int, default=10000, help="物品数量")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="重复次数（取最优）")
+    args = arg_parser.parse_args()
+
+    bench_text(args.items, args.repeat)
+    bench_stream(args.items, args.repeat)
+
+    print("\n线性度检查:")
+    base = bench_text(args.items, args.repeat)
+    for factor in (2, 4):
+        elapsed = bench_text(args.items * factor, args.repeat)
+        print(f"  {factor}x 输入耗时比: {elapsed / base:.2f}")
+
+
+if __name__ == "__main__":
+    main()
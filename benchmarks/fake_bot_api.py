@@ -0,0 +1,226 @@
+"""本地模拟的 Telegram Bot API（压测用）
+
+实现 Bot 用到的接口：getMe、getUpdates（长轮询）、sendMessage、editMessageText、
+answerCallbackQuery，其余方法直接返回成功。可以为每个请求加入固定延迟和随机抖动，
+并按比例返回 429（Too Many Requests）。
+
+发往游戏Bot的消息由内置的"游戏Bot"在 game_latency 后回复（作为新的更新投递给 Bot），
+这样转发指令的完整流程（发送 -> 等待回复 -> 编辑结果）也能在本地跑通。
+"""
+
+import asyncio
+import json
+import random
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+# 可能注入 429 的方法（getMe / getUpdates 出错会使 Bot 无法启动或停止接收更新，不注入）
+RATE_LIMITED_METHODS = {"sendMessage", "editMessageText", "answerCallbackQuery"}
+
+# 回复等待者: (匹配函数, Future)
+Waiter = Tuple[Callable[[str, Dict[str, Any]], bool], asyncio.Future]
+
+
+# 整数类型的请求参数
+INT_PARAMS = {"chat_id", "message_id", "offset", "limit", "timeout"}
+
+
+def _parse_value(key: str, value: str) -> Any:
+    """请求参数都以字符串传递，嵌套的对象（reply_markup 等）为 JSON"""
+    if key in INT_PARAMS:
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    if value[:1] in ("{", "["):
+        return json.loads(value)
+    return value
+
+
+class FakeBotAPI:
+    """模拟的 Bot API 服务"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_limit_ratio: float = 0.0,
+        retry_after: int = 1,
+        game_bot_id: Optional[int] = None,
+        game_latency: float = 0.05,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.game_bot_id = game_bot_id
+        self.game_latency = game_latency
+        self._rng = random.Random(seed)
+
+        self.bot_user = {"id": 100000, "is_bot": True, "first_name": "LoadTestBot", "username": "loadtest_bot"}
+        self._updates: Deque[Dict[str, Any]] = deque()
+        self._update_id = 0
+        self._message_id = 0
+        self._update_event = asyncio.Event()
+        self._waiters: Dict[int, List[Waiter]] = {}
+        self._closed = False
+        self._runner: Optional[web.AppRunner] = None
+
+        self.calls: Counter = Counter()
+        self.rate_limited: Counter = Counter()
+        self.updates_delivered = 0
+
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self._handle)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """启动服务，返回 Bot API 地址（可作为 telegram.base_url）"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}/bot"
+
+    async def stop(self):
+        self.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    def close(self):
+        """不再阻塞 getUpdates（停止 Bot 前调用，避免等待长轮询超时）"""
+        self._closed = True
+        self._update_event.set()
+
+    # ---- 供压测脚本使用 ----
+
+    def next_message_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+    def push_update(self, update: Dict[str, Any]) -> int:
+        """投递一个更新（下一次 getUpdates 返回），返回 update_id"""
+        self._update_id += 1
+        update["update_id"] = self._update_id
+        self._updates.append(update)
+        self._update_event.set()
+        return self._update_id
+
+    def expect(self, chat_id: int, match: Callable[[str, Dict[str, Any]], bool]) -> asyncio.Future:
+        """等待 Bot 对 chat_id 的某次调用，match(method, params) 为真时 Future 完成（结果为该调用的返回值）"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((match, future))
+        return future
+
+    def pending_updates(self) -> int:
+        return len(self._updates)
+
+    # ---- 请求处理 ----
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = {k: _parse_value(k, v) for k, v in (await request.post()).items()}
+        self.calls[method] += 1
+
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(params))
+
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if method in RATE_LIMITED_METHODS and self._rng.random() < self.rate_limit_ratio:
+            self.rate_limited[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        handler = getattr(self, f"_api_{method}", None)
+        result = handler(params) if handler else True
+        self._notify(method, params, result)
+        return self._ok(result)
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = params.get("offset") or 0
+        limit = params.get("limit") or 100
+        timeout = params.get("timeout") or 0
+
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+
+        if not self._updates and timeout and not self._closed:
+            self._update_event.clear()
+            try:
+                await asyncio.wait_for(self._update_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        batch = [u for _, u in zip(range(limit), self._updates)]
+        self.updates_delivered += len(batch)
+        return batch
+
+    def _notify(self, method: str, params: Dict[str, Any], result: Any):
+        chat_id = params.get("chat_id")
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        remaining = []
+        for match, future in waiters:
+            if future.done():
+                continue
+            if match(method, params):
+                future.set_result(result)
+            else:
+                remaining.append((match, future))
+        if remaining:
+            self._waiters[chat_id] = remaining
+        else:
+            del self._waiters[chat_id]
+
+    def _message(self, chat_id: int, text: str, message_id: Optional[int] = None, **extra) -> Dict[str, Any]:
+        return {
+            "message_id": message_id or self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self.bot_user,
+            "text": text,
+            **extra,
+        }
+
+    def _api_getMe(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {**self.bot_user, "can_join_groups": False, "can_read_all_group_messages": False,
+                "supports_inline_queries": False}
+
+    def _api_sendMessage(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        message = self._message(params["chat_id"], params.get("text", ""))
+        if self.game_bot_id and params["chat_id"] == self.game_bot_id:
+            asyncio.get_running_loop().call_later(self.game_latency, self._game_bot_reply, message)
+        return message
+
+    def _api_editMessageText(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self._message(params["chat_id"], params.get("text", ""), message_id=params.get("message_id"))
+
+    def _game_bot_reply(self, command: Dict[str, Any]):
+        """模拟游戏Bot回复转发过来的指令（回复到指令消息上）"""
+        game_bot = {"id": self.game_bot_id, "is_bot": True, "first_name": "美奈"}
+        self.push_update({
+            "message": {
+                "message_id": self.next_message_id(),
+                "date": int(time.time()),
+                "chat": {"id": self.game_bot_id, "type": "private"},
+                "from": game_bot,
+                "text": f"【{command['text']}】已完成",
+                "reply_to_message": {**command, "from": self.bot_user},
+            }
+        })
@@ -0,0 +1,142 @@
+"""基准测试框架：计时、结果汇总和与基线比较"""
+
+import asyncio
+import inspect
+import platform
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+# 所有异步基准测试共用的事件循环（异步数据库引擎绑定在创建它的事件循环上）
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+@dataclass
+class Benchmark:
+    """一个基准测试：func 执行一次被测操作（可以是协程函数）"""
+    name: str
+    func: Callable[[], Any]
+    group: str = ""
+    params: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def is_async(self) -> bool:
+        return inspect.iscoroutinefunction(self.func)
+
+
+@dataclass
+class Result:
+    name: str
+    group: str
+    params: Dict[str, Any]
+    loops: int
+    samples: List[float]  # 每个样本中单次操作的平均耗时（秒）
+
+    @property
+    def min(self) -> float:
+        return min(self.samples)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.samples)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "group": self.group,
+            "params": self.params,
+            "loops": self.loops,
+            "min_s": self.min,
+            "median_s": self.median,
+            "ops_per_s": 1 / self.median if self.median else None,
+        }
+
+
+def _timer(bench: Benchmark) -> Callable[[int], float]:
+    """返回执行 loops 次操作并计时的函数"""
+    func = bench.func
+    if bench.is_async:
+        loop = get_loop()
+
+        async def run(loops: int) -> float:
+            start = time.perf_counter()
+            for _ in range(loops):
+                await func()
+            return time.perf_counter() - start
+
+        return lambda loops: loop.run_until_complete(run(loops))
+
+    def run_sync(loops: int) -> float:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        return time.perf_counter() - start
+
+    return run_sync
+
+
+def measure(bench: Benchmark, repeat: int = 5, min_time: float = 0.1) -> Result:
+    """自动确定每个样本的循环次数（单个样本至少 min_time 秒），采样 repeat 次"""
+    timer = _timer(bench)
+    loops = 1
+    while True:
+        elapsed = timer(loops)
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        samples.append(timer(loops) / loops)
+    return Result(bench.name, bench.group, bench.params, loops, samples)
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    threshold: float
+) -> List[Dict[str, Any]]:
+    """与基线比较中位数耗时，返回每项的变化（ratio > 1 + threshold 为回退）"""
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("median_s"):
+            rows.append({"name": name, "ratio": None, "status": "new"})
+            continue
+        ratio = result["median_s"] / base["median_s"]
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 - threshold:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append({"name": name, "ratio": ratio, "status": status})
+    return rows
+
+
+def format_duration(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} µs"
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""端到端压测：模拟大量用户操作，驱动完整的 Bot（所有处理器、数据库、发送队列）
+
+用法: python -m benchmarks.loadtest [--users 1000] [--actions 5] [--latency-ms 20] [--rate-limit-ratio 0.01]
+
+Bot 由 XianxiaBot.build_application 创建，通过长轮询从本地模拟的 Bot API
+（benchmarks/fake_bot_api.py）接收更新。每个模拟用户先发送 /start，然后按 --mix
+给出的比例依次执行操作，每次等到 Bot 的回应后再进行下一步：
+
+- start: 发送 /start，等待主菜单消息
+- menu: 点击菜单按钮，等待消息被编辑
+- shop: 点击"输入商店"，再粘贴合成的商店文本，等待解析结果（两步分别统计）
+- command: 点击快捷指令按钮，等待游戏Bot回复后的执行结果
+
+报告各操作从投递更新到收到回应的 p50/p95/p99 延迟和每秒处理的更新数。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.utils.config import config
+from src.handlers.start_handler import COMMANDS, MENUS
+from src.services.metrics import HANDLER_ERRORS, TELEGRAM_API_ERRORS
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.harness import environment
+from benchmarks.synthetic import generate_shop_text
+
+GAME_BOT_ID = 200000
+FIRST_USER_ID = 1_000_000
+DEFAULT_MIX = "start=1,menu=4,shop=1,command=2"
+
+# /start 消息中的命令实体
+START_ENTITIES = [{"type": "bot_command", "offset": 0, "length": 6}]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("start", "menu", "shop", "command"):
+            raise argparse.ArgumentTypeError(f"未知的操作: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩法计算分位数（values 已排序）"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class LoadStats:
+    """各操作的延迟样本和超时次数"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.timeouts: Counter = Counter()
+
+    def record(self, action: str, seconds: float):
+        self.samples.setdefault(action, []).append(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for action in sorted(set(self.samples) | set(self.timeouts)):
+            values = sorted(self.samples.get(action, []))
+            result[action] = {
+                "count": len(values),
+                "timeouts": self.timeouts[action],
+                "p50_s": percentile(values, 0.50),
+                "p95_s": percentile(values, 0.95),
+                "p99_s": percentile(values, 0.99),
+                "max_s": values[-1] if values else None,
+            }
+        return result
+
+    @property
+    def completed(self) -> int:
+        return sum(len(v) for v in self.samples.values())
+
+
+class SimulatedUser:
+    """一个模拟用户：依次执行操作，每一步等待 Bot 的回应"""
+
+    def __init__(self, user_id: int, api: FakeBotAPI, stats: LoadStats, args: argparse.Namespace):
+        self.user_id = user_id
+        self.api = api
+        self.stats = stats
+        self.timeout = args.timeout
+        self.think = args.think_ms / 1000
+        self.shop_text = generate_shop_text(args.shop_items, seed=user_id)
+        self.rng = random.Random(user_id)
+        self.menu_message_id: Optional[int] = None
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"用户{user_id}", "username": f"user{user_id}"}
+
+    def _message_update(self, text: str, **extra) -> Dict[str, Any]:
+        return {"message": {
+            "message_id": self.api.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": self.user,
+            "text": text,
+            **extra,
+        }}
+
+    def _callback_update(self, data: str) -> Dict[str, Any]:
+        return {"callback_query": {
+            "id": f"{self.user_id}-{self.api.next_message_id()}",
+            "from": self.user,
+            "chat_instance": str(self.user_id),
+            "data": data,
+            "message": {
+                "message_id": self.menu_message_id,
+                "date": int(time.time()),
+                "chat": {"id": self.user_id, "type": "private"},
+                "from": self.api.bot_user,
+                "text": "菜单",
+            },
+        }}
+
+    def _edited(self, text: Optional[str] = None):
+        message_id = self.menu_message_id
+        return lambda method, params: (
+            method == "editMessageText"
+            and params.get("message_id") == message_id
+            and (text is None or text in params.get("text", ""))
+        )
+
+    @staticmethod
+    def _sent(method: str, params: Dict[str, Any]) -> bool:
+        return method == "sendMessage"
+
+    @staticmethod
+    def _shop_shown(method: str, params: Dict[str, Any]) -> bool:
+        """解析结果：新的商店消息，或原地编辑的上一条商店消息"""
+        return method in ("sendMessage", "editMessageText") and "商店物品列表" in params.get("text", "")
+
+    async def _step(self, action: str, update: Dict[str, Any], match) -> Optional[Any]:
+        """投递一个更新并等待 Bot 的回应，记录延迟"""
+        future = self.api.expect(self.user_id, match)
+        start = time.perf_counter()
+        self.api.push_update(update)
+        try:
+            result = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts[action] += 1
+            return None
+        self.stats.record(action, time.perf_counter() - start)
+        return result
+
+    async def do_start(self):
+        result = await self._step("start", self._message_update("/start", entities=START_ENTITIES), self._sent)
+        if result:
+            self.menu_message_id = result["message_id"]
+
+    async def do_menu(self):
+        await self._step("menu", self._callback_update(self.rng.choice(list(MENUS))), self._edited())
+
+    async def do_shop(self):
+        if await self._step("shop_input", self._callback_update("shop_input"), self._edited()):
+            await self._step("shop_paste", self._message_update(self.shop_text), self._shop_shown)
+
+    async def do_command(self):
+        await self._step("command", self._callback_update(self.rng.choice(list(COMMANDS))), self._edited("执行结果"))
+
+    async def run(self, actions: int, mix: Dict[str, float], ramp: float):
+        if ramp:
+            await asyncio.sleep(self.rng.uniform(0, ramp))
+        names, weights = list(mix), list(mix.values())
+        await self.do_start()
+        for _ in range(actions):
+            if self.think:
+                await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+            if self.menu_message_id is None:
+                await self.do_start()
+                continue
+            action = self.rng.choices(names, weights)[0]
+            await getattr(self, f"do_{action}")()
+
+
+def build_config(args: argparse.Namespace, base_url: str, db_url: str) -> Dict[str, Any]:
+    """压测使用的配置（不读取 config/config.yaml）"""
+    return {
+        "telegram": {
+            "bot_token": "123456:LOADTEST",
+            "user_id": FIRST_USER_ID,
+            "mode": "polling",
+            "base_url": base_url,
+            "game_bot_user_id": GAME_BOT_ID,
+            "game_bot_username": "loadtest_game_bot",
+            "command_timeout": args.timeout,
+            "global_rate_limit": args.global_rate_limit,
+            "chat_rate_limit": args.chat_rate_limit,
+            "chat_burst": args.chat_burst,
+            "concurrent_updates": args.concurrent_updates,
+        },
+        "database": {"url": db_url},
+        "app": {"config_reload_interval": 0},
+        "scheduler": {"maintenance_interval": 0},
+    }
+
+
+def _counter_values(counter) -> Dict[str, float]:
+    return {"/".join(labels.values()): value for _, labels, value in counter.samples()}
+
+
+async def run_load(args: argparse.Namespace, db_url: str) -> Dict[str, Any]:
+    api = FakeBotAPI(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        rate_limit_ratio=args.rate_limit_ratio,
+        retry_after=args.retry_after,
+        game_bot_id=GAME_BOT_ID,
+        game_latency=args.game_latency_ms / 1000,
+        seed=args.seed,
+    )
+    base_url = await api.start()
+    config.load_dict(build_config(args, base_url, db_url))
+
+    # 配置替换后再创建 Bot（XianxiaBot 在构造时读取配置）
+    from src.bot import XianxiaBot
+    bot = XianxiaBot(max_retries=1)
+    app = bot.build_application()
+    await bot.start_application(app)
+    await app.updater.start_polling(poll_interval=0, timeout=10)
+
+    stats = LoadStats()
+    users = [SimulatedUser(FIRST_USER_ID + i, api, stats, args) for i in range(args.users)]
+    print(f"{args.users} 个用户，每人 {args.actions} 次操作，Bot API 延迟 {args.latency_ms} ms，"
+          f"429 比例 {args.rate_limit_ratio:.1%}", flush=True)
+
+    delivered_before = api.updates_delivered
+    start = time.perf_counter()
+    await asyncio.gather(*(user.run(args.actions, args.mix, args.ramp) for user in users))
+    elapsed = time.perf_counter() - start
+    delivered = api.updates_delivered - delivered_before
+
+    api.close()
+    await app.updater.stop()
+    await bot.stop_application(app)
+    await api.stop()
+
+    return {
+        "environment": environment(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output",)},
+        "elapsed_s": elapsed,
+        "updates": delivered,
+        "updates_per_s": delivered / elapsed if elapsed else None,
+        "actions_completed": stats.completed,
+        "actions": stats.summary(),
+        "api_calls": dict(api.calls),
+        "rate_limited": dict(api.rate_limited),
+        "handler_errors": _counter_values(HANDLER_ERRORS),
+        "api_errors": _counter_values(TELEGRAM_API_ERRORS),
+        "update_processor": bot.update_processor.stats() if bot.update_processor else None,
+    }
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return f"{seconds * 1000:.1f}" if seconds is not None else "-"
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n耗时 {report['elapsed_s']:.1f} s，处理更新 {report['updates']} 个"
+          f"（{report['updates_per_s']:.1f}/s），完成操作 {report['actions_completed']} 次")
+    print(f"\n{'action':<12} {'count':>7} {'timeouts':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for action, row in report["actions"].items():
+        print(f"{action:<12} {row['count']:>7} {row['timeouts']:>9} {_ms(row['p50_s']):>9} "
+              f"{_ms(row['p95_s']):>9} {_ms(row['p99_s']):>9} {_ms(row['max_s']):>9}")
+    print(f"\nBot API 调用: {report['api_calls']}")
+    if report["rate_limited"]:
+        print(f"注入的 429: {report['rate_limited']}")
+    if report["api_errors"]:
+        print(f"Bot API 错误: {report['api_errors']}")
+    if report["handler_errors"]:
+        print(f"处理器异常: {report['handler_errors']}")
+    processor = report["update_processor"]
+    if processor:
+        print(f"更新排队: 最长 {_ms(processor['max_wait'])} ms，"
+              f"排队最久的用户 {[(u['user_id'], round(u['total'] * 1000)) for u in processor['top_waiting_users'][:3]]}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="端到端压测（本地模拟 Bot API）")
+    parser.add_argument("--users", type=int, default=1000, help="模拟用户数")
+    parser.add_argument("--actions", type=int, default=5, help="每个用户 /start 之后的操作次数")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"各操作的比例（默认 {DEFAULT_MIX}）")
+    parser.add_argument("--think-ms", type=float, default=0, help="操作之间的平均间隔（毫秒）")
+    parser.add_argument("--ramp", type=float, default=1.0, help="用户在前多少秒内陆续开始")
+    parser.add_argument("--shop-items", type=int, default=20, help="粘贴的商店文本中的商品数量")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Bot API 每次请求的延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="在延迟上叠加的随机抖动（毫秒）")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="返回 429 的请求比例")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应中的 retry_after（秒）")
+    parser.add_argument("--game-latency-ms", type=float, default=50, help="模拟游戏Bot的回复延迟（毫秒）")
+    # 默认放宽发送限流，测量 Bot 自身的处理能力；按 30 / 1 / 3 可复现生产环境的限流
+    parser.add_argument("--global-rate-limit", type=float, default=1000, help="telegram.global_rate_limit")
+    parser.add_argument("--chat-rate-limit", type=float, default=100, help="telegram.chat_rate_limit")
+    parser.add_argument("--chat-burst", type=float, default=100, help="telegram.chat_burst")
+    parser.add_argument("--concurrent-updates", type=int, default=32, help="telegram.concurrent_updates（1 为串行处理）")
+    parser.add_argument("--timeout", type=float, default=30, help="等待每一步回应的超时（秒）")
+    parser.add_argument("--db-url", default=None, help="数据库 URL（默认使用临时目录中的 SQLite 文件）")
+    parser.add_argument("--seed", type=int, default=42, help="模拟 Bot API 的随机种子")
+    parser.add_argument("--output", default=None, help="将报告写入 JSON 文件")
+    parser.add_argument("--log-level", default="CRITICAL", help="Bot 的日志级别（默认只统计错误数，不输出日志）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    tmpdir = None
+    db_url = args.db_url
+    if db_url is None:
+        tmpdir = tempfile.mkdtemp(prefix="xianxia-loadtest-")
+        db_url = f"sqlite:///{os.path.join(tmpdir, 'loadtest.db')}"
+
+    try:
+        report = asyncio.run(run_load(args, db_url))
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""运行全部基准测试并与基线比较
+
+用法: python -m benchmarks.run [--quick] [--filter parser] [--save-baseline]
+
+结果写入 JSON（默认 benchmarks/results/latest.json）。若存在基线文件
+（默认 benchmarks/baseline.json），按中位数耗时逐项比较，
+任一项变慢超过阈值（默认 25%）时以退出码 1 结束，可直接用于 CI。
+"""
+
+import argparse
+import json
+import os
+import sys
+from contextlib import ExitStack
+from typing import Any, Dict, List
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from benchmarks import bench_rendering, bench_services
+from benchmarks.harness import Benchmark, compare, environment, format_duration, measure
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+SUITES = [bench_rendering, bench_services]
+
+# 商品数量：日常商店约 10~30 件，1000 件用于观察规模增长
+ITEM_COUNTS = [10, 100, 1000]
+QUICK_ITEM_COUNTS = [10, 100]
+
+
+def load_json(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(path: str, data: Dict[str, Any]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def run_benchmarks(benchmarks: List[Benchmark], repeat: int, min_time: float) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    width = max(len(b.name) for b in benchmarks)
+    print(f"{'benchmark':<{width}}  {'median':>10}  {'min':>10}  {'loops':>8}")
+    for bench in benchmarks:
+        result = measure(bench, repeat=repeat, min_time=min_time)
+        results[bench.name] = result.to_dict()
+        print(f"{bench.name:<{width}}  {format_duration(result.median):>10}  "
+              f"{format_duration(result.min):>10}  {result.loops:>8}")
+    return results
+
+
+def report_comparison(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> int:
+    """打印与基线的比较结果，返回回退项数量"""
+    rows = compare(results, baseline.get("results", {}), threshold)
+    width = max(len(row["name"]) for row in rows)
+    print(f"\n与基线比较（{baseline.get('environment', {}).get('timestamp', '?')}，阈值 ±{threshold:.0%}）")
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}x" if row["ratio"] is not None else "-"
+        print(f"{row['name']:<{width}}  {ratio:>7}  {row['status']}")
+
+    regressions = [row for row in rows if row["status"] == "regression"]
+    if regressions:
+        print(f"\n⚠️ {len(regressions)} 项性能回退")
+    return len(regressions)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="运行基准测试并与基线比较")
+    parser.add_argument("--quick", action="store_true", help="只测试较小的输入规模，并缩短采样时间")
+    parser.add_argument("--filter", default=None, help="只运行名称包含该字符串的基准测试")
+    parser.add_argument("--repeat", type=int, default=5, help="每项采样次数")
+    parser.add_argument("--min-time", type=float, default=None, help="单个样本的最短耗时（秒）")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="结果 JSON 路径")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线 JSON 路径")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=0.25, help="判定为回退的变慢比例")
+    args = parser.parse_args()
+
+    item_counts = QUICK_ITEM_COUNTS if args.quick else ITEM_COUNTS
+    min_time = args.min_time if args.min_time is not None else (0.05 if args.quick else 0.2)
+
+    with ExitStack() as stack:
+        benchmarks = []
+        for suite in SUITES:
+            benchmarks.extend(stack.enter_context(suite.suite(item_counts)))
+        if args.filter:
+            benchmarks = [b for b in benchmarks if args.filter in b.name]
+        if not benchmarks:
+            print("没有匹配的基准测试")
+            return 1
+        results = run_benchmarks(benchmarks, args.repeat, min_time)
+
+    data = {"environment": environment(), "results": results}
+    write_json(args.output, data)
+    print(f"\n结果已写入 {args.output}")
+
+    if args.save_baseline:
+        write_json(args.baseline, data)
+        print(f"基线已保存到 {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("未找到基线文件，跳过比较（使用 --save-baseline 生成）")
+        return 0
+
+    return 1 if report_comparison(results, load_json(args.baseline), args.threshold) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""合成商店文本生成器（用于基准测试）"""
+
+import random
+from typing import Dict, Iterator, Optional
+
+# 默认品级分布（与游戏中实际出现的频率大致相同）
+DEFAULT_RARITY_MIX = {
+    "凡品": 0.55,
+    "灵品": 0.30,
+    "天品": 0.12,
+    "帝品": 0.03,
+}
+
+# 基准测试使用的品级分布
+RARITY_MIXES = {
+    "default": DEFAULT_RARITY_MIX,
+    "uniform": {"凡品": 0.25, "灵品": 0.25, "天品": 0.25, "帝品": 0.25},
+    "premium": {"凡品": 0.05, "灵品": 0.15, "天品": 0.40, "帝品": 0.40},
+}
+
+ITEM_TYPES = ["武器", "防具", "丹药", "物品", "功能丹"]
+
+NAME_PARTS = ["流云", "青霜", "玄冥", "紫电", "赤霄", "太虚", "九转", "凝神", "破境", "无极"]
+NAME_SUFFIXES = ["琴", "剑", "甲", "丹", "符", "珠", "袍", "鼎", "印", "扇"]
+
+
+def iter_shop_lines(
+    item_count: int,
+    rarity_mix: Optional[Dict[str, float]] = None,
+    seed: int = 42,
+) -> Iterator[str]:
+    """逐行生成商店文本（不在内存中构造完整文本）"""
+    rng = random.Random(seed)
+    rarity_mix = rarity_mix or DEFAULT_RARITY_MIX
+    rarities = list(rarity_mix)
+    weights = [rarity_mix[r] for r in rarities]
+
+    yield "=== 修仙商店 ==="
+    for position in range(1, item_count + 1):
+        rarity = rng.choices(rarities, weights)[0]
+        name = rng.choice(NAME_PARTS) + rng.choice(NAME_SUFFIXES)
+        item_type = rng.choice(ITEM_TYPES)
+        original_price = rng.randint(50, 5000)
+
+        if rng.random() < 0.7:
+            discount = rng.randint(1, 30)
+            price = original_price * (100 - discount) // 100
+            discount_str = f"{discount}%折"
+        else:
+            markup = rng.randint(1, 20)
+            price = original_price * (100 + markup) // 100
+            discount_str = f"+{markup}%"
+
+        yield f"{position}. [{rarity}] {name} ({item_type}) [{discount_str}]"
+        yield f"   价格: {price} 灵石 (原价: {original_price})"
+    yield ""
+    yield "下次刷新时间: 2026-01-01 12:00:00"
+    yield "提示: 使用【购买 物品名】购买物品"
+
+
+def generate_shop_text(
+    item_count: int,
+    rarity_mix: Optional[Dict[str, float]] = None,
+    seed: int = 42,
+) -> str:
+    """生成完整的商店文本"""
+    return "\n".join(iter_shop_lines(item_count, rarity_mix, seed))
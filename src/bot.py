@@ -1,7 +1,11 @@
+import asyncio
 import logging
 import os
+import random
+import signal
 import sys
 import time
+from typing import TYPE_CHECKING, Optional
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -19,10 +23,29 @@ if project_root not in sys.path:
 
 from src.utils.config import config
 from src.utils.logger import setup_logging
-from src.database.models import Database
+from src.database.models import AsyncDatabase
+from src.handlers.context import (
+    DB_KEY, LOG_WRITER_KEY, CORRELATOR_KEY, OUTBOX_KEY, SHOP_CACHE_KEY, CALLBACK_REGISTRY_KEY, DEAL_SETTINGS_KEY, BotData
+)
+from src.handlers.forward_handler import handle_game_bot_response
+from src.services.correlation import CommandCorrelator
+from src.services.outbox import OutboundScheduler
+from src.services.log_writer import OperationLogWriter
+from src.services.metrics import instrument_engine, instrument_handler, registry, stats_collector
+from src.services.telegram_request import InstrumentedRequest
+from src.services.shop_cache import ShopCache
+from src.services.callback_registry import CallbackRegistry
+from src.services.deals import DealSettings
+from src.utils.startup import startup_profile
 from src.handlers.start_handler import start_command, button_callback
 from src.handlers.shop_handler import shop_input, shop_view, shop_buy, parse_shop_input
-from src.handlers.command_handler import send_command_to_game_bot
+
+# 可选组件（HTTP 服务、会话持久化、更新处理器、数据清理）只在对应配置开启时导入
+if TYPE_CHECKING:
+    from src.services.maintenance import MaintenanceService
+    from src.services.persistence import DatabasePersistence
+    from src.services.update_processor import UserOrderedUpdateProcessor
+    from src.web.server import WebServer
 
 logger = logging.getLogger(__name__)
 
@@ -30,58 +53,353 @@ logger = logging.getLogger(__name__)
 class XianxiaBot:
     """修仙游戏助手 Bot"""
 
-    def __init__(self, max_retries: int = 30, retry_delay: int = 2):
-        setup_logging()
-        
+    def __init__(self, max_retries: int = 30, retry_delay: float = 0.5, max_retry_delay: float = 10):
+        # 日志系统由入口（main.py）配置
         self.bot_token = config.bot_token
         self.user_id = config.user_id
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        
+        # 数据库初始化任务（与 Telegram 初始化并行，在 post_init 中等待完成）
+        self._db_ready: Optional[asyncio.Task] = None
+        self._loop_started = time.perf_counter()
+        
+        # 进程内唯一的数据库实例，所有处理器通过 bot_data 共享同一个连接池
+        self.db = AsyncDatabase(config.db_url, config.db_pool_options)
+        instrument_engine(self.db.engine.sync_engine)
+        
+        # 操作日志批量写入器（在 post_init 中启动）
+        self.log_writer = OperationLogWriter(
+            self.db,
+            batch_size=config.get("database.log_batch_size", 100),
+            flush_interval=config.get("database.log_flush_ms", 500) / 1000,
+            max_queue_size=config.get("database.log_queue_size", 10000)
+        )
+        
+        # 会话状态（user_data 等）保存在数据库中，重启后不丢失
+        self.persistence: Optional["DatabasePersistence"] = None
+        if config.get("database.persistence", True):
+            from src.services.persistence import DatabasePersistence
+            
+            self.persistence = DatabasePersistence(
+                self.db,
+                update_interval=config.get("database.persistence_interval", 10),
+                ready=self._wait_database
+            )
+        
+        # 转发指令与游戏Bot回复的关联
+        self.correlator = CommandCorrelator(default_timeout=config.get("telegram.command_timeout", 30))
+        
+        # 用户最新商店的缓存与购买按钮的回调数据登记表
+        self.shop_cache = ShopCache(max_size=config.get("shop.cache_size", 1024))
+        self.callback_registry = CallbackRegistry(
+            max_size=config.get("shop.callback_registry_size", 10000),
+            ttl=config.get("shop.callback_ttl_hours", 24) * 3600
+        )
+        
+        # 捡漏判定参数（保存快照时传给 ShopService，配置重新加载时重建）
+        self.deal_settings = DealSettings.from_config(config.snapshot)
+        
+        # 限流发送队列（需要 Bot 实例，在 run 中创建）
+        self.outbox: OutboundScheduler = None
+        
+        # 运行模式: polling（长轮询）/ webhook
+        self.mode = config.get("telegram.mode", "polling")
+        
+        # HTTP 服务（webhook、Web 页面共用，在 build_application 中创建）
+        self.web: Optional["WebServer"] = None
         
-        # 尝试连接数据库，如果失败则重试
-        self.db = self._init_database(max_retries, retry_delay)
+        # 更新处理器（telegram.concurrent_updates > 1 时在 build_application 中创建）
+        self.update_processor: Optional["UserOrderedUpdateProcessor"] = None
+        
+        # 数据保留与清理（定时清理和操作日志分区都关闭时不创建）
+        self.maintenance: Optional["MaintenanceService"] = None
+        partition_operation_logs = config.get("database.log_partitioning", False)
+        if config.get("scheduler.maintenance_interval", 60) or partition_operation_logs:
+            from src.services.maintenance import MaintenanceService
+            
+            self.maintenance = MaintenanceService(
+                self.db,
+                history_days=config.get("shop.history_days", 30),
+                max_snapshots=config.get("shop.max_snapshots", 100),
+                log_retention_days=config.get("database.log_retention_days", 30),
+                chunk_size=config.get("scheduler.maintenance_chunk_size", 1000),
+                partition_operation_logs=partition_operation_logs
+            )
         
         logger.info("Bot 初始化完成")
 
-    def _init_database(self, max_retries: int, retry_delay: int) -> Database:
-        """初始化数据库，带重试机制"""
-        db_url = config.db_url
+    def _retry_backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间：指数增长（上限 max_retry_delay），加随机抖动
+
+        取 [delay/2, delay] 之间的随机值，多个实例同时重启时不会同时重连。
+        """
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _init_database(self) -> AsyncDatabase:
+        """初始化数据库，带重试机制（指数退避）"""
+        max_retries = self.max_retries
         
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"尝试连接数据库... ({attempt + 1}/{max_retries})")
-                db = Database(db_url)
-                db.init_db()
-                logger.info("✅ 数据库初始化成功")
-                return db
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    logger.warning(f"数据库连接失败，将在 {retry_delay} 秒后重试: {str(e)[:100]}")
-                    time.sleep(retry_delay)
-                else:
-                    logger.error(f"数据库连接失败，已达到最大重试次数: {e}")
-                    raise
+        with startup_profile.phase("database.init"):
+            for attempt in range(max_retries):
+                try:
+                    logger.info("尝试连接数据库... (%s/%s)", attempt + 1, max_retries)
+                    await self.db.init_db()
+                    logger.info("✅ 数据库初始化成功")
+                    return self.db
+                except Exception as e:
+                    if attempt < max_retries - 1:
+                        retry_delay = self._retry_backoff(attempt)
+                        logger.warning("数据库连接失败，将在 %.1f 秒后重试: %s", retry_delay, str(e)[:100])
+                        await asyncio.sleep(retry_delay)
+                    else:
+                        logger.error("数据库连接失败，已达到最大重试次数: %s", e)
+                        raise
 
-    def run(self):
-        """运行 Bot"""
-        logger.info("正在启动 Bot...")
+    def _start_database_init(self):
+        """在当前事件循环中开始初始化数据库（不等待完成）"""
+        if self._db_ready is None:
+            self._db_ready = asyncio.get_event_loop().create_task(self._init_database(), name="database-init")
+
+    async def _wait_database(self):
+        """等待数据库初始化完成（尚未开始时先开始）"""
+        self._start_database_init()
+        await self._db_ready
+
+    def _share_resources(self, app: Application):
+        """把共享资源放入 bot_data，供处理器通过 handlers.context 获取"""
+        app.bot_data[DB_KEY] = self.db
+        app.bot_data[LOG_WRITER_KEY] = self.log_writer
+        app.bot_data[CORRELATOR_KEY] = self.correlator
+        app.bot_data[OUTBOX_KEY] = self.outbox
+        app.bot_data[SHOP_CACHE_KEY] = self.shop_cache
+        app.bot_data[CALLBACK_REGISTRY_KEY] = self.callback_registry
+        app.bot_data[DEAL_SETTINGS_KEY] = self.deal_settings
+
+    async def _post_init(self, app: Application):
+        """Application 启动后的初始化（与处理器运行在同一个事件循环中）
+
+        数据库初始化在 Application.initialize（连接 Telegram）之前就已开始，这里只等待它完成。
+        """
+        # run_polling / _run_webhook 在调用 post_init 前先完成 Application.initialize
+        startup_profile.record("telegram.initialize", self._loop_started)
+        with startup_profile.phase("post_init.wait_database"):
+            await self._wait_database()
+        # Application.initialize 会用持久化中读取的 bot_data 替换 app.bot_data，因此在这里注入
+        self._share_resources(app)
+        with startup_profile.phase("post_init.services"):
+            if self.maintenance:
+                await self.maintenance.ensure_log_partitions()
+            await self.log_writer.start()
+            await self.outbox.start()
+            if self.web:
+                await self.web.start()
+        if startup_profile.enabled:
+            print(startup_profile.report(), flush=True)
+
+    async def _post_shutdown(self, app: Application):
+        """Application 停止后释放资源"""
+        if self.web:
+            await self.web.stop()
+        await self.outbox.stop()
+        await self.log_writer.stop()
+        await self.db.close()
+        logger.info("数据库连接池已关闭")
+
+    async def _run_maintenance(self, context: ContextTypes.DEFAULT_TYPE):
+        """定时任务：清理过期数据"""
+        try:
+            await self.maintenance.ensure_log_partitions()
+            await self.maintenance.run()
+        except Exception as e:
+            logger.error("数据清理失败: %s", e, exc_info=True)
+
+    async def _reload_config(self, context: ContextTypes.DEFAULT_TYPE):
+        """定时任务：配置文件变化时重新加载"""
+        if config.reload_if_changed():
+            self.deal_settings = DealSettings.from_config(config.snapshot)
+            context.bot_data[DEAL_SETTINGS_KEY] = self.deal_settings
+
+    def _schedule_jobs(self, app: Application):
+        """注册定时任务"""
+        if app.job_queue is not None:
+            reload_interval = config.get("app.config_reload_interval", 5)
+            if reload_interval:
+                app.job_queue.run_repeating(
+                    self._reload_config, interval=reload_interval, first=reload_interval, name="config-reload"
+                )
         
+        interval = config.get("scheduler.maintenance_interval", 60)
+        if not interval:
+            logger.info("数据清理任务已禁用")
+            return
+        if app.job_queue is None:
+            logger.warning("JobQueue 不可用（未安装 APScheduler），数据清理任务未启动")
+            return
+        app.job_queue.run_repeating(self._run_maintenance, interval=interval * 60, first=60, name="maintenance")
+        logger.info("数据清理任务已注册，每 %s 分钟执行一次", interval)
+
+    def build_application(self) -> Application:
+        """创建 Application 并注册所有处理器"""
         # 创建应用
-        app = Application.builder().token(self.bot_token).build()
+        builder = (
+            Application.builder()
+            .token(self.bot_token)
+            # 记录每个 Bot API 方法的耗时和失败数（连接池大小与默认值相同）
+            .request(InstrumentedRequest(connection_pool_size=256))
+            .get_updates_request(InstrumentedRequest())
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            # bot_data 持久化时跳过共享资源
+            .context_types(ContextTypes(bot_data=BotData))
+        )
+        if self.persistence:
+            builder = builder.persistence(self.persistence)
+        # 不同用户的更新并行处理，同一用户的更新串行（保证 user_data 中的状态一致）
+        concurrent_updates = config.get("telegram.concurrent_updates", 32)
+        if concurrent_updates > 1:
+            from src.services.update_processor import UserOrderedUpdateProcessor
+            
+            self.update_processor = UserOrderedUpdateProcessor(
+                concurrent_updates,
+                # 游戏Bot的回复只用于匹配等待中的指令，不需要排队
+                unordered=lambda user_id: user_id == config.snapshot.game_bot_user_id
+            )
+            builder = builder.concurrent_updates(self.update_processor)
+        # 自建 Bot API 服务器或压测用的本地模拟服务
+        base_url = config.get("telegram.base_url")
+        if base_url:
+            builder = builder.base_url(base_url)
+        app = builder.build()
+        
+        self.outbox = OutboundScheduler(
+            app.bot,
+            global_rate=config.get("telegram.global_rate_limit", 30),
+            chat_rate=config.get("telegram.chat_rate_limit", 1),
+            chat_burst=config.get("telegram.chat_burst", 3)
+        )
+        
+        self._register_stats_collectors()
         
-        # 添加命令处理器
-        app.add_handler(CommandHandler("start", start_command))
+        # HTTP 服务（aiohttp 只在需要时导入）
+        enable_metrics = config.get("features.enable_metrics", False)
+        if self.mode == "webhook" or enable_metrics or config.get("features.enable_web", False):
+            from src.web.server import WebServer, create_metrics_handler, create_webhook_handler
+            
+            self.web = WebServer(
+                host=config.get("webhook.listen", "0.0.0.0"),
+                port=config.get("features.web_port", 8080)
+            )
+            self.web.add_index_page()
+            if enable_metrics:
+                self.web.add_route("GET", config.get("features.metrics_path", "/metrics"), create_metrics_handler())
+            if self.mode == "webhook":
+                self.web.add_route(
+                    "POST",
+                    config.get("webhook.path", "/telegram/webhook"),
+                    create_webhook_handler(app, config.get("webhook.secret_token"))
+                )
+        
+        # 注册定时任务
+        self._schedule_jobs(app)
+        
+        # 添加命令处理器（instrument_handler 记录各处理器的耗时）
+        app.add_handler(CommandHandler("start", instrument_handler("start", start_command)))
         
         # 添加回调查询处理器（菜单按钮）
-        app.add_handler(CallbackQueryHandler(button_callback))
+        app.add_handler(CallbackQueryHandler(instrument_handler("button_callback", button_callback)))
         
         # 添加消息处理器（用于处理普通消息）
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, instrument_handler("message", handle_message)))
+        
+        return app
+
+    def _register_stats_collectors(self):
+        """把各组件的 stats() 导出为指标（抓取时读取；按名称注册，重复调用只替换不重复导出）"""
+        registry.add_collector(stats_collector("outbox", self.outbox.stats, "发送队列"))
+        registry.add_collector(stats_collector("operation_log_writer", self.log_writer.stats, "操作日志写入器"))
+        registry.add_collector(stats_collector("command_correlator", self.correlator.stats, "转发指令关联器"))
+        registry.add_collector(stats_collector("shop_cache", self.shop_cache.stats, "商店缓存"))
+        registry.add_collector(stats_collector("callback_registry", self.callback_registry.stats, "按钮回调数据登记表"))
+        if self.persistence:
+            registry.add_collector(stats_collector("persistence", self.persistence.stats, "会话状态持久化"))
+        if self.update_processor:
+            registry.add_collector(stats_collector("update_processor", self.update_processor.stats, "更新处理器"))
+
+    def run(self):
+        """运行 Bot"""
+        logger.info("正在启动 Bot（%s 模式）...", self.mode)
+        
+        with startup_profile.phase("build_application"):
+            app = self.build_application()
+        
+        # 数据库初始化任务先排入事件循环，与 Application.initialize（连接 Telegram）并行执行
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._start_database_init()
+        self._loop_started = time.perf_counter()
         
         # 启动 Bot
-        app.run_polling()
+        if self.mode == "webhook":
+            try:
+                loop.run_until_complete(self._run_webhook(app))
+            finally:
+                loop.close()
+        else:
+            app.run_polling()
+
+    async def _run_webhook(self, app: Application):
+        """以 webhook 模式运行：更新由 HTTP 服务接收后放入 Application 的更新队列"""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+        
+        await self.start_application(app)
+        
+        try:
+            public_url = config.get("webhook.url")
+            if config.get("webhook.register", True) and public_url:
+                webhook_url = public_url.rstrip("/") + config.get("webhook.path", "/telegram/webhook")
+                await app.bot.set_webhook(
+                    url=webhook_url,
+                    secret_token=config.get("webhook.secret_token"),
+                    allowed_updates=Update.ALL_TYPES
+                )
+                logger.info("Webhook 已注册: %s", webhook_url)
+            else:
+                logger.info("未注册 webhook（webhook.register 关闭或未配置 webhook.url），仅接收本地 POST 的更新")
+            
+            await stop_event.wait()
+        finally:
+            await self.stop_application(app)
+
+    async def start_application(self, app: Application):
+        """在当前事件循环中启动 Application（run_polling 之外使用，如 webhook 模式和压测）
+
+        不会开始接收更新：webhook 模式由 HTTP 服务投递，需要长轮询时再调用 app.updater.start_polling。
+        """
+        await app.initialize()
+        # run_polling 之外 post_init / post_shutdown 需要手动调用
+        await self._post_init(app)
+        await app.start()
+
+    async def stop_application(self, app: Application):
+        """停止 start_application 启动的 Application 并释放资源"""
+        await app.stop()
+        await app.shutdown()
+        await self._post_shutdown(app)
 
     def shutdown(self):
-        """关闭 Bot"""
-        self.db.close()
+        """关闭 Bot
+
+        数据库连接池在 Application 的 post_shutdown 中关闭。
+        """
         logger.info("Bot 已关闭")
 
 
@@ -90,33 +408,30 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     message_text = update.message.text
     
-    logger.info(f"收到来自 {user_id} 的消息: {message_text}")
+    logger.info("收到来自 %s 的消息: %s", user_id, message_text)
+    
+    # 用户正在输入商店内容
+    if context.user_data.get('awaiting_shop_input'):
+        await parse_shop_input(update, context)
+        return
     
     # 检查这是否是来自游戏Bot的回复
-    # 如果消息来自游戏Bot，则转发给正在等待的用户
+    # 如果消息来自游戏Bot，则交给关联器匹配正在等待的指令
     try:
-        from src.utils.config import ConfigManager
-        config_manager = ConfigManager()
-        game_bot_user_id = config_manager.get("game_bot_user_id")
+        game_bot_user_id = config.snapshot.game_bot_user_id
         
-        # 如果这是来自游戏Bot的消息，且有用户在等待回复
         if game_bot_user_id and user_id == game_bot_user_id:
-            # 获取用户信息（从update的chat中）
-            if update.message.forward_from or update.message.text:
-                # 这条消息来自游戏Bot
-                logger.info(f"收到来自游戏Bot的回复: {message_text}")
-                
-                # 转发给等待的用户（需要在context中保存用户ID）
-                # 这里的逻辑需要更复杂的会话管理
-                # 暂时只记录日志
-                pass
+            logger.info("收到来自游戏Bot的回复: %s", message_text)
+            await handle_game_bot_response(update, context)
+            return
     except Exception as e:
-        logger.error(f"处理来自游戏Bot的消息时出错: {e}")
+        logger.error("处理来自游戏Bot的消息时出错: %s", e)
     
     # 这里可以添加更多的消息处理逻辑
 
 
 if __name__ == "__main__":
+    setup_logging()
     bot = XianxiaBot()
     try:
         bot.run()
@@ -124,5 +439,5 @@ if __name__ == "__main__":
         logger.info("收到中断信号，正在关闭...")
         bot.shutdown()
     except Exception as e:
-        logger.error(f"Bot 运行出错: {e}", exc_info=True)
+        logger.error("Bot 运行出错: %s", e, exc_info=True)
         bot.shutdown()
@@ -1,7 +1,11 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, Boolean, JSON, Index
+from sqlalchemy import create_engine, inspect, text, Column, Integer, BigInteger, String, Text, DateTime, Float, Boolean, JSON, Index, LargeBinary
+from sqlalchemy.engine import Connection, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from datetime import datetime
+from typing import Any, Dict, Optional
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
@@ -65,6 +69,10 @@ class ShopItem(Base):
 
     __table_args__ = (
         Index('idx_snapshot_position', 'snapshot_id', 'position'),
+        # 按物品名查询历史价格
+        Index('idx_item_name_created', 'name', 'created_at'),
+        # 按品级筛选并按价格排序
+        Index('idx_item_rarity_price', 'rarity', 'current_price'),
     )
 
 
@@ -76,18 +84,37 @@ class ShopSnapshot(Base):
     
     # 快照信息
     user_id = Column(Integer, nullable=False, index=True)
-    snapshot_data = Column(JSON, nullable=False)  # 完整的商店数据
+    snapshot_data = Column(JSON, nullable=False)  # 商店数据（物品列表，不含原始文本）
+    content_hash = Column(String(64))  # 规范化物品列表的 SHA-256，用于去重
+    raw_text_id = Column(Integer)  # 原始文本（shop_raw_texts.id）
     
     # 刷新信息
     refresh_time = Column(DateTime)  # 下次刷新时间
     
     created_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime, default=datetime.utcnow)  # 最近一次粘贴相同内容的时间
 
     __table_args__ = (
         Index('idx_user_snapshot', 'user_id', 'created_at'),
+        Index('idx_user_content', 'user_id', 'content_hash'),
+        Index('idx_user_last_seen', 'user_id', 'last_seen_at'),
+        # 清理孤立的原始文本时使用
+        Index('idx_snapshot_raw_text', 'raw_text_id'),
     )
 
 
+class ShopRawText(Base):
+    """商店原始文本（按内容哈希去重，zlib 压缩存储）"""
+    __tablename__ = "shop_raw_texts"
+
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), unique=True, nullable=False)  # 原始文本的 SHA-256
+    data = Column(LargeBinary, nullable=False)  # zlib 压缩后的 UTF-8 文本
+    size = Column(Integer)  # 压缩前的字节数
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class OperationLog(Base):
     """操作日志"""
     __tablename__ = "operation_logs"
@@ -112,26 +139,174 @@ class OperationLog(Base):
     )
 
 
+class ItemPriceStats(Base):
+    """物品历史价格统计（按 物品名称 + 品级，保存新快照时在同一事务中增量更新）
+
+    方差用 Welford 算法维护：m2 为与均值之差的平方和，样本方差 = m2 / (count - 1)。
+    """
+    __tablename__ = "item_price_stats"
+
+    name = Column(String(255), primary_key=True)
+    rarity = Column(String(50), primary_key=True)  # 无品级时为空字符串
+    count = Column(Integer, nullable=False, default=0)
+    min_price = Column(Integer)
+    max_price = Column(Integer)
+    mean = Column(Float, nullable=False, default=0)
+    m2 = Column(Float, nullable=False, default=0)
+    last_seen_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def variance(self) -> float:
+        """样本方差（少于两次记录时为 0）"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self) -> float:
+        return self.variance ** 0.5
+
+
+class ItemPriceSketch(Base):
+    """物品历史价格分布（t-digest，用于判断当前价格在历史中的百分位，见 src/services/deals.py）"""
+    __tablename__ = "item_price_sketches"
+
+    name = Column(String(255), primary_key=True)
+    rarity = Column(String(50), primary_key=True)  # 无品级时为空字符串
+    count = Column(Integer, nullable=False, default=0)
+    digest = Column(JSON, nullable=False)  # TDigest.to_dict()
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ConversationState(Base):
+    """会话状态（Application 的 user_data / chat_data / bot_data，由 DatabasePersistence 读写）"""
+    __tablename__ = "conversation_state"
+
+    kind = Column(String(10), primary_key=True)  # user / chat / bot
+    key = Column(BigInteger, primary_key=True)  # user_id / chat_id（bot_data 为 0）
+    data = Column(JSON, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SchemaInfo(Base):
+    """数据库结构信息（记录已应用的表结构指纹，结构未变化时启动跳过建表检查）"""
+    __tablename__ = "schema_info"
+
+    key = Column(String(50), primary_key=True)
+    value = Column(String(255))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# 新增列后需要执行的数据回填
+COLUMN_BACKFILLS = {
+    ("shop_snapshots", "last_seen_at"): "UPDATE shop_snapshots SET last_seen_at = created_at WHERE last_seen_at IS NULL",
+}
+
+
+def _upgrade_schema(connection: Connection):
+    """补建已存在的表上缺失的列和索引
+
+    create_all 只在建表时创建列和索引，后续版本新增的（可为空的）列和索引需要在这里补建。
+    """
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            logger.info("已添加列: %s.%s", table.name, column.name)
+            backfill = COLUMN_BACKFILLS.get((table.name, column.name))
+            if backfill:
+                connection.execute(text(backfill))
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(connection)
+                logger.info("已创建索引: %s", index.name)
+
+
+def schema_fingerprint() -> str:
+    """当前模型定义的表结构指纹（表、列、索引）"""
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{column.name}:{column.type}" for column in table.columns)
+        parts.extend(sorted(index.name for index in table.indexes))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+SCHEMA_FINGERPRINT = schema_fingerprint()
+
+
+def _stored_fingerprint(connection: Connection) -> Optional[str]:
+    if not inspect(connection).has_table(SchemaInfo.__tablename__):
+        return None
+    return connection.execute(
+        text("SELECT value FROM schema_info WHERE key = 'fingerprint'")
+    ).scalar()
+
+
+def _create_schema(connection: Connection) -> bool:
+    """创建所有表并补建缺失的列和索引
+
+    数据库中记录的结构指纹与当前模型一致时直接跳过（正常重启只需两次查询）。
+
+    Returns:
+        是否执行了建表/升级
+    """
+    if _stored_fingerprint(connection) == SCHEMA_FINGERPRINT:
+        return False
+
+    Base.metadata.create_all(connection)
+    _upgrade_schema(connection)
+    connection.execute(text("DELETE FROM schema_info WHERE key = 'fingerprint'"))
+    connection.execute(
+        SchemaInfo.__table__.insert().values(key="fingerprint", value=SCHEMA_FINGERPRINT, updated_at=datetime.utcnow())
+    )
+    return True
+
+
+# 默认连接池参数（可通过配置文件 database 段覆盖）
+DEFAULT_POOL_OPTIONS = {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_recycle": 3600,
+    "pool_pre_ping": True,
+}
+
+
+def _engine_options(db_url: str, pool_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """根据数据库类型生成引擎参数
+
+    SQLite（测试用）使用 SQLAlchemy 默认的 StaticPool/NullPool，不接受连接池参数。
+    """
+    if make_url(db_url).get_backend_name() == "sqlite":
+        return {"echo": False}
+    options = dict(DEFAULT_POOL_OPTIONS)
+    options.update({k: v for k, v in (pool_options or {}).items() if v is not None})
+    options["echo"] = False
+    return options
+
+
 class Database:
     """数据库管理"""
 
-    def __init__(self, db_url: str):
-        self.engine = create_engine(
-            db_url,
-            pool_size=10,
-            max_overflow=20,
-            pool_recycle=3600,
-            echo=False
-        )
+    def __init__(self, db_url: str, pool_options: Optional[Dict[str, Any]] = None):
+        self.engine = create_engine(db_url, **_engine_options(db_url, pool_options))
         self.SessionLocal = sessionmaker(bind=self.engine)
 
     def init_db(self):
         """初始化数据库"""
         try:
-            Base.metadata.create_all(self.engine)
-            logger.info("数据库初始化成功")
+            with self.engine.begin() as conn:
+                created = _create_schema(conn)
+            logger.info("数据库初始化成功" if created else "数据库结构无变化，跳过建表")
         except Exception as e:
-            logger.error(f"数据库初始化失败: {e}")
+            logger.error("数据库初始化失败: %s", e)
             raise
 
     def get_session(self) -> Session:
@@ -141,3 +316,70 @@ class Database:
     def close(self):
         """关闭数据库连接"""
         self.engine.dispose()
+
+
+# 同步驱动 -> 异步驱动 的映射
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(db_url: str) -> str:
+    """将同步数据库 URL 转换为对应的异步驱动 URL
+
+    如 postgresql://... -> postgresql+asyncpg://...，
+    sqlite:///test.db -> sqlite+aiosqlite:///test.db。
+    已经指定了异步驱动的 URL 原样返回。
+    """
+    url = make_url(db_url)
+    backend = url.get_backend_name()
+    if url.get_driver_name() in ("asyncpg", "aiosqlite"):
+        return db_url
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"不支持的异步数据库类型: {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def dialect_insert(dialect_name: str):
+    """返回对应数据库的 insert 构造函数（支持 on_conflict_do_update / on_conflict_do_nothing）"""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"不支持 ON CONFLICT 的数据库类型: {dialect_name}")
+    return insert
+
+
+class AsyncDatabase:
+    """异步数据库管理（基于 SQLAlchemy asyncio）
+
+    在 Bot 的异步处理器中使用，避免数据库 I/O 阻塞事件循环。
+    PostgreSQL 使用 asyncpg 驱动，SQLite（测试用）使用 aiosqlite 驱动。
+    整个进程只应创建一个实例（由 XianxiaBot 持有），所有处理器共享同一个连接池。
+    """
+
+    def __init__(self, db_url: str, pool_options: Optional[Dict[str, Any]] = None):
+        async_url = to_async_url(db_url)
+        self.engine = create_async_engine(async_url, **_engine_options(async_url, pool_options))
+        # expire_on_commit=False: 提交后仍可访问对象属性，无需再次查询
+        self.SessionLocal = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    async def init_db(self):
+        """初始化数据库"""
+        try:
+            async with self.engine.begin() as conn:
+                created = await conn.run_sync(_create_schema)
+            logger.info("数据库初始化成功" if created else "数据库结构无变化，跳过建表")
+        except Exception as e:
+            logger.error("数据库初始化失败: %s", e)
+            raise
+
+    def get_session(self) -> AsyncSession:
+        """获取数据库会话（请使用 async with）"""
+        return self.SessionLocal()
+
+    async def close(self):
+        """关闭数据库连接"""
+        await self.engine.dispose()
@@ -9,6 +9,8 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
+from src.handlers.context import get_outbox
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,5 +20,5 @@ async def send_command_to_game_bot(update: Update, context: ContextTypes.DEFAULT
     这个函数暂时只是显示指令，实际的转发可能需要通过其他方式实现
     """
     message = f"📤 指令已准备:\n【{command}】\n\n请复制上述指令并发送给游戏 Bot"
-    await update.message.reply_text(message)
-    logger.info(f"用户 {update.effective_user.id} 执行命令: {command}")
+    get_outbox(context).send_message(update.effective_chat.id, message)
+    logger.info("用户 %s 执行命令: %s", update.effective_user.id, command)
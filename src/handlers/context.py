@@ -0,0 +1,89 @@
+import copy
+import os
+import sys
+from telegram.ext import ContextTypes
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.database.models import AsyncDatabase
+from src.services.log_writer import OperationLogWriter
+from src.services.correlation import CommandCorrelator
+from src.services.outbox import OutboundScheduler
+from src.services.callback_registry import CallbackRegistry
+from src.services.shop_cache import ShopCache
+from src.services.deals import DealSettings
+
+# Application.bot_data 中保存共享数据库实例的键
+DB_KEY = "db"
+
+# Application.bot_data 中保存操作日志写入器的键
+LOG_WRITER_KEY = "log_writer"
+
+# Application.bot_data 中保存指令关联器的键
+CORRELATOR_KEY = "correlator"
+
+# Application.bot_data 中保存发送队列的键
+OUTBOX_KEY = "outbox"
+
+# Application.bot_data 中保存商店缓存的键
+SHOP_CACHE_KEY = "shop_cache"
+
+# Application.bot_data 中保存按钮回调数据登记表的键
+CALLBACK_REGISTRY_KEY = "callback_registry"
+
+# Application.bot_data 中保存捡漏判定参数的键（配置重新加载时替换）
+DEAL_SETTINGS_KEY = "deal_settings"
+
+# 进程内共享的资源（不可序列化，不写入持久化）
+RESOURCE_KEYS = frozenset({
+    DB_KEY, LOG_WRITER_KEY, CORRELATOR_KEY, OUTBOX_KEY, SHOP_CACHE_KEY, CALLBACK_REGISTRY_KEY, DEAL_SETTINGS_KEY
+})
+
+
+class BotData(dict):
+    """Application.bot_data 的类型
+
+    Application 在交给持久化之前会 deepcopy bot_data，这里跳过共享资源（数据库、发送队列等），
+    只复制可序列化的状态。
+    """
+
+    def __deepcopy__(self, memo):
+        return {k: copy.deepcopy(v, memo) for k, v in self.items() if k not in RESOURCE_KEYS}
+
+
+def get_db(context: ContextTypes.DEFAULT_TYPE) -> AsyncDatabase:
+    """获取进程内共享的数据库实例（由 XianxiaBot 在启动时注入）"""
+    return context.bot_data[DB_KEY]
+
+
+def get_log_writer(context: ContextTypes.DEFAULT_TYPE) -> OperationLogWriter:
+    """获取进程内共享的操作日志写入器"""
+    return context.bot_data[LOG_WRITER_KEY]
+
+
+def get_correlator(context: ContextTypes.DEFAULT_TYPE) -> CommandCorrelator:
+    """获取转发指令与游戏Bot回复的关联器"""
+    return context.bot_data[CORRELATOR_KEY]
+
+
+def get_outbox(context: ContextTypes.DEFAULT_TYPE) -> OutboundScheduler:
+    """获取限流发送队列"""
+    return context.bot_data[OUTBOX_KEY]
+
+
+def get_shop_cache(context: ContextTypes.DEFAULT_TYPE) -> ShopCache:
+    """获取用户最新商店的缓存"""
+    return context.bot_data[SHOP_CACHE_KEY]
+
+
+def get_callback_registry(context: ContextTypes.DEFAULT_TYPE) -> CallbackRegistry:
+    """获取按钮回调数据登记表"""
+    return context.bot_data[CALLBACK_REGISTRY_KEY]
+
+
+def get_deal_settings(context: ContextTypes.DEFAULT_TYPE) -> DealSettings:
+    """获取捡漏判定参数"""
+    return context.bot_data[DEAL_SETTINGS_KEY]
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import sys
@@ -9,17 +10,19 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from src.utils.config import ConfigManager
+from src.utils.config import config
+from src.handlers.context import get_log_writer, get_correlator, get_outbox
+from src.services.correlation import CommandCorrelator, PendingCommand
 
 logger = logging.getLogger(__name__)
 
+# Telegram 单条消息的最大长度
+MAX_MESSAGE_LENGTH = 4096
+
 
 class ForwardHandler:
     """处理指令转发和结果收集"""
     
-    # 存储待转发的指令和用户信息
-    pending_commands = {}  # {user_id: {"command": "xxx", "timestamp": xxx}}
-    
     @staticmethod
     async def send_command_and_wait(
         update: Update, 
@@ -35,38 +38,44 @@ class ForwardHandler:
             command: 要发送的指令
         """
         try:
-            config = ConfigManager()
+            settings = config.snapshot
             user_id = update.effective_user.id
-            game_bot_username = config.get("game_bot_username", "美奈")
-            game_bot_user_id = config.get("game_bot_user_id")
+            game_bot_username = settings.game_bot_username
+            game_bot_user_id = settings.game_bot_user_id
             
-            # 显示加载状态
-            loading_msg = await update.callback_query.edit_message_text(
+            # 所有消息都经由发送队列：限流、合并对同一消息的连续编辑
+            outbox = get_outbox(context)
+            chat_id = update.effective_chat.id
+            message_id = update.callback_query.message.message_id
+            
+            # 显示加载状态（不等待发送完成）
+            outbox.edit_message_text(
+                chat_id,
+                message_id,
                 text=f"⏳ 正在执行指令: 【{command}】\n\n"
-                     f"向 @{game_bot_username} 发送请求中...",
-                parse_mode=None
+                     f"向 @{game_bot_username} 发送请求中..."
             )
             
             # 保存用户信息和消息ID用于接收回复
             context.user_data['last_command'] = command
-            context.user_data['last_message_id'] = loading_msg.message_id
+            context.user_data['last_message_id'] = message_id
             context.user_data['awaiting_game_response'] = True
             
             # 如果有游戏Bot的user_id，尝试直接发送
             if game_bot_user_id:
+                correlator = get_correlator(context)
+                # 先注册再发送，避免回复比 send_message 返回得更早
+                pending = correlator.register(game_bot_user_id, command)
                 try:
-                    bot = context.bot
                     # 尝试向游戏Bot的私聊发送指令
-                    await bot.send_message(
-                        chat_id=game_bot_user_id,
-                        text=command
-                    )
-                    logger.info(f"已向 {game_bot_username} (ID: {game_bot_user_id}) 发送指令: {command}")
+                    sent_msg = await outbox.send_message(game_bot_user_id, command)
+                    correlator.attach_message(pending, sent_msg.message_id)
+                    logger.info("已向 %s (ID: %s) 发送指令: %s", game_bot_username, game_bot_user_id, command)
                     
                     # 更新消息提示
-                    await bot.edit_message_text(
-                        chat_id=update.effective_chat.id,
-                        message_id=loading_msg.message_id,
+                    outbox.edit_message_text(
+                        chat_id,
+                        message_id,
                         text=f"✅ 指令已发送\n\n"
                              f"📤 发送内容: 【{command}】\n\n"
                              f"正在等待 @{game_bot_username} 的回复...\n"
@@ -75,18 +84,30 @@ class ForwardHandler:
                     
                     # 记录指令用于后续匹配回复
                     context.user_data['sent_command'] = command
-                    context.user_data['awaiting_response_until'] = None  # 会在 handle_game_response 中设置
+                    
+                    # 在后台等待回复并更新消息，不阻塞当前更新的处理
+                    context.application.create_task(
+                        _deliver_response(
+                            context, correlator, pending, user_id,
+                            chat_id, message_id, game_bot_username
+                        ),
+                        update=update
+                    )
                     
                 except Exception as e:
-                    logger.error(f"无法直接发送给游戏Bot: {e}")
+                    correlator.cancel(pending)
+                    logger.error("无法直接发送给游戏Bot: %s", e)
+                    await get_log_writer(context).log(user_id, "command", command, success=False, response=str(e))
                     await _fallback_to_manual(update, context, command, game_bot_username)
             else:
                 # 没有游戏Bot ID，使用备选方案
                 await _fallback_to_manual(update, context, command, game_bot_username)
                 
         except Exception as e:
-            logger.error(f"发送指令时出错: {e}")
-            await update.callback_query.edit_message_text(
+            logger.error("发送指令时出错: %s", e)
+            get_outbox(context).edit_message_text(
+                update.effective_chat.id,
+                update.callback_query.message.message_id,
                 text=f"❌ 执行失败: {str(e)}\n\n"
                      f"请重试或手动发送指令"
             )
@@ -110,12 +131,54 @@ async def _fallback_to_manual(
         f"🔗 <a href='https://t.me/{game_bot_username}'>打开 @{game_bot_username}</a>"
     )
     
-    await update.callback_query.edit_message_text(
+    # 与加载提示走同一个发送队列，保证编辑顺序
+    get_outbox(context).edit_message_text(
+        update.effective_chat.id,
+        update.callback_query.message.message_id,
         text=message,
         parse_mode="HTML"
     )
 
 
+async def _deliver_response(
+    context: ContextTypes.DEFAULT_TYPE,
+    correlator: CommandCorrelator,
+    pending: PendingCommand,
+    user_id: int,
+    chat_id: int,
+    message_id: int,
+    game_bot_username: str
+) -> None:
+    """等待游戏Bot的回复，并把结果写入用户的"正在执行指令"消息"""
+    command = pending.command
+    try:
+        response = await correlator.wait(pending)
+        success = True
+        text = f"✅ 【{command}】执行结果:\n\n{response}"
+    except asyncio.TimeoutError:
+        response = None
+        success = False
+        text = (
+            f"⌛ 等待 @{game_bot_username} 回复超时\n\n"
+            f"📤 已发送: 【{command}】\n"
+            f"请稍后在 @{game_bot_username} 中查看结果"
+        )
+    except asyncio.CancelledError:
+        return
+    
+    context.user_data['awaiting_game_response'] = False
+    await get_log_writer(context).log(user_id, "command", command, success=success, response=response)
+    
+    try:
+        await get_outbox(context).edit_message_text(
+            chat_id,
+            message_id,
+            text=text[:MAX_MESSAGE_LENGTH]
+        )
+    except Exception as e:
+        logger.error("更新指令结果消息失败: %s", e)
+
+
 async def handle_game_bot_response(
     update: Update, 
     context: ContextTypes.DEFAULT_TYPE
@@ -123,8 +186,14 @@ async def handle_game_bot_response(
     """
     处理来自游戏Bot的回复消息
     
-    这个函数应该在处理来自 game_bot_user_id 的消息时调用
+    在 bot.handle_message 收到来自 game_bot_user_id 的消息时调用，
+    找到对应的等待中指令并完成它（结果由 _deliver_response 展示给用户）。
     """
-    # 这里的逻辑会在主handler中调用
-    # 当收到来自游戏Bot的消息时，转发给用户
-    pass
+    message = update.message
+    reply_to = message.reply_to_message.message_id if message.reply_to_message else None
+    
+    pending = get_correlator(context).resolve(update.effective_chat.id, message.text, reply_to)
+    if pending:
+        logger.info("游戏Bot回复已匹配指令: %s", pending.command)
+    else:
+        logger.info("收到游戏Bot消息，但未能匹配等待中的指令: %s", message.text[:50])
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+import logging
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.services.metrics import Counter, Histogram, LatencyHistogram, registry
+
+logger = logging.getLogger(__name__)
+
+# 精确匹配的处理器: handler(update, context)
+# 前缀匹配的处理器: handler(update, context, callback_data)
+Handler = Callable[..., Awaitable[Any]]
+
+
+@dataclass
+class Route:
+    """一条回调路由及其统计"""
+    pattern: str
+    handler: Handler
+    prefix: bool = False
+    calls: int = 0
+    errors: int = 0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
+        start = time.perf_counter()
+        try:
+            if self.prefix:
+                return await self.handler(update, context, callback_data)
+            return await self.handler(update, context)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.calls += 1
+            self.latency.observe(time.perf_counter() - start)
+
+
+class _TrieNode:
+    __slots__ = ("children", "route")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.route: Optional[Route] = None
+
+
+class CallbackRouter:
+    """按 callback_data 分发按钮回调
+
+    处理器通过装饰器注册：
+
+        @router.exact("back_main", "menu_commands")
+        async def handler(update, context): ...
+
+        @router.prefix("cmd_")
+        async def handler(update, context, callback_data): ...
+
+    精确匹配是一次字典查找，优先于前缀匹配；前缀匹配在前缀树上取最长的前缀。
+    都未匹配时交给 fallback 处理器。路由在模块导入时注册完成。
+    """
+
+    def __init__(self):
+        self._exact: Dict[str, Route] = {}
+        self._prefixes = _TrieNode()
+        self._fallback: Optional[Route] = None
+        self.unmatched = 0
+
+    def exact(self, *patterns: str) -> Callable[[Handler], Handler]:
+        """注册精确匹配的处理器（每个 callback_data 单独统计）"""
+        def decorator(handler: Handler) -> Handler:
+            for pattern in patterns:
+                if pattern in self._exact:
+                    raise ValueError(f"回调路由重复注册: {pattern}")
+                self._exact[pattern] = Route(pattern, handler)
+            return handler
+        return decorator
+
+    def prefix(self, pattern: str) -> Callable[[Handler], Handler]:
+        """注册前缀匹配的处理器，处理器额外接收完整的 callback_data"""
+        def decorator(handler: Handler) -> Handler:
+            node = self._prefixes
+            for ch in pattern:
+                node = node.children.setdefault(ch, _TrieNode())
+            if node.route is not None:
+                raise ValueError(f"回调路由重复注册: {pattern}*")
+            node.route = Route(pattern, handler, prefix=True)
+            return handler
+        return decorator
+
+    def fallback(self, handler: Handler) -> Handler:
+        """注册未匹配任何路由时的处理器: handler(update, context, callback_data)"""
+        self._fallback = Route("*", handler, prefix=True)
+        return handler
+
+    def resolve(self, callback_data: str) -> Optional[Route]:
+        """查找 callback_data 对应的路由"""
+        route = self._exact.get(callback_data)
+        if route is not None:
+            return route
+
+        node = self._prefixes
+        for ch in callback_data:
+            node = node.children.get(ch)
+            if node is None:
+                break
+            if node.route is not None:
+                route = node.route
+        return route
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> Any:
+        """分发一个 CallbackQuery 更新"""
+        callback_data = update.callback_query.data or ""
+        route = self.resolve(callback_data)
+        if route is None:
+            self.unmatched += 1
+            logger.warning("未注册的回调: %s", callback_data)
+            route = self._fallback
+            if route is None:
+                return None
+        return await route(update, context, callback_data)
+
+    def routes(self) -> List[Route]:
+        """所有已注册的路由"""
+        routes = list(self._exact.values())
+        stack = [self._prefixes]
+        while stack:
+            node = stack.pop()
+            if node.route is not None:
+                routes.append(node.route)
+            stack.extend(node.children.values())
+        if self._fallback is not None:
+            routes.append(self._fallback)
+        return routes
+
+    def _label(self, route: Route) -> str:
+        return route.pattern + ("*" if route.prefix and route is not self._fallback else "")
+
+    def collect_metrics(self) -> Iterator[Any]:
+        """导出 Prometheus 指标（抓取时调用，直接读取各路由已有的统计）"""
+        latency = Histogram("callback_route_latency_seconds", "按钮回调路由处理耗时", ["route"])
+        errors = Counter("callback_route_errors_total", "按钮回调路由抛出的异常数", ["route"])
+        unmatched = Counter("callback_route_unmatched_total", "未匹配任何路由的回调数")
+        for route in self.routes():
+            label = self._label(route)
+            latency.attach(route.latency, route=label)
+            errors.inc(route.errors, route=label)
+        unmatched.inc(self.unmatched)
+        return iter((latency, errors, unmatched))
+
+    def stats(self) -> Dict[str, Any]:
+        """各路由的调用次数、错误次数和延迟"""
+        return {
+            "unmatched": self.unmatched,
+            "routes": {
+                self._label(route): {
+                    "calls": route.calls,
+                    "errors": route.errors,
+                    "p50": route.latency.quantile(0.5),
+                    "p95": route.latency.quantile(0.95),
+                    "latency": route.latency.snapshot(),
+                }
+                for route in self.routes()
+            },
+        }
+
+
+# 按钮回调路由表（由 start_handler 在导入时注册）
+router = CallbackRouter()
+registry.add_collector(router.collect_metrics, "callback_router")
@@ -1,7 +1,11 @@
 import logging
 import os
 import sys
+import time
+from datetime import datetime
+from typing import List, Optional
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
 # 确保 src 模块可以被导入
@@ -10,13 +14,23 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from src.utils.shop_parser import ShopParser
-from src.utils.menu_helper import MenuHelper
-from src.services.db_service import ShopService, OperationService
-from src.database.models import Database
+from src.utils.menu_helper import MenuHelper, shop_buttons
+from src.utils.shop_diff import ShopDiff, diff_items
+from src.services.db_service import AsyncShopService
+from src.services.deals import Deal, format_deals
+from src.services.shop_parser import parse_shop_text
+from src.services.callback_registry import CallbackRegistry
+from src.services.shop_cache import CachedShop
+from src.handlers.context import (
+    get_callback_registry, get_db, get_deal_settings, get_log_writer, get_outbox, get_shop_cache
+)
 from src.utils.config import config
 
 logger = logging.getLogger(__name__)
 
+# user_data 中记录上一条商店消息的键（chat_id、message_id、发出时间）
+SHOP_MESSAGE_KEY = "shop_message"
+
 
 async def parse_shop_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """解析用户输入的商店内容"""
@@ -30,82 +44,179 @@ async def parse_shop_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # 解析商店
-        parser = ShopParser()
-        shop_data = parser.parse_shop_text(shop_text)
+        shop_data = parse_shop_text(shop_text)
         items = shop_data.get('items', [])
         
         if not items:
-            await update.message.reply_text("❌ 无法解析商店内容，请检查格式是否正确")
+            get_outbox(context).send_message(update.effective_chat.id, "❌ 无法解析商店内容，请检查格式是否正确")
             return
         
-        # 保存到数据库
-        db = Database(config.db_url)
-        session = db.get_session()
+        # 上一条商店消息仍在可编辑时限内时，原地编辑并标注变化；保存后缓存会被替换，先取出上一次的渲染结果
+        chat_id = update.effective_chat.id
+        shop_message = _editable_shop_message(context, chat_id)
+        shop_cache = get_shop_cache(context)
+        previous = shop_cache.peek(user_id)
+        previous_items = previous.items if previous else None
         
-        try:
-            ShopService.save_shop_snapshot(session, user_id, shop_data, parser.extract_refresh_time(shop_text))
-            
-            # 生成展示内容
-            display_text = ShopParser.format_items_for_display(items)
-            display_text += f"\n\n⏱️ 下次刷新时间: {parser.extract_refresh_time(shop_text) or '未知'}"
-            
-            # 创建购买按钮
-            keyboard = MenuHelper.create_shop_items_keyboard(items)
-            
-            await update.message.reply_text(
-                text=display_text,
-                reply_markup=keyboard
+        # 保存到数据库（同时更新并取回物品的历史价格统计）
+        price_stats = {}
+        deals = []
+        async with get_db(context).get_session() as session:
+            if shop_message and previous_items is None:
+                latest = await AsyncShopService.get_latest_shop_snapshot(session, user_id)
+                previous_items = latest.snapshot_data.get('items', []) if latest else None
+            snapshot = await AsyncShopService.save_shop_snapshot(
+                session, user_id, shop_data, shop_data.get('refresh_time'), price_stats=price_stats, deals=deals,
+                deal_settings=get_deal_settings(context)
             )
-            
-            logger.info(f"用户 {user_id} 的商店数据已保存，共 {len(items)} 件物品")
-            
-        finally:
-            session.close()
+        # 快照已提交，缓存中的旧内容不再有效（下面渲染失败时也不会继续展示旧商店）
+        shop_cache.invalidate(user_id)
+        
+        # 生成展示内容和购买按钮（未变化的物品沿用上次的按钮），并放入缓存供"查看当前商店"使用
+        reuse = shop_buttons(previous.items, previous.keyboard) if previous else None
+        entry = render_shop(
+            get_callback_registry(context), snapshot.id, items, shop_data.get('refresh_time'), snapshot.refresh_time,
+            price_stats, reuse
+        )
+        shop_cache.put(user_id, entry)
+        
+        edited = False
+        if shop_message and previous_items is not None:
+            changes = diff_items(previous_items, items)
+            text = shop_display_text(items, shop_data.get('refresh_time'), price_stats, changes)
+            edited = await _edit_shop_message(context, chat_id, shop_message["message_id"], text, entry.keyboard)
+            logger.debug("用户 %s 的商店变化: %s", user_id, changes.summary())
+        
+        if not edited:
+            message = await get_outbox(context).send_message(chat_id, entry.display_text, reply_markup=entry.keyboard)
+            # 编辑不改变消息在聊天中的位置，可编辑时限从发出时算起
+            context.user_data[SHOP_MESSAGE_KEY] = {"chat_id": chat_id, "message_id": message.message_id, "sent_at": time.time()}
+        
+        if deals and config.get("shop.deal_alerts", True):
+            notify_deals(context, chat_id, deals)
+        
+        logger.info("用户 %s 的商店数据已保存，共 %s 件物品", user_id, len(items))
+        await get_log_writer(context).log(user_id, "shop_input", f"{len(items)} 件物品")
             
     except Exception as e:
-        logger.error(f"解析商店内容出错: {e}")
-        await update.message.reply_text(f"❌ 解析出错: {str(e)}")
+        logger.error("解析商店内容出错: %s", e)
+        get_outbox(context).send_message(update.effective_chat.id, f"❌ 解析出错: {str(e)}")
 
 
 async def shop_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """商店输入处理"""
-    await update.message.reply_text("请发送商店内容...")
+    get_outbox(context).send_message(update.effective_chat.id, "请发送商店内容...")
 
 
 async def shop_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """商店查看处理"""
+    """商店查看处理（优先使用缓存，命中时不访问数据库）"""
     user_id = update.effective_user.id
     
     try:
-        db = Database(config.db_url)
-        session = db.get_session()
+        shop_cache = get_shop_cache(context)
+        entry = shop_cache.get(user_id)
         
-        try:
-            snapshot = ShopService.get_latest_shop_snapshot(session, user_id)
+        if entry is None:
+            async with get_db(context).get_session() as session:
+                snapshot = await AsyncShopService.get_latest_shop_snapshot(session, user_id)
+                items = snapshot.snapshot_data.get('items', []) if snapshot else []
+                price_stats = await AsyncShopService.get_item_price_stats(session, items)
             
             if not snapshot:
-                await update.message.reply_text("❌ 未找到商店数据，请先输入商店内容")
+                _reply(update, context, "❌ 未找到商店数据，请先输入商店内容")
                 return
             
-            shop_data = snapshot.snapshot_data
-            items = shop_data.get('items', [])
-            
-            display_text = ShopParser.format_items_for_display(items)
-            keyboard = MenuHelper.create_shop_items_keyboard(items)
-            
-            await update.message.reply_text(
-                text=display_text,
-                reply_markup=keyboard
+            refresh_text = snapshot.snapshot_data.get('refresh_time')
+            entry = render_shop(
+                get_callback_registry(context), snapshot.id, items, refresh_text, snapshot.refresh_time, price_stats
             )
             
-        finally:
-            session.close()
+            # 已过刷新时间的快照不放入缓存
+            if entry.expires_at is None or entry.expires_at > datetime.now():
+                shop_cache.put(user_id, entry)
+            else:
+                entry.display_text += "\n⚠️ 商店已刷新，以上内容可能已过期"
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("商店缓存统计: %s", shop_cache.stats())
+        _reply(update, context, entry.display_text, entry.keyboard)
             
     except Exception as e:
-        logger.error(f"查看商店出错: {e}")
-        await update.message.reply_text(f"❌ 查看商店出错: {str(e)}")
+        logger.error("查看商店出错: %s", e)
+        _reply(update, context, f"❌ 查看商店出错: {str(e)}")
+
+
+def shop_display_text(
+    items: list,
+    refresh_text: Optional[str],
+    price_stats: Optional[dict] = None,
+    changes: Optional[ShopDiff] = None
+) -> str:
+    """商店展示文本（price_stats 用于标注历史均价，changes 用于标注相对上一个快照的变化）"""
+    display_text = ShopParser.format_items_for_display(items, price_stats, changes)
+    return display_text + f"\n\n⏱️ 下次刷新时间: {refresh_text or '未知'}"
+
+
+def render_shop(
+    registry: CallbackRegistry,
+    snapshot_id: int,
+    items: list,
+    refresh_text: Optional[str],
+    expires_at: Optional[datetime],
+    price_stats: Optional[dict] = None,
+    reuse: Optional[dict] = None
+) -> CachedShop:
+    """渲染商店展示内容和购买按钮（reuse 为可以沿用的购买按钮，见 MenuHelper.create_shop_items_keyboard）"""
+    return CachedShop(
+        snapshot_id=snapshot_id,
+        items=items,
+        display_text=shop_display_text(items, refresh_text, price_stats),
+        keyboard=MenuHelper.create_shop_items_keyboard(items, registry, reuse),
+        expires_at=expires_at
+    )
+
+
+def _editable_shop_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> Optional[dict]:
+    """上一条商店消息（同一聊天、发出不超过 shop.edit_in_place_minutes 分钟），没有时返回 None"""
+    shop_message = context.user_data.get(SHOP_MESSAGE_KEY)
+    window = config.get("shop.edit_in_place_minutes", 30) * 60
+    if not shop_message or not window or shop_message.get("chat_id") != chat_id:
+        return None
+    if time.time() - shop_message.get("sent_at", 0) > window:
+        return None
+    return shop_message
+
+
+async def _edit_shop_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int, text: str, keyboard) -> bool:
+    """原地编辑上一条商店消息，消息已被删除等无法编辑时返回 False"""
+    try:
+        await get_outbox(context).edit_message_text(chat_id, message_id, text, reply_markup=keyboard)
+    except BadRequest as e:
+        if "not modified" in str(e).lower():
+            return True
+        logger.info("无法编辑商店消息 %s，改为发送新消息: %s", message_id, e)
+        return False
+    return True
+
+
+def notify_deals(context: ContextTypes.DEFAULT_TYPE, chat_id: int, deals: List[Deal]):
+    """单独推送一条捡漏提醒（列出低价物品、购买指令和购买按钮）"""
+    logger.info("向 %s 推送捡漏提醒: %s", chat_id, ", ".join(deal.item['name'] for deal in deals))
+    get_outbox(context).send_message(
+        chat_id,
+        format_deals(deals),
+        reply_markup=MenuHelper.create_shop_items_keyboard([deal.item for deal in deals], get_callback_registry(context))
+    )
+
+
+def _reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, reply_markup=None):
+    """回复消息：按钮回调时编辑原消息，普通消息时发送新消息（都经由发送队列，不等待发送完成）"""
+    if update.callback_query:
+        get_outbox(context).edit_callback_message(update.callback_query, text, reply_markup=reply_markup)
+    else:
+        get_outbox(context).send_message(update.effective_chat.id, text, reply_markup=reply_markup)
 
 
 async def shop_buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """商店购买处理"""
-    await update.message.reply_text("请先输入商店内容来选择购买物品")
+    get_outbox(context).send_message(update.effective_chat.id, "请先输入商店内容来选择购买物品")
@@ -9,16 +9,52 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from src.utils.menu_helper import MenuHelper
+from src.utils.menu_helper import MenuHelper, BUY_CALLBACK_PREFIX
 from src.handlers.forward_handler import ForwardHandler
+from src.handlers.shop_handler import shop_view
+from src.handlers.router import router
+from src.handlers.context import get_callback_registry, get_outbox
 
 logger = logging.getLogger(__name__)
 
+# 快速指令按钮 -> 发送给游戏Bot的指令
+COMMANDS = {
+    "cmd_start": "我要修仙",
+    "cmd_my_info": "我的信息",
+    "cmd_closed_cultivation": "闭关",
+    "cmd_exit_cultivation": "出关",
+    "cmd_check_in": "签到",
+    "cmd_potion_bag": "丹药背包",
+    "cmd_my_equipment": "我的装备",
+    "cmd_breakthrough_info": "突破信息",
+    "cmd_breakthrough": "突破",
+    "cmd_refresh_shop": "刷新商店",
+}
+
+# 需要填写参数的指令按钮 -> 指令模板（无法直接转发，提示用户手动发送）
+COMMAND_TEMPLATES = {
+    "cmd_equip_item": "装备 物品名",
+    "cmd_unequip_item": "卸下 装备名",
+    "cmd_breakthrough_with_potion": "突破 丹药名",
+    "cmd_use_potion": "服用丹药 丹药名",
+    "cmd_potion_info": "丹药信息 丹药名",
+}
+
+# 菜单按钮 -> MenuHelper.get_menu 的菜单类型
+MENUS = {
+    "menu_commands": "commands",
+    "menu_equipment": "equipment",
+    "menu_breakthrough": "breakthrough",
+    "menu_potion": "potion",
+    "menu_shop": "shop",
+    "back_shop": "shop",
+}
+
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理 /start 命令"""
     user = update.effective_user
-    logger.info(f"用户 {user.id} ({user.username}) 启动了 Bot")
+    logger.info("用户 %s (%s) 启动了 Bot", user.id, user.username)
     
     welcome_text = f"""
 👋 欢迎, {user.first_name}!
@@ -36,8 +72,9 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 点击下方按钮开始:
     """
     
-    await update.message.reply_text(
-        text=welcome_text,
+    get_outbox(context).send_message(
+        update.effective_chat.id,
+        welcome_text,
         reply_markup=MenuHelper.create_main_menu_keyboard()
     )
 
@@ -45,103 +82,103 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理按钮回调"""
     query = update.callback_query
-    await query.answer()
-    
-    callback_data = query.data
-    logger.info(f"用户 {query.from_user.id} 点击了: {callback_data}")
-    
-    # 路由不同的回调
-    if callback_data == "back_main":
-        await MenuHelper.send_main_menu(update, context)
-    
-    elif callback_data == "menu_commands":
-        await MenuHelper.send_menu(update, context, "commands")
-    
-    elif callback_data == "menu_equipment":
-        await MenuHelper.send_menu(update, context, "equipment")
-    
-    elif callback_data == "menu_breakthrough":
-        await MenuHelper.send_menu(update, context, "breakthrough")
-    
-    elif callback_data == "menu_potion":
-        await MenuHelper.send_menu(update, context, "potion")
+    # 应答和按钮触发的编辑都经由发送队列（限流、RetryAfter 后重发），不等待发送完成
+    get_outbox(context).answer_callback_query(query)
     
-    elif callback_data == "menu_shop":
-        await MenuHelper.send_menu(update, context, "shop")
+    logger.info("用户 %s 点击了: %s", query.from_user.id, query.data)
     
-    elif callback_data == "back_shop":
-        await MenuHelper.send_menu(update, context, "shop")
-    
-    # 处理快速指令
-    elif callback_data.startswith("cmd_"):
-        await handle_command_button(update, context, callback_data)
-    
-    # 处理购买操作
-    elif callback_data.startswith("buy_"):
-        await handle_buy_button(update, context, callback_data)
-    
-    # 处理商店输入
-    elif callback_data == "shop_input":
-        await handle_shop_input(update, context)
-    
-    elif callback_data == "shop_view":
-        await handle_shop_view(update, context)
-    
-    elif callback_data == "shop_buy":
-        await handle_shop_buy(update, context)
+    # 路由表见下方 @router 装饰的处理器
+    await router.dispatch(update, context)
+
+
+def _edit(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs):
+    """编辑按钮所在的消息（经由发送队列）"""
+    return get_outbox(context).edit_callback_message(update.callback_query, text, **kwargs)
 
 
+@router.exact("back_main")
+async def handle_back_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """返回主菜单"""
+    _edit(update, context, MenuHelper.MAIN_MENU_TEXT, reply_markup=MenuHelper.create_main_menu_keyboard())
+
+
+@router.exact(*MENUS)
+async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """打开子菜单"""
+    title, keyboard = MenuHelper.get_menu(MENUS[update.callback_query.data])
+    _edit(update, context, title, reply_markup=keyboard)
+
+
+@router.exact("my_info")
+async def handle_my_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """主菜单的「我的信息」，与指令菜单中的【我的信息】相同"""
+    await ForwardHandler.send_command_and_wait(update, context, COMMANDS["cmd_my_info"])
+
+
+@router.prefix("cmd_")
 async def handle_command_button(update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
     """处理快速指令按钮 - 自动发送给游戏Bot并返回结果"""
-    commands_map = {
-        "cmd_start": "我要修仙",
-        "cmd_my_info": "我的信息",
-        "cmd_closed_cultivation": "闭关",
-        "cmd_exit_cultivation": "出关",
-        "cmd_check_in": "签到",
-        "cmd_potion_bag": "丹药背包",
-        "cmd_my_equipment": "我的装备",
-        "cmd_breakthrough_info": "突破信息",
-        "cmd_breakthrough": "突破",
-        "cmd_refresh_shop": "刷新商店",
-    }
-    
-    command = commands_map.get(callback_data)
+    command = COMMANDS.get(callback_data)
     if command:
         # 使用转发处理器发送指令并等待结果
         await ForwardHandler.send_command_and_wait(update, context, command)
+        return
+    
+    template = COMMAND_TEMPLATES.get(callback_data)
+    if template:
+        _edit(
+            update, context,
+            f"✏️ 该指令需要填写参数\n\n"
+            f"请将 【{template}】 中的参数替换后发送给 @美奈 机器人"
+        )
     else:
-        await update.callback_query.edit_message_text(text="❌ 未知的指令")
+        logger.warning("未知的指令按钮: %s", callback_data)
+        _edit(update, context, "❌ 未知的指令")
 
 
+@router.exact("shop_input")
 async def handle_shop_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理商店输入"""
     context.user_data['awaiting_shop_input'] = True
-    await update.callback_query.edit_message_text(
-        text="请发送商店内容（整个商店信息）:\n\n"
-             "📝 提示: 你可以从 @美奈 机器人的【商店】命令中复制内容，然后粘贴到这里。"
+    _edit(
+        update, context,
+        "请发送商店内容（整个商店信息）:\n\n"
+        "📝 提示: 你可以从 @美奈 机器人的【商店】命令中复制内容，然后粘贴到这里。"
     )
 
 
+@router.exact("shop_view")
 async def handle_shop_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理查看商店"""
-    await update.callback_query.edit_message_text(
-        text="📊 功能开发中...\n正在优化此功能"
-    )
+    await shop_view(update, context)
 
 
+@router.exact("shop_buy")
 async def handle_shop_buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理快速购买"""
-    await update.callback_query.edit_message_text(
-        text="💳 请先输入商店内容，以查看可购买的物品"
-    )
+    _edit(update, context, "💳 请先输入商店内容，以查看可购买的物品")
 
 
+@router.prefix(BUY_CALLBACK_PREFIX)
 async def handle_buy_button(update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
     """处理购买按钮"""
-    # 格式: buy_位置_物品名
-    parts = callback_data.split("_", 2)
-    if len(parts) >= 3:
-        item_name = parts[2]
-        message = f"📤 购买指令: 【购买 {item_name}】\n\n请复制上述指令并发送给 @美奈 机器人"
-        await update.callback_query.edit_message_text(text=message)
+    key = callback_data[len(BUY_CALLBACK_PREFIX):]
+    if "_" in key:
+        # 旧格式: buy_位置_物品名
+        item_name = key.split("_", 1)[1]
+    else:
+        # buy_令牌，物品信息保存在按钮回调数据登记表中
+        item = get_callback_registry(context).get(key)
+        if item is None:
+            _edit(update, context, "⌛ 按钮已过期，请重新查看商店")
+            return
+        item_name = item["name"]
+    
+    message = f"📤 购买指令: 【购买 {item_name}】\n\n请复制上述指令并发送给 @美奈 机器人"
+    _edit(update, context, message)
+
+
+@router.fallback
+async def handle_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
+    """未注册的按钮（通常是旧版本留下的消息）"""
+    _edit(update, context, "❌ 该按钮已失效，请重新打开菜单", reply_markup=MenuHelper.create_main_menu_keyboard())
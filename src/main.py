@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """修仙游戏助手 - 主入口"""
 
+import argparse
 import os
 import sys
 import logging
@@ -9,27 +10,46 @@ import logging
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
-from src.utils.logger import setup_logging
-from src.bot import XianxiaBot
+# 最先导入：记录进程启动时间（不依赖其它模块）
+from src.utils.startup import startup_profile
 
 logger = logging.getLogger(__name__)
 
 
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="修仙游戏助手 Bot")
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="启动完成后输出各阶段耗时"
+    )
+    return parser.parse_args(argv)
+
+
 def main():
     """主函数"""
+    args = parse_args()
+    startup_profile.enabled = args.startup_profile
+    
     try:
-        setup_logging()
+        with startup_profile.phase("imports.bot"):
+            from src.utils.logger import setup_logging
+            from src.bot import XianxiaBot
+        
+        with startup_profile.phase("setup_logging"):
+            setup_logging()
         logger.info("=" * 50)
         logger.info("修仙游戏助手 Bot 启动中...")
         logger.info("=" * 50)
         
-        bot = XianxiaBot()
+        with startup_profile.phase("XianxiaBot()"):
+            bot = XianxiaBot()
         bot.run()
         
     except KeyboardInterrupt:
         logger.info("\n收到中断信号，正在关闭...")
     except Exception as e:
-        logger.error(f"发生错误: {e}", exc_info=True)
+        logger.error("发生错误: %s", e, exc_info=True)
         sys.exit(1)
 
 
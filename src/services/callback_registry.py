@@ -0,0 +1,111 @@
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+logger = logging.getLogger(__name__)
+
+BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+def base62(n: int) -> str:
+    """非负整数的 base62 编码"""
+    if n == 0:
+        return BASE62[0]
+    digits = []
+    while n:
+        n, r = divmod(n, 62)
+        digits.append(BASE62[r])
+    return "".join(reversed(digits))
+
+
+class CallbackRegistry:
+    """按钮回调数据登记表
+
+    Telegram 的 callback_data 最多 64 字节，物品名等较长的内容放不下。
+    register 把数据保存在服务端并返回一个短令牌（base62，最多 9 个字符），
+    按钮只携带令牌，点击时用 get 取回数据。
+
+    - 令牌随机生成：进程重启后，旧消息上的按钮不会误指向新的数据
+    - 最多保存 max_size 条（LRU 淘汰），每条保存 ttl 秒
+    """
+
+    TOKEN_BITS = 48
+
+    def __init__(self, max_size: int = 10000, ttl: float = 86400):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def register(self, payload: Any) -> str:
+        """保存数据，返回令牌"""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            token = base62(secrets.randbits(self.TOKEN_BITS))
+            while token in self._entries:
+                token = base62(secrets.randbits(self.TOKEN_BITS))
+            self._entries[token] = (payload, expires_at)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return token
+
+    def get(self, token: str) -> Optional[Any]:
+        """取回令牌对应的数据，不存在或已过期返回 None"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            payload, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[token]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return payload
+
+    def touch(self, token: str) -> bool:
+        """重新计算令牌的有效期（沿用旧按钮时调用），不存在或已过期返回 False"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return False
+            if entry[1] <= time.monotonic():
+                del self._entries[token]
+                return False
+            self._entries[token] = (entry[0], time.monotonic() + self.ttl)
+            self._entries.move_to_end(token)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """登记表统计信息"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
@@ -0,0 +1,210 @@
+import asyncio
+import itertools
+import os
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+import logging
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+logger = logging.getLogger(__name__)
+
+
+def command_type(command: str) -> str:
+    """指令的类型：第一个词（如 "购买 流云琴" 为 "购买"）"""
+    words = command.strip().strip("【】").split()
+    return words[0] if words else ""
+
+
+@dataclass
+class PendingCommand:
+    """一条等待游戏Bot回复的指令"""
+    seq: int
+    chat_id: int  # 指令发往的聊天（游戏Bot私聊或群组）
+    command: str
+    future: asyncio.Future
+    deadline: float  # loop.time() 时间
+    message_id: Optional[int] = None  # 发出的指令消息 ID，用于匹配 reply_to_message
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class CommandCorrelator:
+    """转发指令与游戏Bot回复的关联器
+
+    每条发出的指令注册一个 asyncio.Future，按以下方式匹配回复：
+    1. 回复消息引用了指令消息（reply_to_message）时，按消息 ID 精确匹配
+    2. 该聊天中只有一条等待中的指令时，匹配这一条
+    3. 否则按（聊天, 指令类型）匹配：回复中只出现一种等待中的指令类型（如 "签到"）时，
+       匹配该类型最早发出的指令
+
+    游戏Bot的聊天由所有用户共用，无法确定归属的回复直接丢弃并记录日志，
+    不按到达顺序猜测（一条回复丢失或延迟会让之后的回复都发给错误的用户）。
+
+    超时、取消或被清理的指令会从所有索引中移除，不会泄漏。
+    """
+
+    def __init__(self, default_timeout: float = 30.0, max_pending: int = 10000, sweep_interval: float = 60.0):
+        self.default_timeout = default_timeout
+        self.max_pending = max_pending
+        self.sweep_interval = sweep_interval
+
+        self._seq = itertools.count(1)
+        self._pending: "OrderedDict[int, PendingCommand]" = OrderedDict()
+        self._by_chat: Dict[int, "OrderedDict[int, PendingCommand]"] = {}
+        self._by_key: Dict[Tuple[int, str], "OrderedDict[int, PendingCommand]"] = {}
+        self._by_message: Dict[Tuple[int, int], PendingCommand] = {}
+        self._last_sweep = 0.0
+
+        # 统计信息
+        self.resolved = 0
+        self.timeouts = 0
+        self.unmatched = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def register(self, chat_id: int, command: str, timeout: Optional[float] = None) -> PendingCommand:
+        """注册一条刚发出的指令"""
+        loop = asyncio.get_running_loop()
+        self._maybe_sweep(loop.time())
+
+        # 超出上限时丢弃最早的指令
+        while len(self._pending) >= self.max_pending:
+            _, oldest = self._pending.popitem(last=False)
+            self._discard(oldest)
+            if not oldest.future.done():
+                oldest.future.cancel()
+
+        pending = PendingCommand(
+            seq=next(self._seq),
+            chat_id=chat_id,
+            command=command,
+            future=loop.create_future(),
+            deadline=loop.time() + (timeout or self.default_timeout),
+        )
+        self._pending[pending.seq] = pending
+        self._by_chat.setdefault(chat_id, OrderedDict())[pending.seq] = pending
+        self._by_key.setdefault((chat_id, command_type(command)), OrderedDict())[pending.seq] = pending
+        return pending
+
+    def attach_message(self, pending: PendingCommand, message_id: int):
+        """记录指令消息的 ID，用于精确匹配引用回复"""
+        pending.message_id = message_id
+        if pending.seq in self._pending:
+            self._by_message[(pending.chat_id, message_id)] = pending
+
+    def resolve(self, chat_id: int, text: str, reply_to_message_id: Optional[int] = None) -> Optional[PendingCommand]:
+        """用收到的回复完成对应的指令，返回被完成的指令（无匹配时返回 None）"""
+        pending = None
+        if reply_to_message_id is not None:
+            pending = self._by_message.get((chat_id, reply_to_message_id))
+        if pending is None:
+            pending = self._match_unquoted(chat_id, text)
+
+        if pending is None:
+            self.unmatched += 1
+            return None
+
+        self._remove(pending)
+        if not pending.future.done():
+            pending.future.set_result(text)
+        self.resolved += 1
+        return pending
+
+    def _match_unquoted(self, chat_id: int, text: str) -> Optional[PendingCommand]:
+        """没有引用指令消息的回复：只有一条等待中的指令，或回复中只出现一种等待中的指令类型时才匹配"""
+        queue = self._by_chat.get(chat_id)
+        if not queue:
+            return None
+        if len(queue) == 1:
+            return next(iter(queue.values()))
+
+        types = {command_type(pending.command) for pending in queue.values()}
+        found = [t for t in types if t and t in text]
+        if len(found) == 1:
+            return next(iter(self._by_key[(chat_id, found[0])].values()))
+
+        logger.warning("无法确定游戏Bot回复对应的指令（%s 条等待中），已丢弃: %s", len(queue), text[:50])
+        return None
+
+    async def wait(self, pending: PendingCommand) -> str:
+        """等待指令的回复，超时抛出 asyncio.TimeoutError"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(pending.future),
+                timeout=max(0.0, pending.deadline - loop.time())
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # 指令被清理（超出上限或已过期），按超时处理
+            self.timeouts += 1
+            raise asyncio.TimeoutError()
+        finally:
+            self.cancel(pending)
+
+    def cancel(self, pending: PendingCommand):
+        """取消等待并移除指令"""
+        self._remove(pending)
+        if not pending.future.done():
+            pending.future.cancel()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """清理所有已过期的指令，返回清理的数量"""
+        now = asyncio.get_running_loop().time() if now is None else now
+        self._last_sweep = now
+        expired = [pending for pending in self._pending.values() if pending.deadline <= now]
+        for pending in expired:
+            self._remove(pending)
+            if not pending.future.done():
+                pending.future.cancel()
+        if expired:
+            logger.info("已清理 %s 条超时未回复的指令", len(expired))
+        return len(expired)
+
+    def _maybe_sweep(self, now: float):
+        """距离上次清理超过 sweep_interval 时执行清理"""
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+
+    def _remove(self, pending: PendingCommand):
+        """从所有索引中移除"""
+        if self._pending.pop(pending.seq, None) is not None:
+            self._discard(pending)
+
+    def _discard(self, pending: PendingCommand):
+        """从二级索引中移除（主索引已移除）"""
+        chat_queue = self._by_chat.get(pending.chat_id)
+        if chat_queue is not None:
+            chat_queue.pop(pending.seq, None)
+            if not chat_queue:
+                del self._by_chat[pending.chat_id]
+
+        key = (pending.chat_id, command_type(pending.command))
+        key_queue = self._by_key.get(key)
+        if key_queue is not None:
+            key_queue.pop(pending.seq, None)
+            if not key_queue:
+                del self._by_key[key]
+
+        if pending.message_id is not None:
+            self._by_message.pop((pending.chat_id, pending.message_id), None)
+
+    def stats(self) -> Dict[str, int]:
+        """统计信息"""
+        return {
+            "pending": len(self._pending),
+            "resolved": self.resolved,
+            "timeouts": self.timeouts,
+            "unmatched": self.unmatched,
+        }
@@ -1,8 +1,15 @@
+import functools
+import hashlib
+import json
 import os
 import sys
+import zlib
+from sqlalchemy import Boolean, insert, literal_column, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Iterable, Tuple
 import logging
 
 # 确保 src 模块可以被导入
@@ -10,34 +17,207 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from src.database.models import User, ShopItem, ShopSnapshot, OperationLog
+from src.database.models import User, ShopItem, ShopSnapshot, ShopRawText, OperationLog, ItemPriceStats, dialect_insert
+from src.services.deals import (
+    Deal,
+    DealSettings,
+    TDigest,
+    detect_deals,
+    sketch_insert_missing,
+    sketch_placeholder_rows,
+    sketch_query,
+    sketch_rows,
+    sketch_upsert,
+)
+from src.services.shop_parser import parse_shop_text
+from src.services.price_stats import PriceKey, aggregate_items, price_key, price_stats_query, price_stats_rows, price_stats_upsert
 
 logger = logging.getLogger(__name__)
 
+# 刷新时间可能出现的格式
+REFRESH_TIME_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d %H:%M",
+)
+
+
+def parse_refresh_time(refresh_time: Optional[Any], now: Optional[datetime] = None) -> Optional[datetime]:
+    """将商店文本中的刷新时间转换为 datetime
+
+    支持完整日期时间，以及只有时分（秒）的形式（取下一个到达的该时刻）。
+    无法识别时返回 None，原始文本仍保存在 snapshot_data 中。
+    """
+    if refresh_time is None or isinstance(refresh_time, datetime):
+        return refresh_time
+
+    text = str(refresh_time).strip()
+    for fmt in REFRESH_TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try:
+            t = datetime.strptime(text, fmt).time()
+        except ValueError:
+            continue
+        now = now or datetime.now()
+        result = datetime.combine(now.date(), t)
+        if result <= now:
+            result += timedelta(days=1)
+        return result
+
+    return None
+
+
+def _shop_item_rows(snapshot: ShopSnapshot, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """将快照中的物品列表转换为 shop_items 表的行数据"""
+    created_at = snapshot.created_at or datetime.utcnow()
+    return [
+        {
+            "snapshot_id": snapshot.id,
+            "position": item.get("position"),
+            "name": item.get("name"),
+            "item_type": item.get("type"),
+            "rarity": item.get("rarity"),
+            "current_price": item.get("price"),
+            "original_price": item.get("original_price"),
+            "discount_percent": item.get("discount_percent", 0),
+            "created_at": created_at,
+        }
+        for item in items
+    ]
+
+
+def snapshot_content_hash(items: List[Dict[str, Any]]) -> str:
+    """计算规范化物品列表的内容哈希（与原始文本的空白、标题等无关）"""
+    canonical = json.dumps(items, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _split_raw_text(shop_data: Dict[str, Any]):
+    """将原始文本从快照数据中分离出来（原始文本单独去重存储）"""
+    snapshot_data = {key: value for key, value in shop_data.items() if key != "raw_text"}
+    return snapshot_data, shop_data.get("raw_text")
+
+
+def _raw_text_hash(raw_text: str) -> str:
+    """原始文本的内容哈希"""
+    return hashlib.sha256(raw_text.encode("utf-8")).hexdigest()
+
+
+def _compress_raw_text(raw_text: str) -> Dict[str, Any]:
+    """压缩原始文本，返回 shop_raw_texts 表的字段"""
+    encoded = raw_text.encode("utf-8")
+    return {
+        "content_hash": _raw_text_hash(raw_text),
+        "data": zlib.compress(encoded, 6),
+        "size": len(encoded),
+    }
+
+
+def decompress_raw_text(raw: ShopRawText) -> str:
+    """解压原始文本"""
+    return zlib.decompress(raw.data).decode("utf-8")
+
+
+# update_user_info 可以修改的列（其余键忽略）
+USER_UPDATABLE_COLUMNS = frozenset(
+    column.name for column in User.__table__.columns
+    if column.name not in ("id", "user_id", "created_at", "updated_at")
+)
+
+
+def _user_upsert_groups(updates: Dict[int, Dict[str, Any]], now: datetime) -> Dict[Tuple[str, ...], List[Dict[str, Any]]]:
+    """按要更新的列分组的 users 表行数据（同一组用同一条 upsert 语句批量执行）"""
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for user_id in sorted(updates):
+        fields = {key: value for key, value in updates[user_id].items() if key in USER_UPDATABLE_COLUMNS}
+        row = {"user_id": user_id, **fields, "created_at": now, "updated_at": now}
+        groups.setdefault(tuple(sorted(fields)), []).append(row)
+    return groups
+
+
+def _user_upsert(dialect_name: str, columns: Tuple[str, ...]):
+    """INSERT ... ON CONFLICT (user_id) DO UPDATE ... RETURNING，结果为 User 对象
+
+    没有要更新的列时（获取或创建）把 user_id 更新为自身，使已存在的用户也能由 RETURNING 返回。
+    PostgreSQL 上额外返回 inserted 列（xmax = 0 即本次插入的新行，冲突后更新的行 xmax 为当前事务号）。
+    语句基于 Core 的表对象、用 from_statement 映射为 User，比 ORM 批量 INSERT 的执行路径开销小得多。
+    """
+    table = User.__table__
+    stmt = dialect_insert(dialect_name)(table)
+    if columns:
+        set_ = {name: stmt.excluded[name] for name in columns}
+        set_["updated_at"] = stmt.excluded.updated_at
+    else:
+        set_ = {"user_id": stmt.excluded.user_id}
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c.user_id], set_=set_)
+    if dialect_name == "postgresql":
+        inserted = literal_column("xmax = 0", Boolean).label("inserted")
+        return select(User, inserted).from_statement(stmt.returning(*table.c, inserted))
+    return select(User).from_statement(stmt.returning(*table.c))
+
+
+def _price_history_query(name: str, since: Optional[datetime], limit: int):
+    """物品历史价格查询（走 idx_item_name_created 索引）"""
+    query = select(ShopItem).where(ShopItem.name == name)
+    if since is not None:
+        query = query.where(ShopItem.created_at >= since)
+    return query.order_by(ShopItem.created_at.desc()).limit(limit)
+
 
 class UserService:
     """用户服务"""
 
     @staticmethod
     def get_or_create_user(session: Session, user_id: int) -> User:
-        """获取或创建用户"""
-        user = session.query(User).filter(User.user_id == user_id).first()
-        if not user:
-            user = User(user_id=user_id)
-            session.add(user)
-            session.commit()
-            logger.info(f"创建新用户: {user_id}")
-        return user
+        """获取或创建用户（一条 upsert，并发创建同一用户不会出现主键冲突）"""
+        return UserService.upsert_users(session, {user_id: {}})[user_id]
 
     @staticmethod
-    def update_user_info(session: Session, user_id: int, data: Dict[str, Any]):
-        """更新用户信息"""
-        user = UserService.get_or_create_user(session, user_id)
-        for key, value in data.items():
-            if hasattr(user, key):
-                setattr(user, key, value)
+    def update_user_info(session: Session, user_id: int, data: Dict[str, Any]) -> User:
+        """更新用户信息（用户不存在时创建），data 中不是 users 表可修改列的键被忽略"""
+        return UserService.upsert_users(session, {user_id: data})[user_id]
+
+    @staticmethod
+    def get_or_create_users(session: Session, user_ids: Iterable[int]) -> Dict[int, User]:
+        """批量获取或创建用户"""
+        return UserService.upsert_users(session, {user_id: {} for user_id in user_ids})
+
+    @staticmethod
+    def upsert_users(session: Session, updates: Dict[int, Dict[str, Any]]) -> Dict[int, User]:
+        """批量创建或更新用户：user_id -> 要更新的字段（空字典表示只确保用户存在）
+
+        要更新的列相同的用户合并为一条多行 upsert（RETURNING 返回最新的行），最后提交一次。
+        每组只有这一条语句；PostgreSQL 上由 RETURNING 的 inserted 列得到新建的用户并记录日志，
+        其他数据库不区分新建和更新。
+        """
+        if not updates:
+            return {}
+        now = datetime.utcnow()
+        dialect_name = session.get_bind().dialect.name
+        users: Dict[int, User] = {}
+        created: List[int] = []
+        for columns, rows in _user_upsert_groups(updates, now).items():
+            result = session.execute(_user_upsert(dialect_name, columns), rows, execution_options={"populate_existing": True})
+            if dialect_name == "postgresql":
+                for user, inserted in result:
+                    users[user.user_id] = user
+                    if inserted:
+                        created.append(user.user_id)
+            else:
+                users.update((user.user_id, user) for user in result.scalars())
         session.commit()
-        return user
+
+        if len(created) == 1:
+            logger.info("创建新用户: %s", created[0])
+        elif created:
+            logger.info("创建 %s 个新用户", len(created))
+        return users
 
     @staticmethod
     def get_user_info(session: Session, user_id: int) -> Optional[User]:
@@ -49,37 +229,166 @@ class ShopService:
     """商店服务"""
 
     @staticmethod
-    def save_shop_snapshot(session: Session, user_id: int, shop_data: Dict[str, Any], refresh_time: Optional[str] = None) -> ShopSnapshot:
-        """保存商店快照"""
+    def save_shop_snapshot(
+        session: Session,
+        user_id: int,
+        shop_data: Dict[str, Any],
+        refresh_time: Optional[str] = None,
+        price_stats: Optional[Dict[PriceKey, ItemPriceStats]] = None,
+        deals: Optional[List[Deal]] = None,
+        deal_settings: Optional[DealSettings] = None
+    ) -> ShopSnapshot:
+        """保存商店快照
+
+        快照按规范化物品列表的内容哈希去重：同一用户重复粘贴相同的商店内容时，
+        只更新已有快照的 last_seen_at，不再插入新行。
+        新快照的物品价格在同一事务中合并进 item_price_stats；传入 price_stats 字典时，
+        把这些物品的历史价格统计放入其中（新快照由 upsert 的 RETURNING 直接得到，不额外查询）。
+        新快照还会更新物品的价格分布，传入 deals 列表时放入低于历史价格分位数的物品（见 src/services/deals.py）；
+        判定参数由调用方传入 deal_settings（Bot 按 shop.deal_* 配置生成），未传入时使用 DealSettings 的默认值。
+        """
+        snapshot_data, raw_text = _split_raw_text(shop_data)
+        content_hash = snapshot_content_hash(snapshot_data.get("items", []))
+        now = datetime.utcnow()
+        refresh_time = parse_refresh_time(refresh_time)
+        
+        snapshot = session.execute(
+            select(ShopSnapshot).where(
+                ShopSnapshot.user_id == user_id,
+                ShopSnapshot.content_hash == content_hash
+            ).limit(1)
+        ).scalars().first()
+        
+        if snapshot:
+            snapshot.last_seen_at = now
+            if refresh_time:
+                snapshot.refresh_time = refresh_time
+            if price_stats is not None:
+                price_stats.update(ShopService.get_item_price_stats(session, snapshot_data.get("items", [])))
+            session.commit()
+            logger.info("用户 %s 的商店快照未变化，更新最近粘贴时间", user_id)
+            return snapshot
+        
         snapshot = ShopSnapshot(
             user_id=user_id,
-            snapshot_data=shop_data,
-            refresh_time=refresh_time
+            snapshot_data=snapshot_data,
+            content_hash=content_hash,
+            raw_text_id=ShopService._get_or_create_raw_text(session, raw_text) if raw_text else None,
+            refresh_time=refresh_time,
+            created_at=now,
+            last_seen_at=now
         )
         session.add(snapshot)
+        session.flush()
+        
+        # 物品明细：每个快照一条批量 INSERT
+        rows = _shop_item_rows(snapshot, snapshot_data.get("items", []))
+        if rows:
+            session.execute(insert(ShopItem), rows)
+        stats = ShopService._merge_price_stats(session, snapshot_data.get("items", []), now)
+        found = ShopService._detect_deals(session, snapshot_data.get("items", []), deal_settings or DealSettings())
+        
         session.commit()
-        logger.info(f"保存用户 {user_id} 的商店快照")
+        if price_stats is not None:
+            price_stats.update(stats)
+        if deals is not None:
+            deals.extend(found)
+        logger.info("保存用户 %s 的商店快照", user_id)
         return snapshot
 
+    @staticmethod
+    def _merge_price_stats(session: Session, items: List[Dict[str, Any]], seen_at: datetime) -> Dict[PriceKey, ItemPriceStats]:
+        """把快照中的物品价格合并进历史价格统计，返回合并后的统计"""
+        aggregates = aggregate_items(items, seen_at)
+        if not aggregates:
+            return {}
+        stmt = price_stats_upsert(session.get_bind().dialect.name)
+        result = session.scalars(stmt, price_stats_rows(aggregates), execution_options={"populate_existing": True})
+        return {price_key(stats.name, stats.rarity): stats for stats in result}
+
+    @staticmethod
+    def _detect_deals(session: Session, items: List[Dict[str, Any]], settings: DealSettings) -> List[Deal]:
+        """用物品的历史价格分布找出低价物品，并把本次价格加入分布"""
+        keys = {price_key(item["name"], item.get("rarity")) for item in items if item.get("name")}
+        if not keys:
+            return []
+        dialect_name = session.get_bind().dialect.name
+        # 新物品先插入空分布，再一起加锁读取（见 sketch_insert_missing）
+        session.execute(sketch_insert_missing(dialect_name), sketch_placeholder_rows(keys, settings.compression))
+        result = session.scalars(sketch_query(keys))
+        sketches = {price_key(row.name, row.rarity): TDigest.from_dict(row.digest) for row in result}
+        found = detect_deals(items, sketches, settings)
+        session.execute(sketch_upsert(dialect_name), sketch_rows(sketches))
+        return found
+
+    @staticmethod
+    def get_item_price_stats(session: Session, items: List[Dict[str, Any]]) -> Dict[PriceKey, ItemPriceStats]:
+        """按主键读取物品的历史价格统计"""
+        keys = {price_key(item["name"], item.get("rarity")) for item in items if item.get("name")}
+        if not keys:
+            return {}
+        result = session.scalars(price_stats_query(keys))
+        return {price_key(stats.name, stats.rarity): stats for stats in result}
+
+    @staticmethod
+    def _get_or_create_raw_text(session: Session, raw_text: str) -> int:
+        """按内容哈希查找或保存原始文本，返回其 ID"""
+        fields = _compress_raw_text(raw_text)
+        query = select(ShopRawText.id).where(ShopRawText.content_hash == fields["content_hash"])
+        
+        raw_text_id = session.execute(query).scalar()
+        if raw_text_id is not None:
+            return raw_text_id
+        
+        try:
+            with session.begin_nested():
+                raw = ShopRawText(**fields)
+                session.add(raw)
+            return raw.id
+        except IntegrityError:
+            # 并发写入了相同的文本
+            return session.execute(query).scalar_one()
+
+    @staticmethod
+    def get_raw_text(session: Session, snapshot: ShopSnapshot) -> Optional[str]:
+        """获取快照对应的原始文本"""
+        if snapshot.raw_text_id is None:
+            return snapshot.snapshot_data.get("raw_text")
+        raw = session.get(ShopRawText, snapshot.raw_text_id)
+        return decompress_raw_text(raw) if raw else None
+
     @staticmethod
     def get_latest_shop_snapshot(session: Session, user_id: int) -> Optional[ShopSnapshot]:
         """获取用户最新的商店快照"""
         return session.query(ShopSnapshot).filter(
             ShopSnapshot.user_id == user_id
-        ).order_by(ShopSnapshot.created_at.desc()).first()
+        ).order_by(ShopSnapshot.last_seen_at.desc()).first()
 
     @staticmethod
-    def parse_and_save_shop(session: Session, user_id: int, shop_text: str):
-        """解析并保存商店内容"""
-        from src.utils.shop_parser import ShopParser
-        parser = ShopParser()
-        shop_data = parser.parse_shop_text(shop_text)
-        
+    def get_item_price_history(session: Session, name: str, since: Optional[datetime] = None, limit: int = 500) -> List[ShopItem]:
+        """获取物品的历史价格记录（按时间倒序）"""
+        return list(session.execute(_price_history_query(name, since, limit)).scalars().all())
+
+    @staticmethod
+    def parse_and_save_shop(
+        session: Session,
+        user_id: int,
+        shop_text: str,
+        price_stats: Optional[Dict[PriceKey, ItemPriceStats]] = None,
+        deals: Optional[List[Deal]] = None,
+        deal_settings: Optional[DealSettings] = None
+    ):
+        """解析并保存商店内容（price_stats / deals / deal_settings 见 save_shop_snapshot）"""
+        shop_data = parse_shop_text(shop_text)
+
         return ShopService.save_shop_snapshot(
-            session, 
-            user_id, 
+            session,
+            user_id,
             shop_data,
-            refresh_time=parser.extract_refresh_time(shop_text)
+            refresh_time=shop_data.get("refresh_time"),
+            price_stats=price_stats,
+            deals=deals,
+            deal_settings=deal_settings
         )
 
 
@@ -107,9 +416,57 @@ class OperationService:
         session.commit()
         return log
 
+    @staticmethod
+    def log_operations(session: Session, records: List[Dict[str, Any]]) -> int:
+        """批量记录操作（一条多行 INSERT + 一次提交）
+
+        records 中每一项为 OperationLog 的字段字典。
+        """
+        if not records:
+            return 0
+        session.execute(insert(OperationLog), records)
+        session.commit()
+        return len(records)
+
     @staticmethod
     def get_user_operations(session: Session, user_id: int, limit: int = 50) -> List[OperationLog]:
         """获取用户的操作日志"""
         return session.query(OperationLog).filter(
             OperationLog.user_id == user_id
         ).order_by(OperationLog.created_at.desc()).limit(limit).all()
+
+
+def _run_sync(func):
+    """把同步服务方法包装为异步版本：在 AsyncSession.run_sync 中执行同一份实现"""
+    async def wrapper(session: AsyncSession, *args, **kwargs):
+        return await session.run_sync(func, *args, **kwargs)
+    return staticmethod(functools.wraps(func)(wrapper))
+
+
+class AsyncUserService:
+    """用户服务（异步版本，供 Bot 处理器使用；实现与 UserService 相同）"""
+
+    get_or_create_user = _run_sync(UserService.get_or_create_user)
+    update_user_info = _run_sync(UserService.update_user_info)
+    get_or_create_users = _run_sync(UserService.get_or_create_users)
+    upsert_users = _run_sync(UserService.upsert_users)
+    get_user_info = _run_sync(UserService.get_user_info)
+
+
+class AsyncShopService:
+    """商店服务（异步版本，供 Bot 处理器使用；实现与 ShopService 相同）"""
+
+    save_shop_snapshot = _run_sync(ShopService.save_shop_snapshot)
+    get_item_price_stats = _run_sync(ShopService.get_item_price_stats)
+    get_raw_text = _run_sync(ShopService.get_raw_text)
+    get_latest_shop_snapshot = _run_sync(ShopService.get_latest_shop_snapshot)
+    get_item_price_history = _run_sync(ShopService.get_item_price_history)
+    parse_and_save_shop = _run_sync(ShopService.parse_and_save_shop)
+
+
+class AsyncOperationService:
+    """操作日志服务（异步版本，供 Bot 处理器使用；实现与 OperationService 相同）"""
+
+    log_operation = _run_sync(OperationService.log_operation)
+    log_operations = _run_sync(OperationService.log_operations)
+    get_user_operations = _run_sync(OperationService.get_user_operations)
@@ -0,0 +1,269 @@
+"""捡漏提醒：按物品历史价格分布找出低价物品
+
+每种物品（名称 + 品级）的历史价格用一个 t-digest 概括，保存在 item_price_sketches 表中。
+保存新快照时（ShopService.save_shop_snapshot，与快照同一事务）先用已有的分布计算每件物品
+当前价格的百分位，低于 shop.deal_percentile 的记为捡漏，然后把当前价格加入分布。
+
+t-digest 的质心数量只与压缩参数有关（不随记录次数增长），每件物品的更新是常数时间，
+每个快照的开销与物品数成正比：一次按主键读取、一条批量 upsert。
+"""
+
+import bisect
+import math
+import os
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+import logging
+
+from sqlalchemy import select, tuple_
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.database.models import ItemPriceSketch, dialect_insert
+from src.services.metrics import SHOP_DEALS
+from src.services.price_stats import PriceKey, price_key
+from src.utils.config import ConfigSnapshot
+from src.utils.constants import RARITY_MAP
+
+logger = logging.getLogger(__name__)
+
+# 默认压缩参数（质心数量上限约为该值）
+DEFAULT_COMPRESSION = 50
+
+
+class TDigest:
+    """合并式 t-digest（k1 尺度函数）
+
+    质心按均值排序，两端的质心权重小、中间的大，低分位（捡漏关心的区间）的精度较高。
+    每次加入一个值后若质心数超过 compression 就合并一遍，质心数始终不超过 compression + 1。
+    """
+
+    def __init__(
+        self,
+        compression: float = DEFAULT_COMPRESSION,
+        centroids: Optional[List[List[float]]] = None,
+        count: int = 0,
+        min: Optional[float] = None,
+        max: Optional[float] = None
+    ):
+        self.compression = compression
+        # [均值, 权重]，按均值排序
+        self.centroids: List[List[float]] = centroids or []
+        # 质心均值的有序列表（与 centroids 一一对应），加入值时二分查找位置，不必每次重建
+        self._means: List[float] = [c[0] for c in self.centroids]
+        self.count = count
+        self.min = min
+        self.max = max
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TDigest":
+        return cls(
+            compression=data.get("compression", DEFAULT_COMPRESSION),
+            centroids=[list(c) for c in data.get("centroids", [])],
+            count=data.get("count", 0),
+            min=data.get("min"),
+            max=data.get("max"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "compression": self.compression,
+            "centroids": [[round(mean, 4), weight] for mean, weight in self.centroids],
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    def add(self, value: float, weight: int = 1):
+        """加入一个值"""
+        self.count += weight
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        index = bisect.bisect_right(self._means, value)
+        self._means.insert(index, value)
+        self.centroids.insert(index, [value, weight])
+        if len(self.centroids) > self.compression:
+            self._compress()
+
+    def _q_limit(self, q: float) -> float:
+        """从分位 q 开始的质心最多延伸到的分位（k1 尺度函数上相差 1）"""
+        k = self.compression / (2 * math.pi) * math.asin(2 * q - 1) + 1
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        total = self.count
+        merged = []
+        cumulative = 0.0
+        limit = self._q_limit(0)
+        mean, weight = self.centroids[0]
+        for next_mean, next_weight in self.centroids[1:]:
+            if (cumulative + weight + next_weight) / total <= limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                merged.append([mean, weight])
+                cumulative += weight
+                limit = self._q_limit(cumulative / total)
+                mean, weight = next_mean, next_weight
+        merged.append([mean, weight])
+        self.centroids = merged
+        self._means = [c[0] for c in merged]
+
+    def cdf(self, value: float) -> float:
+        """小于 value 的比例（等于 value 的记一半），在相邻质心之间线性插值"""
+        if not self.count:
+            return math.nan
+        if value < self.min:
+            return 0.0
+        if value > self.max:
+            return 1.0
+
+        # 每个质心的一半权重在均值左侧
+        below = 0.0
+        equal = 0.0
+        left_x, left_y = self.min, 0.0
+        for mean, weight in self.centroids:
+            if mean < value:
+                left_x, left_y = mean, below + weight / 2
+                below += weight
+            elif mean == value:
+                equal += weight
+            else:
+                if equal:
+                    break
+                right_x, right_y = mean, below + weight / 2
+                return _interpolate(value, left_x, left_y, right_x, right_y) / self.count
+        if equal:
+            return (below + equal / 2) / self.count
+        return _interpolate(value, left_x, left_y, self.max, self.count) / self.count
+
+
+def _interpolate(x: float, x0: float, y0: float, x1: float, y1: float) -> float:
+    if x1 <= x0:
+        return y1
+    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+
+@dataclass(frozen=True)
+class DealSettings:
+    """捡漏判定参数（shop.deal_* 配置）"""
+    percentile: float = 10.0
+    min_samples: int = 10
+    compression: float = DEFAULT_COMPRESSION
+    rarities: FrozenSet[str] = field(default_factory=frozenset)  # 为空时不限品级
+
+    @classmethod
+    def from_config(cls, snapshot: ConfigSnapshot) -> "DealSettings":
+        rarities = snapshot.get("shop.deal_rarities") or ()
+        return cls(
+            percentile=snapshot.get("shop.deal_percentile", 10.0),
+            min_samples=snapshot.get("shop.deal_min_samples", 10),
+            compression=snapshot.get("shop.deal_compression", DEFAULT_COMPRESSION),
+            # 品级可以写中文（帝品）或解析后的代码（imperial）
+            rarities=frozenset(RARITY_MAP.get(r, r) for r in rarities),
+        )
+
+
+@dataclass
+class Deal:
+    """低于历史价格分位数的物品"""
+    item: Dict[str, Any]
+    percentile: float  # 当前价格在历史价格中的百分位（0-100）
+    samples: int  # 历史记录次数
+
+
+def detect_deals(items: Iterable[Dict[str, Any]], sketches: Dict[PriceKey, TDigest], settings: DealSettings) -> List[Deal]:
+    """用已有的价格分布判断每件物品是否为捡漏，然后把当前价格加入分布（sketches 原地更新）"""
+    deals = []
+    for item in items:
+        price = item.get("price")
+        if price is None or not item.get("name"):
+            continue
+        key = price_key(item["name"], item.get("rarity"))
+        digest = sketches.get(key)
+        if digest is None:
+            digest = sketches[key] = TDigest(settings.compression)
+        if digest.count >= settings.min_samples and (not settings.rarities or item.get("rarity") in settings.rarities):
+            percentile = digest.cdf(price) * 100
+            if percentile < settings.percentile:
+                deals.append(Deal(item, percentile, digest.count))
+                SHOP_DEALS.inc(rarity=item.get("rarity") or "")
+        digest.add(price)
+    return deals
+
+
+def sketch_placeholder_rows(keys: Iterable[PriceKey], compression: float) -> List[Dict[str, Any]]:
+    """sketch_insert_missing 的参数：空的价格分布（按主键排序）"""
+    now = datetime.utcnow()
+    digest = TDigest(compression).to_dict()
+    return [
+        {"name": key[0], "rarity": key[1], "count": 0, "digest": digest, "updated_at": now}
+        for key in sorted(keys)
+    ]
+
+
+@lru_cache(maxsize=None)
+def sketch_insert_missing(dialect_name: str):
+    """为还没有价格分布的物品插入空行（已存在的跳过）
+
+    SELECT ... FOR UPDATE 只能锁住已存在的行：两个事务同时保存含同一新物品的快照时，
+    都读不到这一行，各自从空分布开始，后写入的会覆盖先写入的价格。先插入空行，
+    随后的 sketch_query 就能锁住全部物品，并发的保存按顺序读取和更新。
+    """
+    stmt = dialect_insert(dialect_name)(ItemPriceSketch)
+    return stmt.on_conflict_do_nothing(index_elements=[ItemPriceSketch.name, ItemPriceSketch.rarity])
+
+
+def sketch_query(keys: Iterable[PriceKey]):
+    """按主键读取价格分布并加锁（按主键顺序，并发保存快照时不会死锁；新物品先用 sketch_insert_missing 插入）"""
+    return (
+        select(ItemPriceSketch)
+        .where(tuple_(ItemPriceSketch.name, ItemPriceSketch.rarity).in_(list(keys)))
+        .order_by(ItemPriceSketch.name, ItemPriceSketch.rarity)
+        .with_for_update()
+    )
+
+
+def sketch_rows(sketches: Dict[PriceKey, TDigest]) -> List[Dict[str, Any]]:
+    """sketch_upsert 的参数"""
+    now = datetime.utcnow()
+    return [
+        {"name": key[0], "rarity": key[1], "count": sketches[key].count, "digest": sketches[key].to_dict(), "updated_at": now}
+        for key in sorted(sketches)
+    ]
+
+
+@lru_cache(maxsize=None)
+def sketch_upsert(dialect_name: str):
+    """写入价格分布（已在 sketch_query 中加锁，直接覆盖）"""
+    stmt = dialect_insert(dialect_name)(ItemPriceSketch)
+    return stmt.on_conflict_do_update(
+        index_elements=[ItemPriceSketch.name, ItemPriceSketch.rarity],
+        set_={
+            "count": stmt.excluded["count"],
+            "digest": stmt.excluded.digest,
+            "updated_at": stmt.excluded.updated_at,
+        }
+    )
+
+
+def format_deals(deals: List[Deal]) -> str:
+    """捡漏提醒的消息文本（含购买指令）"""
+    lines = [f"🔥 发现 {len(deals)} 件低价物品\n"]
+    for deal in deals:
+        item = deal.item
+        lines.append(
+            f"{item['position']}. {item['name']} ({item.get('type', '')})\n"
+            f"   💰 {item['price']} 灵石，低于历史 {100 - deal.percentile:.0f}% 的价格（{deal.samples} 次记录）\n"
+            f"   📤 【购买 {item['name']}】"
+        )
+    lines.append("\n复制指令发送给 @美奈 机器人，或点击下方按钮")
+    return "\n".join(lines)
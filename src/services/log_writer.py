@@ -0,0 +1,152 @@
+import asyncio
+import os
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.database.models import AsyncDatabase
+from src.services.db_service import AsyncOperationService
+
+logger = logging.getLogger(__name__)
+
+# 通知后台任务退出的哨兵
+_STOP = object()
+
+
+class OperationLogWriter:
+    """操作日志的异步批量写入器（write-behind）
+
+    处理器调用 log() 只是把记录放入内存队列，由后台任务每攒够 batch_size 条
+    或每隔 flush_interval 秒，以一条多行 INSERT 写入数据库。
+    队列满时 log() 会等待（背压），停止时会把队列中剩余的记录全部写入。
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_queue_size: int = 10000
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.backpressure_waits = 0
+
+    @property
+    def queue_size(self) -> int:
+        """当前排队等待写入的记录数"""
+        return self._queue.qsize()
+
+    async def start(self):
+        """启动后台写入任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="operation-log-writer")
+            logger.info("操作日志写入器已启动（批量 %s 条 / %.0f 毫秒）", self.batch_size, self.flush_interval * 1000)
+
+    async def stop(self):
+        """停止后台任务，并写入队列中剩余的记录"""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        logger.info("操作日志写入器已停止，共写入 %s 条，失败 %s 条", self.written, self.failed)
+
+    async def log(
+        self,
+        user_id: int,
+        operation_type: str,
+        operation_content: str = None,
+        success: bool = True,
+        response: str = None
+    ):
+        """记录操作（只入队，不访问数据库）"""
+        record = {
+            "user_id": user_id,
+            "operation_type": operation_type,
+            "operation_content": operation_content,
+            "success": success,
+            "response": response,
+            "created_at": datetime.utcnow(),
+        }
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            # 背压：队列已满时等待后台任务腾出空间
+            self.backpressure_waits += 1
+            await self._queue.put(record)
+
+    async def _run(self):
+        """后台任务：按数量或时间批量写入"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+
+            batch: List[Dict[str, Any]] = [first]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        record = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+
+            await self._write(batch)
+
+        # 停止时写入剩余记录
+        remaining = []
+        while not self._queue.empty():
+            record = self._queue.get_nowait()
+            if record is not _STOP:
+                remaining.append(record)
+        for i in range(0, len(remaining), self.batch_size):
+            await self._write(remaining[i:i + self.batch_size])
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        """写入一批记录"""
+        try:
+            async with self.db.get_session() as session:
+                self.written += await AsyncOperationService.log_operations(session, batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error("批量写入操作日志失败（%s 条）: %s", len(batch), e)
+
+    def stats(self) -> Dict[str, Any]:
+        """写入统计信息"""
+        return {
+            "queue_size": self.queue_size,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "backpressure_waits": self.backpressure_waits,
+        }
@@ -0,0 +1,228 @@
+import asyncio
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+import logging
+
+from sqlalchemy import delete, exists, func, select, text
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.database.models import AsyncDatabase, ShopItem, ShopSnapshot, ShopRawText, OperationLog
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PruneReport:
+    """单项清理结果"""
+    name: str
+    rows_removed: int = 0
+    elapsed: float = 0.0
+
+    def __str__(self) -> str:
+        return f"{self.name}: 删除 {self.rows_removed} 行，耗时 {self.elapsed:.2f} 秒"
+
+
+class MaintenanceService:
+    """数据保留与清理
+
+    - 商店快照：超过 history_days 未再出现的，以及每个用户超出 max_snapshots 条的旧快照
+      （连同其 shop_items 明细和不再被引用的原始文本）
+    - 操作日志：超过 log_retention_days 的记录
+
+    所有删除都按 chunk_size 分批进行，每批一个短事务，不会长时间持有锁。
+    PostgreSQL 上若 operation_logs 已按月分区，则直接删除过期分区。
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        history_days: int = 30,
+        max_snapshots: int = 100,
+        log_retention_days: int = 30,
+        chunk_size: int = 1000,
+        partition_operation_logs: bool = False
+    ):
+        self.db = db
+        self.history_days = history_days
+        self.max_snapshots = max_snapshots
+        self.log_retention_days = log_retention_days
+        self.chunk_size = chunk_size
+        self.partition_operation_logs = partition_operation_logs
+
+    async def run(self) -> List[PruneReport]:
+        """执行一次完整清理"""
+        start = time.perf_counter()
+        reports = []
+
+        if self.history_days:
+            reports.append(await self.prune_snapshots_by_age())
+        if self.max_snapshots:
+            reports.append(await self.prune_snapshots_by_count())
+        reports.append(await self.prune_orphan_raw_texts())
+        if self.log_retention_days:
+            reports.append(await self.prune_operation_logs())
+
+        total = sum(report.rows_removed for report in reports)
+        logger.info(
+            "数据清理完成: 共删除 %s 行，耗时 %.2f 秒 (%s)",
+            total, time.perf_counter() - start, "; ".join(str(report) for report in reports)
+        )
+        return reports
+
+    async def prune_snapshots_by_age(self) -> PruneReport:
+        """删除超过保留天数的快照"""
+        cutoff = datetime.utcnow() - timedelta(days=self.history_days)
+        ids_query = select(ShopSnapshot.id).where(ShopSnapshot.last_seen_at < cutoff)
+        return await self._delete_snapshots("shop_snapshots(按时间)", ids_query)
+
+    async def prune_snapshots_by_count(self) -> PruneReport:
+        """删除每个用户超出数量上限的旧快照"""
+        ranked = select(
+            ShopSnapshot.id,
+            func.row_number().over(
+                partition_by=ShopSnapshot.user_id,
+                order_by=(ShopSnapshot.last_seen_at.desc(), ShopSnapshot.id.desc())
+            ).label("rank")
+        ).subquery()
+        ids_query = select(ranked.c.id).where(ranked.c.rank > self.max_snapshots)
+        return await self._delete_snapshots("shop_snapshots(按数量)", ids_query)
+
+    async def prune_orphan_raw_texts(self) -> PruneReport:
+        """删除不再被任何快照引用的原始文本"""
+        ids_query = select(ShopRawText.id).where(
+            ~exists().where(ShopSnapshot.raw_text_id == ShopRawText.id)
+        )
+        report = PruneReport("shop_raw_texts")
+        start = time.perf_counter()
+        report.rows_removed = await self._delete_in_chunks(ShopRawText, ids_query)
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    async def prune_operation_logs(self) -> PruneReport:
+        """删除超过保留天数的操作日志"""
+        cutoff = datetime.utcnow() - timedelta(days=self.log_retention_days)
+        report = PruneReport("operation_logs")
+        start = time.perf_counter()
+
+        if self.partition_operation_logs and await self._operation_logs_partitioned():
+            report.rows_removed = await self._drop_expired_partitions(cutoff)
+        else:
+            if self.partition_operation_logs:
+                logger.warning("operation_logs 不是分区表，改用分批删除（转换方法见 docs/MAINTENANCE.md）")
+            ids_query = select(OperationLog.id).where(OperationLog.created_at < cutoff)
+            report.rows_removed = await self._delete_in_chunks(OperationLog, ids_query)
+
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    async def _delete_snapshots(self, name: str, ids_query) -> PruneReport:
+        """分批删除快照及其物品明细"""
+        report = PruneReport(name)
+        start = time.perf_counter()
+
+        while True:
+            async with self.db.get_session() as session:
+                ids = list((await session.execute(ids_query.limit(self.chunk_size))).scalars().all())
+                if not ids:
+                    break
+                await session.execute(delete(ShopItem).where(ShopItem.snapshot_id.in_(ids)))
+                await session.execute(delete(ShopSnapshot).where(ShopSnapshot.id.in_(ids)))
+                await session.commit()
+            report.rows_removed += len(ids)
+            if len(ids) < self.chunk_size:
+                break
+            # 让出事件循环，避免长时间占用
+            await asyncio.sleep(0)
+
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    async def _delete_in_chunks(self, model, ids_query) -> int:
+        """按主键分批删除，每批一个短事务"""
+        removed = 0
+        while True:
+            async with self.db.get_session() as session:
+                ids = list((await session.execute(ids_query.limit(self.chunk_size))).scalars().all())
+                if not ids:
+                    break
+                await session.execute(delete(model).where(model.id.in_(ids)))
+                await session.commit()
+            removed += len(ids)
+            if len(ids) < self.chunk_size:
+                break
+            await asyncio.sleep(0)
+        return removed
+
+    async def _operation_logs_partitioned(self) -> bool:
+        """operation_logs 是否为 PostgreSQL 分区表"""
+        if self.db.engine.dialect.name != "postgresql":
+            return False
+        async with self.db.engine.connect() as conn:
+            result = await conn.execute(text(
+                "SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = 'operation_logs'"
+            ))
+            return result.first() is not None
+
+    async def ensure_log_partitions(self, months_ahead: int = 2):
+        """为 operation_logs 预先创建本月及之后若干个月的分区"""
+        if not (self.partition_operation_logs and await self._operation_logs_partitioned()):
+            return
+
+        month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        async with self.db.engine.begin() as conn:
+            for _ in range(months_ahead + 1):
+                next_month = _next_month(month)
+                await conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {_partition_name(month)} "
+                    f"PARTITION OF operation_logs "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}')"
+                ))
+                month = next_month
+
+    async def _drop_expired_partitions(self, cutoff: datetime) -> int:
+        """删除整个月份都早于 cutoff 的分区，返回删除的行数"""
+        removed = 0
+        async with self.db.engine.begin() as conn:
+            result = await conn.execute(text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = 'operation_logs'"
+            ))
+            for (partition,) in result.all():
+                month = _partition_month(partition)
+                if month is None or _next_month(month) > cutoff:
+                    continue
+                count = (await conn.execute(text(f"SELECT count(*) FROM {partition}"))).scalar()
+                await conn.execute(text(f"DROP TABLE {partition}"))
+                removed += count
+                logger.info("已删除过期分区 %s（%s 行）", partition, count)
+        return removed
+
+
+def _partition_name(month: datetime) -> str:
+    """月份分区表名，如 operation_logs_y2024m01"""
+    return f"operation_logs_y{month:%Y}m{month:%m}"
+
+
+def _partition_month(partition: str) -> Optional[datetime]:
+    """从分区表名解析月份"""
+    try:
+        return datetime.strptime(partition, "operation_logs_y%Ym%m")
+    except ValueError:
+        return None
+
+
+def _next_month(month: datetime) -> datetime:
+    """下个月的第一天"""
+    return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
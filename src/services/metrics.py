@@ -0,0 +1,368 @@
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import logging
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的桶上界（秒）
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]  # (指标名, 标签, 值)
+
+
+class LatencyHistogram:
+    """固定桶的延迟直方图"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶估算分位数（返回所在桶的上界，落在 +Inf 桶时返回最后一个上界）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts)),
+        }
+
+
+class _Metric:
+    """带标签的指标（各标签组合的值保存在字典中，只在抓取时遍历）"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Labels) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[Sample]:
+        for key, value in list(self._values.items()):
+            yield self.name, self._labels(key), value
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> Iterator[Sample]:
+        for key, value in list(self._values.items()):
+            yield self.name, self._labels(key), value
+
+
+class Histogram(_Metric):
+    """延迟分布（每个标签组合一个 LatencyHistogram）"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        self._children: Dict[Labels, LatencyHistogram] = {}
+
+    def child(self, **labels) -> LatencyHistogram:
+        key = self._key(labels)
+        hist = self._children.get(key)
+        if hist is None:
+            hist = self._children.setdefault(key, LatencyHistogram(self.buckets))
+        return hist
+
+    def observe(self, seconds: float, **labels):
+        self.child(**labels).observe(seconds)
+
+    def attach(self, hist: LatencyHistogram, **labels):
+        """把已有的直方图（如回调路由自带的）作为某个标签组合导出"""
+        self._children[self._key(labels)] = hist
+
+    def samples(self) -> Iterator[Sample]:
+        for key, hist in list(self._children.items()):
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, n in zip([*map(_format_value, hist.buckets), "+Inf"], hist.counts):
+                cumulative += n
+                yield f"{self.name}_bucket", {**labels, "le": bound}, cumulative
+            yield f"{self.name}_count", labels, hist.count
+            yield f"{self.name}_sum", labels, hist.sum
+
+
+class MetricsRegistry:
+    """指标注册表
+
+    热路径上只更新内存中的计数；采集函数（add_collector）在抓取时才被调用，
+    用来导出各组件已有的统计（发送队列、缓存等），没有抓取时没有额外开销。
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[_Metric]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标重复注册: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def add_collector(self, collector: Callable[[], Iterable[_Metric]], name: Optional[str] = None):
+        """注册抓取时调用的采集函数，返回本次导出的指标
+
+        同名（name，默认为函数名）的采集函数只保留最后注册的一个，重复创建组件时不会重复导出。
+        """
+        with self._lock:
+            self._collectors[name or collector.__name__] = collector
+
+    def collect(self) -> List[_Metric]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+        for collector in collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                logger.warning("指标采集失败 (%s): %s", getattr(collector, "__name__", collector), e)
+        return metrics
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for metric in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def stats_collector(prefix: str, stats: Callable[[], Dict[str, Any]], documentation: str):
+    """把组件 stats() 中的数值导出为 <prefix>_<键> 的 gauge"""
+
+    def collect() -> Iterator[Gauge]:
+        for key, value in stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            gauge = Gauge(f"{prefix}_{key}", f"{documentation}: {key}")
+            gauge.set(value)
+            yield gauge
+
+    collect.__name__ = f"{prefix}_stats"
+    return collect
+
+
+# 全局注册表和各模块共用的指标
+registry = MetricsRegistry()
+
+HANDLER_LATENCY = registry.histogram(
+    "telegram_handler_latency_seconds", "Update 处理器耗时", ["handler"]
+)
+HANDLER_ERRORS = registry.counter(
+    "telegram_handler_errors_total", "Update 处理器抛出的异常数", ["handler"]
+)
+DB_QUERY_LATENCY = registry.histogram(
+    "db_query_latency_seconds", "SQL 语句执行耗时（游标级）", ["statement"]
+)
+DB_CONNECT = registry.histogram(
+    "db_connect_seconds", "建立新数据库连接的耗时（不含从连接池取得已有连接）"
+)
+DB_POOL_HELD = registry.histogram(
+    "db_pool_connection_held_seconds", "连接从取出到归还的占用时间"
+)
+PARSER_LATENCY = registry.histogram(
+    "shop_parser_latency_seconds", "单次商店文本解析耗时"
+)
+PARSER_ITEMS = registry.counter(
+    "shop_parser_items_total", "解析出的商店物品数"
+)
+PARSER_CHARS = registry.counter(
+    "shop_parser_chars_total", "解析的商店文本字符数"
+)
+SHOP_DEALS = registry.counter(
+    "shop_deals_total", "低于历史价格分位数的物品数（捡漏提醒）", ["rarity"]
+)
+TELEGRAM_API_LATENCY = registry.histogram(
+    "telegram_api_latency_seconds", "Bot API 请求耗时", ["method"]
+)
+TELEGRAM_API_ERRORS = registry.counter(
+    "telegram_api_errors_total", "Bot API 请求失败数（HTTP 错误码或网络异常）", ["method", "reason"]
+)
+UPDATE_QUEUE_WAIT = registry.histogram(
+    "telegram_update_queue_wait_seconds", "更新开始处理前的排队时间（等待同一用户的前序更新和并发名额）"
+)
+
+
+def instrument_handler(name: str, callback: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """包装 Update 处理器，记录耗时和异常"""
+    hist = HANDLER_LATENCY.child(handler=name)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            hist.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def _statement_kind(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+def instrument_engine(engine):
+    """为同步 Engine（异步引擎传入 engine.sync_engine）注册 SQL 和连接池的计时"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if starts:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - starts.pop(), statement=_statement_kind(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    # 连接池事件注册在 Engine 上，engine.dispose() 重建连接池后仍然有效
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checkout_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        checkout_at = connection_record.info.pop("checkout_at", None)
+        if checkout_at is not None:
+            DB_POOL_HELD.observe(time.perf_counter() - checkout_at)
+
+    # 建立新连接的耗时：方言开始建立连接（do_connect）到连接池收到新连接（connect）。
+    # SQLAlchemy 没有"开始取连接"的事件，取连接的等待时间不单独统计，连接池是否用满见 db_pool_* 状态
+    @event.listens_for(engine, "do_connect")
+    def do_connect(dialect, connection_record, cargs, cparams):
+        connection_record.info["connect_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        start = connection_record.info.pop("connect_start", None)
+        if start is not None:
+            DB_CONNECT.observe(time.perf_counter() - start)
+
+    def collect_pool() -> Iterator[Gauge]:
+        current = engine.pool
+        status = {
+            "size": getattr(current, "size", None),
+            "checked_out": getattr(current, "checkedout", None),
+            "overflow": getattr(current, "overflow", None),
+            "checked_in": getattr(current, "checkedin", None),
+        }
+        for key, fn in status.items():
+            if callable(fn):
+                gauge = Gauge(f"db_pool_{key}", f"连接池状态: {key}")
+                gauge.set(fn())
+                yield gauge
+
+    registry.add_collector(collect_pool, "db_pool")
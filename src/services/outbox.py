@@ -0,0 +1,305 @@
+import asyncio
+import os
+import sys
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Hashable, List, Optional, Set, Tuple
+import logging
+
+from telegram import Bot, CallbackQuery
+from telegram.error import BadRequest, RetryAfter
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """令牌桶限流器"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated: Optional[float] = None
+
+    def _refill(self, now: float):
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """距离可以取到一个令牌还需等待的秒数"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        """取走一个令牌"""
+        self._refill(now)
+        self.tokens -= 1
+
+
+@dataclass
+class _Operation:
+    """一次待发送的 Bot API 调用"""
+    method: str  # send_message / edit_message_text / answer_callback_query
+    kwargs: Dict[str, Any]
+    futures: List[asyncio.Future] = field(default_factory=list)
+    edit_key: Optional[Tuple[int, int]] = None  # (chat_id, message_id)，仅编辑操作
+    attempts: int = 0
+
+
+@dataclass
+class _ChatState:
+    """单个聊天的发送队列和限流状态"""
+    bucket: Optional[TokenBucket]  # None 表示不受每个聊天的频率限制（回调应答）
+    queue: Deque[_Operation] = field(default_factory=deque)
+    blocked_until: float = 0.0  # 收到 RetryAfter 后暂停到该时间
+    inflight: bool = False
+
+
+class OutboundScheduler:
+    """Telegram 发送队列
+
+    - 全局和每个聊天各一个令牌桶，避免触发 Telegram 的频率限制
+    - 同一条消息排队中的多次编辑合并为最后一次
+    - 收到 RetryAfter 时暂停该聊天并稍后重发，不在处理器中 sleep
+    - 同一聊天内的消息按顺序发送，不同聊天之间并行
+    - 按钮回调的应答（answer_callback_query）按用户单独排队，只占用全局令牌，不排在消息后面
+
+    send_message / edit_message_text / answer_callback_query 立即返回 Future，需要结果时可 await。
+    """
+
+    # 聊天状态数量超过该值时清理空闲的聊天
+    MAX_IDLE_CHATS = 1024
+
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 3
+    ):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        # 队列的键为 chat_id，回调应答为 ("callback", user_id)
+        self._chats: Dict[Hashable, _ChatState] = {}
+        self._pending_edits: Dict[Tuple[int, int], _Operation] = {}
+        self._ready: Deque[Hashable] = deque()
+        self._ready_set: Set[Hashable] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self._stopping = False
+
+        # 统计信息
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failed = 0
+
+    async def start(self):
+        """启动发送任务"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="outbound-scheduler")
+
+    async def stop(self, timeout: float = 10.0):
+        """停止发送任务（尽量发送完队列中的消息）"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            logger.warning("发送队列停止超时，丢弃 %s 条消息", self.queue_depth)
+        self._task = None
+
+    def send_message(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """排队发送消息"""
+        return self._enqueue(chat_id, _Operation("send_message", dict(chat_id=chat_id, text=text, **kwargs)))
+
+    def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs) -> asyncio.Future:
+        """排队编辑消息；同一消息尚未发出的编辑会被合并为最新的一次"""
+        key = (chat_id, message_id)
+        op_kwargs = dict(chat_id=chat_id, message_id=message_id, text=text, **kwargs)
+
+        queued = self._pending_edits.get(key)
+        if queued is not None:
+            queued.kwargs = op_kwargs
+            future = asyncio.get_running_loop().create_future()
+            future.add_done_callback(_consume_exception)
+            queued.futures.append(future)
+            self.coalesced += 1
+            return future
+
+        op = _Operation("edit_message_text", op_kwargs, edit_key=key)
+        self._pending_edits[key] = op
+        return self._enqueue(chat_id, op)
+
+    def edit_callback_message(self, query: CallbackQuery, text: str, **kwargs) -> asyncio.Future:
+        """排队编辑按钮所在的消息（见 edit_message_text）"""
+        return self.edit_message_text(query.message.chat_id, query.message.message_id, text, **kwargs)
+
+    def answer_callback_query(self, query: CallbackQuery, **kwargs) -> asyncio.Future:
+        """排队应答按钮回调（按用户排队，不受每个聊天的频率限制）"""
+        op = _Operation("answer_callback_query", dict(callback_query_id=query.id, **kwargs))
+        return self._enqueue(("callback", query.from_user.id), op, chat_limited=False)
+
+    @property
+    def queue_depth(self) -> int:
+        """排队中的操作总数"""
+        return sum(len(state.queue) for state in self._chats.values() if state.queue)
+
+    def stats(self) -> Dict[str, Any]:
+        """队列统计信息"""
+        return {
+            "queue_depth": self.queue_depth,
+            "chats_waiting": sum(1 for state in self._chats.values() if state.queue),
+            "inflight": len(self._inflight),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+    def _enqueue(self, chat_id: Hashable, op: _Operation, chat_limited: bool = True) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        op.futures.append(future)
+
+        state = self._chats.get(chat_id)
+        if state is None:
+            if len(self._chats) >= self.MAX_IDLE_CHATS:
+                self._prune_idle()
+            bucket = TokenBucket(self.chat_rate, self.chat_burst) if chat_limited else None
+            state = self._chats[chat_id] = _ChatState(bucket)
+        state.queue.append(op)
+        self._make_ready(chat_id)
+        return future
+
+    def _prune_idle(self):
+        """移除空闲且令牌已回满的聊天状态（移除后重新创建不会放宽限流）"""
+        now = asyncio.get_running_loop().time()
+        for chat_id in [
+            chat_id for chat_id, state in self._chats.items()
+            if not state.queue and not state.inflight and state.blocked_until <= now
+            and (state.bucket is None or state.bucket.delay(now) == 0 and state.bucket.tokens >= state.bucket.capacity)
+        ]:
+            del self._chats[chat_id]
+
+    def _make_ready(self, chat_id: Hashable):
+        """聊天有待发送的操作且没有正在发送时，加入就绪队列"""
+        state = self._chats.get(chat_id)
+        if state is None or state.inflight or not state.queue or chat_id in self._ready_set:
+            return
+        self._ready.append(chat_id)
+        self._ready_set.add(chat_id)
+        self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            if not self._ready:
+                if self._stopping and not self._inflight and self.queue_depth == 0:
+                    break
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            chat_id = self._ready.popleft()
+            self._ready_set.discard(chat_id)
+            state = self._chats[chat_id]
+            if state.inflight or not state.queue:
+                continue
+
+            # 该聊天的令牌不足或处于 RetryAfter 暂停期：稍后再排入就绪队列
+            now = loop.time()
+            wait = state.blocked_until - now
+            if state.bucket is not None:
+                wait = max(wait, state.bucket.delay(now))
+            if wait > 0:
+                loop.call_later(wait, self._make_ready, chat_id)
+                continue
+
+            # 全局令牌不足：所有聊天一起等待
+            global_wait = self._global.delay(now)
+            if global_wait > 0:
+                await asyncio.sleep(global_wait)
+                now = loop.time()
+
+            if state.bucket is not None:
+                state.bucket.consume(now)
+            self._global.consume(now)
+
+            op = state.queue.popleft()
+            if op.edit_key is not None:
+                self._pending_edits.pop(op.edit_key, None)
+            state.inflight = True
+
+            task = asyncio.create_task(self._execute(chat_id, state, op))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, chat_id: Hashable, state: _ChatState, op: _Operation):
+        loop = asyncio.get_running_loop()
+        op.attempts += 1
+        try:
+            result = await getattr(self.bot, op.method)(**op.kwargs)
+        except RetryAfter as e:
+            if op.attempts <= self.max_retries:
+                self.retries += 1
+                state.blocked_until = loop.time() + _seconds(e.retry_after)
+                state.queue.appendleft(op)
+                if op.edit_key is not None and op.edit_key not in self._pending_edits:
+                    self._pending_edits[op.edit_key] = op
+                logger.warning("聊天 %s 触发频率限制，%.0f 秒后重发", chat_id, _seconds(e.retry_after))
+            else:
+                self._fail(op, e)
+        except Exception as e:
+            self._fail(op, e)
+        else:
+            self.sent += 1
+            for future in op.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            state.inflight = False
+            # 先移出 _inflight 再唤醒：停止时 _run 据此判断是否已发送完毕（完成回调要晚一轮才执行）
+            self._inflight.discard(asyncio.current_task())
+            self._make_ready(chat_id)
+            self._wakeup.set()
+
+    def _fail(self, op: _Operation, error: Exception):
+        if isinstance(error, BadRequest) and "not modified" in str(error).lower():
+            # 编辑的内容与原消息相同（如重复点击同一菜单），不算发送失败
+            logger.debug("消息内容未变化（%s）: %s", op.method, error)
+        else:
+            self.failed += 1
+            logger.error("发送失败（%s）: %s", op.method, error)
+        for future in op.futures:
+            if not future.done():
+                future.set_exception(error)
+
+
+def _seconds(retry_after) -> float:
+    """RetryAfter.retry_after 在不同版本中可能是 int 或 timedelta"""
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+def _consume_exception(future: asyncio.Future):
+    """标记异常已被读取：不 await 结果的调用方不会触发 "exception was never retrieved" 警告"""
+    if not future.cancelled():
+        future.exception()
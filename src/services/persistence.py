@@ -0,0 +1,258 @@
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import logging
+
+from sqlalchemy import delete, select
+from telegram.ext import BasePersistence, PersistenceInput
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.database.models import AsyncDatabase, ConversationState, dialect_insert
+from src.handlers.context import BotData
+
+logger = logging.getLogger(__name__)
+
+# (kind, key)，kind 为 user / chat / bot
+StateKey = Tuple[str, int]
+
+# bot_data 在表中的 key
+BOT_DATA_KEY = 0
+
+# 每条 INSERT 写入的最大行数
+UPSERT_CHUNK_SIZE = 500
+
+
+class DatabasePersistence(BasePersistence[Dict[Any, Any], Dict[Any, Any], BotData]):
+    """把 user_data / chat_data / bot_data 保存在数据库的 conversation_state 表中
+
+    Application 每隔 update_interval 秒把有更新的用户、聊天的数据交给 update_*_data，
+    这里只在内存中暂存（内容与上次写入相同的直接跳过），本轮交接完成后由后台任务
+    用批量 upsert 一次写入，处理更新时不访问数据库。写入失败时后台任务按指数退避
+（retry_delay 起，最长 max_retry_delay 秒）重试，期间新暂存的数据并入下一次写入。
+停止时 Application 调用 flush 写入剩余数据。
+
+    数据以 JSON 保存，字典的整数键读回后会变成字符串；无法序列化的值不会保存。
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        update_interval: float = 10,
+        ready: Optional[Callable[[], Awaitable[Any]]] = None,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 60.0
+    ):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.db = db
+        # 读取前等待数据库初始化完成（Application.initialize 与数据库初始化并行执行）
+        self._ready = ready
+        self._loaded: Optional[Dict[str, Dict[int, Any]]] = None
+        # 待写入的数据（None 表示删除）
+        self._pending: Dict[StateKey, Optional[str]] = {}
+        # 上次写入（或启动时读取）的内容，用于跳过未变化的数据
+        self._written: Dict[StateKey, str] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        # flush 时设置，后台任务不再等待重试
+        self._closing = asyncio.Event()
+
+        # 统计信息
+        self.written = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.batches = 0
+        self.failed = 0
+
+    # ---- 读取（Application.initialize 时调用一次） ----
+
+    async def _load(self) -> Dict[str, Dict[int, Any]]:
+        if self._loaded is None:
+            if self._ready is not None:
+                await self._ready()
+            loaded: Dict[str, Dict[int, Any]] = {"user": {}, "chat": {}, "bot": {}}
+            async with self.db.get_session() as session:
+                rows = await session.execute(select(ConversationState.kind, ConversationState.key, ConversationState.data))
+                for kind, key, data in rows:
+                    loaded.setdefault(kind, {})[key] = data
+                    self._written[(kind, key)] = _encode(data)
+            self._loaded = loaded
+            logger.info("已读取会话状态: %s 个用户，%s 个聊天", len(loaded["user"]), len(loaded["chat"]))
+        return self._loaded
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return dict((await self._load())["user"])
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return dict((await self._load())["chat"])
+
+    async def get_bot_data(self) -> BotData:
+        return BotData((await self._load())["bot"].get(BOT_DATA_KEY, {}))
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    # ---- 写入（只暂存，由后台任务批量写入） ----
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._stage(("user", user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._stage(("chat", chat_id), data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        self._stage(("bot", BOT_DATA_KEY), data)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage(("user", user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._stage(("chat", chat_id), None)
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: Tuple[Any, ...], new_state: Optional[object]) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: BotData) -> None:
+        pass
+
+    def _stage(self, key: StateKey, data: Optional[Dict[Any, Any]]):
+        if data is None:
+            if key not in self._written and key not in self._pending:
+                return
+            self._pending[key] = None
+        else:
+            encoded = _encode(data, key)
+            if self._written.get(key) == encoded:
+                self._pending.pop(key, None)
+                self.unchanged += 1
+                return
+            self._pending[key] = encoded
+
+        # Application 在同一轮中并发调用各 update_*_data，它们都已排在这个任务之前，
+        # 任务开始时本轮的数据已全部暂存，合并为一批写入
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._write_pending(), name="persistence-flush")
+
+    async def _write_pending(self):
+        failures = 0
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                await self._write(batch)
+                failures = 0
+            except Exception as e:
+                self.failed += 1
+                # 放回未被更新数据覆盖的条目
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)
+                if self._closing.is_set():
+                    logger.error("会话状态写入失败（%s 条）: %s", len(batch), e)
+                    return
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** failures)
+                failures += 1
+                logger.error("会话状态写入失败（%s 条，%.1f 秒后重试）: %s", len(batch), delay, e)
+                try:
+                    await asyncio.wait_for(self._closing.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _write(self, batch: Dict[StateKey, Optional[str]]):
+        now = datetime.utcnow()
+        rows = [
+            {"kind": kind, "key": key, "data": json.loads(value), "updated_at": now}
+            for (kind, key), value in batch.items() if value is not None
+        ]
+        drops: Dict[str, List[int]] = {}
+        for (kind, key), value in batch.items():
+            if value is None:
+                drops.setdefault(kind, []).append(key)
+
+        insert = dialect_insert(self.db.engine.dialect.name)
+        async with self.db.get_session() as session:
+            for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                stmt = insert(ConversationState).values(rows[i:i + UPSERT_CHUNK_SIZE])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[ConversationState.kind, ConversationState.key],
+                    set_={"data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at}
+                )
+                await session.execute(stmt)
+            for kind, keys in drops.items():
+                await session.execute(
+                    delete(ConversationState).where(ConversationState.kind == kind, ConversationState.key.in_(keys))
+                )
+            await session.commit()
+
+        for key, value in batch.items():
+            if value is None:
+                self._written.pop(key, None)
+            else:
+                self._written[key] = value
+        self.written += len(rows)
+        self.deleted += sum(len(keys) for keys in drops.values())
+        self.batches += 1
+        logger.debug("会话状态已写入: %s 条，删除 %s 条", len(rows), len(batch) - len(rows))
+
+    async def flush(self) -> None:
+        """写入所有暂存的数据（Application.shutdown 时调用）"""
+        self._closing.set()
+        if self._flush_task is not None:
+            await self._flush_task
+            self._flush_task = None
+        await self._write_pending()
+        if self._pending:
+            logger.warning("停止时仍有 %s 条会话状态未能写入", len(self._pending))
+
+    @property
+    def pending(self) -> int:
+        """等待写入的条数"""
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        """持久化统计信息"""
+        return {
+            "pending": self.pending,
+            "written": self.written,
+            "deleted": self.deleted,
+            "unchanged": self.unchanged,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
+
+
+def _encode(data: Dict[Any, Any], key: Optional[StateKey] = None) -> str:
+    """规范化的 JSON（键排序，内容相同则字符串相同）；跳过无法序列化的值"""
+    # JSON 的键只能是字符串，先统一转换（整数键和字符串键混用时也能排序）
+    data = {str(k): v for k, v in data.items()}
+    try:
+        return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError):
+        pass
+
+    serializable = {}
+    for k, v in data.items():
+        try:
+            json.dumps({k: v}, sort_keys=True)
+        except (TypeError, ValueError):
+            logger.warning("会话状态 %s 中的 %r 无法序列化，不会保存", key, k)
+            continue
+        serializable[k] = v
+    return json.dumps(serializable, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
@@ -0,0 +1,249 @@
+"""物品历史价格统计
+
+item_price_stats 表按 (物品名称, 品级) 保存价格的次数、最小/最大值、均值和方差（Welford 算法），
+保存新快照时在同一事务中用一条 upsert 增量合并（见 ShopService.save_shop_snapshot），
+展示商店时按主键读取即可，不需要扫描 shop_items。
+
+统计表上线前已有的快照用回填命令一次性重建（逐批读取 shop_items，没有明细的旧快照读取 snapshot_data，
+内存占用与物品种类数成正比；回填期间锁住统计表，建议停止 Bot 后运行）：
+
+    python -m src.services.price_stats --backfill
+"""
+
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import case, delete, exists, insert, select, text, tuple_
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.database.models import Database, ItemPriceStats, ShopItem, ShopSnapshot, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+# (物品名称, 品级)
+PriceKey = Tuple[str, str]
+
+# 回填时每批读取的行数
+BACKFILL_BATCH_SIZE = 5000
+
+# 每条 INSERT 写入的最大行数
+INSERT_CHUNK_SIZE = 500
+
+
+def price_key(name: str, rarity: Optional[str]) -> PriceKey:
+    """统计表的主键（没有品级的物品记为空字符串）"""
+    return name, rarity or ""
+
+
+@dataclass
+class PriceAggregate:
+    """一组价格的统计量（Welford 算法逐个加入）"""
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    last_seen_at: Optional[datetime] = None
+
+    def add(self, price: int, seen_at: Optional[datetime] = None):
+        """Welford 算法加入一个价格"""
+        self.count += 1
+        delta = price - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (price - self.mean)
+        self.min_price = price if self.min_price is None else min(self.min_price, price)
+        self.max_price = price if self.max_price is None else max(self.max_price, price)
+        if seen_at is not None and (self.last_seen_at is None or seen_at > self.last_seen_at):
+            self.last_seen_at = seen_at
+
+    def row(self, key: PriceKey, now: datetime) -> Dict[str, Any]:
+        """item_price_stats 表的行数据"""
+        return {
+            "name": key[0],
+            "rarity": key[1],
+            "count": self.count,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "mean": self.mean,
+            "m2": self.m2,
+            "last_seen_at": self.last_seen_at,
+            "updated_at": now,
+        }
+
+
+def aggregate_items(items: Iterable[Dict[str, Any]], seen_at: datetime) -> Dict[PriceKey, PriceAggregate]:
+    """按 (名称, 品级) 汇总一个快照中的物品价格（同一物品出现多次时先在内存中合并）"""
+    aggregates: Dict[PriceKey, PriceAggregate] = {}
+    for item in items:
+        price = item.get("price")
+        if price is None or not item.get("name"):
+            continue
+        key = price_key(item["name"], item.get("rarity"))
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregate = aggregates[key] = PriceAggregate()
+        aggregate.add(price, seen_at)
+    return aggregates
+
+
+def price_stats_rows(aggregates: Dict[PriceKey, PriceAggregate]) -> List[Dict[str, Any]]:
+    """price_stats_upsert 的参数（按主键排序，并发的 upsert 以相同顺序加锁，不会死锁）"""
+    now = datetime.utcnow()
+    return [aggregates[key].row(key, now) for key in sorted(aggregates)]
+
+
+@lru_cache(maxsize=None)
+def price_stats_upsert(dialect_name: str):
+    """把一批统计量（price_stats_rows）合并进 item_price_stats 的 upsert 语句（RETURNING 合并后的行）
+
+    合并在数据库中完成（Chan 等人的并行方差公式），并发保存的快照不会互相覆盖。
+    语句与行数无关，只构造一次；多行参数由 SQLAlchemy 合并为多值 INSERT 执行。
+    """
+    stmt = dialect_insert(dialect_name)(ItemPriceStats)
+    new = stmt.excluded
+    old = ItemPriceStats.__table__.c
+    # 左操作数都是浮点数，PostgreSQL 上不会变成整数除法
+    delta = new.mean - old.mean
+    total = old["count"] + new["count"]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ItemPriceStats.name, ItemPriceStats.rarity],
+        set_={
+            "count": total,
+            "mean": old.mean + delta * new["count"] / total,
+            "m2": old.m2 + new.m2 + delta * delta * old["count"] * new["count"] / total,
+            "min_price": case(
+                (old.min_price.is_(None), new.min_price),
+                (new.min_price < old.min_price, new.min_price),
+                else_=old.min_price
+            ),
+            "max_price": case(
+                (old.max_price.is_(None), new.max_price),
+                (new.max_price > old.max_price, new.max_price),
+                else_=old.max_price
+            ),
+            "last_seen_at": case(
+                (old.last_seen_at.is_(None), new.last_seen_at),
+                (new.last_seen_at > old.last_seen_at, new.last_seen_at),
+                else_=old.last_seen_at
+            ),
+            "updated_at": new.updated_at,
+        }
+    )
+    return stmt.returning(ItemPriceStats)
+
+
+def price_stats_query(keys: Iterable[PriceKey]):
+    """按主键读取统计"""
+    return select(ItemPriceStats).where(tuple_(ItemPriceStats.name, ItemPriceStats.rarity).in_(list(keys)))
+
+
+def _lock_for_backfill(session):
+    """回填前锁住统计表，回填期间保存快照的 upsert 等待回填提交后再合并
+
+    PostgreSQL 用 EXCLUSIVE 锁：已开始的保存先提交（其物品会被回填读到），之后开始的保存
+    在 upsert 处等待，其物品在回填读取时尚未提交，不会被读到，提交后再合并，不重不漏。
+    SQLite 先执行删除取得写锁，其他写入在回填提交前等待。
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("LOCK TABLE item_price_stats IN EXCLUSIVE MODE"))
+    session.execute(delete(ItemPriceStats))
+
+
+def backfill(db: Database, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """由已有的快照重建 item_price_stats（整个重建在一个事务中完成）
+
+    有明细的快照读取 shop_items；shop_items 上线前保存的快照没有明细，读取其 snapshot_data 中的物品列表。
+    回填期间统计表被锁住（见 _lock_for_backfill），保存快照会等待，建议在停止 Bot 时运行。
+
+    Returns:
+        统计的物品种类数
+    """
+    aggregates: Dict[PriceKey, PriceAggregate] = {}
+    rows_read = 0
+    snapshots_read = 0
+    started = time.perf_counter()
+
+    def add(name: str, rarity: Optional[str], price: int, seen_at: Optional[datetime]):
+        key = price_key(name, rarity)
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregate = aggregates[key] = PriceAggregate()
+        aggregate.add(price, seen_at)
+
+    with db.get_session() as session:
+        _lock_for_backfill(session)
+
+        query = (
+            select(ShopItem.name, ShopItem.rarity, ShopItem.current_price, ShopItem.created_at)
+            .where(ShopItem.current_price.isnot(None))
+            .execution_options(yield_per=batch_size)
+        )
+        for partition in session.execute(query).partitions():
+            for name, rarity, price, created_at in partition:
+                add(name, rarity, price, created_at)
+            rows_read += len(partition)
+            logger.info("已读取 %s 条物品记录", rows_read)
+
+        # 没有 shop_items 明细的快照（shop_items 上线前保存）
+        query = (
+            select(ShopSnapshot.snapshot_data, ShopSnapshot.created_at)
+            .where(~exists().where(ShopItem.snapshot_id == ShopSnapshot.id))
+            .execution_options(yield_per=batch_size)
+        )
+        for partition in session.execute(query).partitions():
+            for snapshot_data, created_at in partition:
+                for item in (snapshot_data or {}).get("items", []):
+                    if item.get("price") is not None and item.get("name"):
+                        add(item["name"], item.get("rarity"), item["price"], created_at)
+            snapshots_read += len(partition)
+            logger.info("已读取 %s 个没有物品明细的快照", snapshots_read)
+
+        now = datetime.utcnow()
+        rows: List[Dict[str, Any]] = [aggregate.row(key, now) for key, aggregate in aggregates.items()]
+        for i in range(0, len(rows), INSERT_CHUNK_SIZE):
+            session.execute(insert(ItemPriceStats), rows[i:i + INSERT_CHUNK_SIZE])
+        session.commit()
+
+    logger.info(
+        "价格统计回填完成: %s 条物品记录，%s 个旧快照，%s 种物品，耗时 %.1f 秒",
+        rows_read, snapshots_read, len(aggregates), time.perf_counter() - started
+    )
+    return len(aggregates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="物品历史价格统计")
+    parser.add_argument("--backfill", action="store_true", help="由已有的商店快照重建价格统计表")
+    parser.add_argument("--db-url", help="数据库地址（默认读取配置文件）")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="每批读取的行数")
+    args = parser.parse_args(argv)
+
+    if not args.backfill:
+        parser.print_help()
+        return
+
+    from src.utils.config import config
+    from src.utils.logger import setup_logging
+    setup_logging()
+
+    db = Database(args.db_url or config.db_url, config.db_pool_options)
+    try:
+        db.init_db()
+        backfill(db, args.batch_size)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedShop:
+    """缓存的商店（已解析的物品和渲染好的展示内容）"""
+    snapshot_id: int
+    items: List[Dict[str, Any]]
+    display_text: str
+    keyboard: Any  # InlineKeyboardMarkup
+    expires_at: Optional[datetime] = None  # 商店刷新时间，到期后自动失效
+
+
+class ShopCache:
+    """用户最新商店的进程内 LRU 缓存
+
+    - 按用户 ID 缓存最新快照及其渲染结果，重复查看无需访问数据库
+    - 保存快照的事务提交后由商店处理器失效并放入新的渲染结果（shop_handler.parse_shop_input）
+    - 到达快照的刷新时间后自动过期
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, CachedShop]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, user_id: int, now: Optional[datetime] = None) -> Optional[CachedShop]:
+        """获取缓存的商店，未命中或已过期返回 None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry.expires_at is not None and entry.expires_at <= (now or datetime.now()):
+                del self._entries[user_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+    def peek(self, user_id: int) -> Optional[CachedShop]:
+        """获取缓存的商店，包括已过期的（不计入命中统计，用于与新快照对比）"""
+        with self._lock:
+            return self._entries.get(user_id)
+
+    def put(self, user_id: int, entry: CachedShop):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        """使用户的缓存失效"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
@@ -0,0 +1,22 @@
+import os
+import sys
+import time
+from typing import Any, Dict
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.services.metrics import PARSER_CHARS, PARSER_ITEMS, PARSER_LATENCY
+from src.utils.shop_parser import ShopParser
+
+
+def parse_shop_text(shop_text: str) -> Dict[str, Any]:
+    """解析商店文本（ShopParser.parse_shop_text），记录解析耗时、物品数和字符数"""
+    start = time.perf_counter()
+    shop_data = ShopParser().parse_shop_text(shop_text)
+    PARSER_LATENCY.observe(time.perf_counter() - start)
+    PARSER_ITEMS.inc(shop_data["count"])
+    PARSER_CHARS.inc(len(shop_text))
+    return shop_data
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+from typing import Optional, Tuple
+
+from telegram.request import HTTPXRequest, RequestData
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.services.metrics import TELEGRAM_API_ERRORS, TELEGRAM_API_LATENCY
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """记录每个 Bot API 方法的请求耗时和失败数的 HTTPXRequest
+
+    通过 Application.builder().request(...) / .get_updates_request(...) 使用。
+    """
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        **kwargs
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, **kwargs)
+        except Exception as e:
+            TELEGRAM_API_ERRORS.inc(method=api_method, reason=type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_API_LATENCY.observe(time.perf_counter() - start, method=api_method)
+        if code >= 400:
+            TELEGRAM_API_ERRORS.inc(method=api_method, reason=str(code))
+        return code, payload
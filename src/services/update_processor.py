@@ -0,0 +1,157 @@
+import asyncio
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.services.metrics import UPDATE_QUEUE_WAIT
+
+
+@dataclass
+class _UserSlot:
+    """一个用户正在处理和排队中的更新"""
+    lock: asyncio.Lock
+    refs: int = 0
+
+
+@dataclass
+class _UserWait:
+    """一个用户的排队时间统计"""
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """按用户串行、用户之间并行的更新处理器
+
+    不同用户的更新最多同时处理 max_concurrent_updates 个；同一用户的更新按到达顺序逐个处理，
+    context.user_data 中的状态（如 awaiting_shop_input）不会被同一用户的并发更新打乱。
+    没有发送者的更新（如频道消息）和 unordered(user_id) 为真的用户（如游戏Bot：各条回复相互独立，
+    也不使用 user_data）的更新不排队，直接占用并发名额。
+
+    基类的信号量在 do_process_update 之前获取，若用它限制并发，同一用户排队的更新也会占住名额，
+    一个用户连续发送大量更新时会挡住其他用户。因此基类信号量只限制处理器中的更新总数
+    （max_pending_updates，含排队），实际并发由取得用户锁之后的 _running 限制。
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int,
+        max_pending_updates: int = 10000,
+        tracked_users: int = 1000,
+        unordered: Optional[Callable[[int], bool]] = None
+    ):
+        super().__init__(max_concurrent_updates)
+        self._unordered = unordered
+        # 基类信号量改为只限制处理器中的更新总数（见类说明），实际并发由 _running 限制
+        self._semaphore = asyncio.BoundedSemaphore(max(max_pending_updates, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._slots: Dict[int, _UserSlot] = {}
+        # 最近活跃用户的排队时间（只保留 tracked_users 个）
+        self._waits: "OrderedDict[int, _UserWait]" = OrderedDict()
+        self._tracked_users = tracked_users
+
+        self.active = 0
+        self.waiting = 0
+        self.processed = 0
+        self.max_wait = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _key(self, update: object) -> Optional[int]:
+        """按发送者串行；没有发送者时按聊天"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            user_id = update.effective_user.id
+            if self._unordered and self._unordered(user_id):
+                return None
+            return user_id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._key(update)
+        slot = None
+        if key is not None:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = _UserSlot(asyncio.Lock())
+            slot.refs += 1
+
+        enqueued = time.perf_counter()
+        self.waiting += 1
+        started = False
+        try:
+            # asyncio.Lock 按等待顺序唤醒，同一用户的更新按到达顺序处理
+            async with (slot.lock if slot else nullcontext()):
+                async with self._running:
+                    started = True
+                    self.waiting -= 1
+                    self.active += 1
+                    self._record_wait(key, time.perf_counter() - enqueued)
+                    try:
+                        await coroutine
+                    finally:
+                        self.active -= 1
+                        self.processed += 1
+        finally:
+            if not started:
+                # 排队时被取消（如 Application 停止），避免 "coroutine was never awaited" 警告
+                self.waiting -= 1
+                if asyncio.iscoroutine(coroutine):
+                    coroutine.close()
+            if slot is not None:
+                slot.refs -= 1
+                if not slot.refs:
+                    del self._slots[key]
+
+    def _record_wait(self, key: Optional[int], seconds: float):
+        UPDATE_QUEUE_WAIT.observe(seconds)
+        self.max_wait = max(self.max_wait, seconds)
+        if key is None:
+            return
+        wait = self._waits.pop(key, None) or _UserWait()
+        wait.count += 1
+        wait.total += seconds
+        wait.max = max(wait.max, seconds)
+        self._waits[key] = wait
+        if len(self._waits) > self._tracked_users:
+            self._waits.popitem(last=False)
+
+    def user_waits(self, top: int = 10) -> List[Dict[str, Any]]:
+        """排队时间总和最长的用户（只统计最近活跃的 tracked_users 个用户）"""
+        ranked = sorted(self._waits.items(), key=lambda item: item[1].total, reverse=True)[:top]
+        return [
+            {"user_id": user_id, "count": w.count, "total": w.total, "avg": w.total / w.count, "max": w.max}
+            for user_id, w in ranked
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """处理器统计信息"""
+        return {
+            "limit": self.max_concurrent_updates,
+            "active": self.active,
+            "waiting": self.waiting,
+            "users_queued": sum(1 for slot in self._slots.values() if slot.refs > 1),
+            "processed": self.processed,
+            "max_wait": self.max_wait,
+            "top_waiting_users": self.user_waits(),
+        }
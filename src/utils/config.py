@@ -1,8 +1,10 @@
 import os
 import sys
 import yaml
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, Optional
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
 import logging
 
 # 确保 src 模块可以被导入
@@ -13,57 +15,158 @@ if project_root not in sys.path:
 logger = logging.getLogger(__name__)
 
 
+def _freeze(value: Any) -> Any:
+    """把 YAML 解析结果转换为只读结构（dict -> MappingProxyType，list -> tuple）"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _flatten(data: Mapping[str, Any], prefix: str = "", out: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """展开为点记法键 -> 值的映射，中间层级也保留（如 telegram、telegram.bot_token）"""
+    if out is None:
+        out = {}
+    for k, v in data.items():
+        key = f"{prefix}{k}"
+        out[key] = v
+        if isinstance(v, Mapping):
+            _flatten(v, f"{key}.", out)
+    return out
+
+
+def _optional_int(value: Any) -> Optional[int]:
+    return int(value) if value else None
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """某一时刻配置文件内容的只读快照
+
+    点记法键在加载时一次性展开，get 只是一次字典查找。
+    热路径上常用的值另外解析为带类型的字段。
+    """
+    values: Mapping[str, Any] = field(default_factory=dict)
+    mtime: Optional[float] = None
+
+    # 游戏机器人（按消息读取，修改配置文件后无需重启即可生效）
+    game_bot_user_id: Optional[int] = None
+    game_bot_username: str = "美奈"
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], mtime: Optional[float] = None) -> "ConfigSnapshot":
+        values = _flatten(_freeze(data or {}))
+        return cls(
+            values=MappingProxyType(values),
+            mtime=mtime,
+            game_bot_user_id=_optional_int(
+                values.get("telegram.game_bot_user_id") or values.get("telegram.game_bot_id")
+            ),
+            game_bot_username=values.get("telegram.game_bot_username") or "美奈",
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """获取配置值，支持点记法（如 telegram.bot_token）"""
+        value = self.values.get(key)
+        return value if value is not None else default
+
+
 class ConfigManager:
-    """配置管理器"""
+    """配置管理器
+
+    配置文件只在启动和文件变化时读取。当前内容保存在只读的 ConfigSnapshot 中，
+    reload_if_changed 检测到 mtime 变化后整体替换快照；需要多个一致的值时，
+    先取一次 snapshot 再从中读取。
+    """
 
     def __init__(self, config_path: str = "config/config.yaml"):
         self.config_path = Path(config_path)
         self.config: Dict[str, Any] = {}
+        self._snapshot = ConfigSnapshot()
+        self._failed_mtime: Optional[float] = None  # 解析失败的文件版本，不再重复尝试
         self._load_config()
 
+    def _mtime(self) -> Optional[float]:
+        try:
+            return self.config_path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+
     def _load_config(self):
         """加载配置文件"""
-        if not self.config_path.exists():
-            logger.warning(f"配置文件不存在: {self.config_path}")
-            logger.info(f"请复制 config/config.example.yaml 到 config/config.yaml 并填写配置")
+        mtime = self._mtime()
+        if mtime is None:
+            logger.warning("配置文件不存在: %s", self.config_path)
+            logger.info("请复制 config/config.example.yaml 到 config/config.yaml 并填写配置")
             return
 
         try:
             with open(self.config_path, "r", encoding="utf-8") as f:
-                self.config = yaml.safe_load(f) or {}
-            logger.info(f"成功加载配置文件: {self.config_path}")
+                data = yaml.safe_load(f) or {}
+            logger.info("成功加载配置文件: %s", self.config_path)
         except Exception as e:
-            logger.error(f"加载配置文件失败: {e}")
+            logger.error("加载配置文件失败: %s", e)
             raise
 
-    def get(self, key: str, default: Any = None) -> Any:
-        """获取配置值，支持点记法（如 telegram.bot_token）"""
-        keys = key.split(".")
-        value = self.config
+        self._swap(data, mtime)
 
-        for k in keys:
-            if isinstance(value, dict):
-                value = value.get(k)
-                if value is None:
-                    return default
-            else:
-                return default
+    def _swap(self, data: Dict[str, Any], mtime: Optional[float]):
+        # 先构建完整的新快照再替换引用，读取方不会看到一半新一半旧的配置
+        snapshot = ConfigSnapshot.from_dict(data, mtime)
+        self.config = data
+        self._snapshot = snapshot
 
-        return value if value is not None else default
+    def load_dict(self, data: Dict[str, Any]):
+        """用给定的配置内容替换当前配置（压测等不读取配置文件的场景使用）
+
+        配置文件此后再发生变化时，reload_if_changed 仍会用文件内容覆盖。
+        """
+        self._swap(data, self._mtime())
+
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """当前配置快照"""
+        return self._snapshot
+
+    def reload_if_changed(self) -> bool:
+        """配置文件的修改时间变化时重新加载
+
+        新文件解析失败时保留旧配置。
+
+        Returns:
+            是否加载了新配置
+        """
+        mtime = self._mtime()
+        if mtime is None or mtime in (self._snapshot.mtime, self._failed_mtime):
+            return False
+
+        try:
+            self._load_config()
+        except Exception:
+            self._failed_mtime = mtime
+            logger.warning("配置文件有误，继续使用之前的配置")
+            return False
+        logger.info("配置已重新加载: %s", self.config_path)
+        return True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """获取配置值，支持点记法（如 telegram.bot_token）"""
+        return self._snapshot.get(key, default)
 
-    def get_telegram_config(self) -> Dict[str, Any]:
+    def get_telegram_config(self) -> Mapping[str, Any]:
         """获取 Telegram 配置"""
         return self.get("telegram", {})
 
-    def get_database_config(self) -> Dict[str, Any]:
+    def get_database_config(self) -> Mapping[str, Any]:
         """获取数据库配置"""
         return self.get("database", {})
 
-    def get_app_config(self) -> Dict[str, Any]:
+    def get_app_config(self) -> Mapping[str, Any]:
         """获取应用配置"""
         return self.get("app", {})
 
-    def get_scheduler_config(self) -> Dict[str, Any]:
+    def get_scheduler_config(self) -> Mapping[str, Any]:
         """获取定时任务配置"""
         return self.get("scheduler", {})
 
@@ -98,6 +201,17 @@ class ConfigManager:
             url = f"postgresql://{user}:{password}@{host}:{port}/{dbname}"
         return url
 
+    @property
+    def db_pool_options(self) -> Dict[str, Any]:
+        """获取数据库连接池参数"""
+        db_config = self.get_database_config()
+        return {
+            "pool_size": db_config.get("pool_size"),
+            "max_overflow": db_config.get("max_overflow"),
+            "pool_recycle": db_config.get("pool_recycle"),
+            "pool_pre_ping": db_config.get("pool_pre_ping"),
+        }
+
     @property
     def log_level(self) -> str:
         """获取日志级别"""
@@ -124,6 +238,11 @@ class ConfigManager:
         """获取游戏机器人用户名"""
         return self.get("telegram.game_bot_username")
 
+    @property
+    def game_bot_user_id(self) -> Optional[int]:
+        """获取游戏机器人 User ID（未配置时使用 game_bot_id）"""
+        return self._snapshot.game_bot_user_id
+
 
 # 全局配置实例
 config = ConfigManager()
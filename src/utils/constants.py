@@ -0,0 +1,18 @@
+"""商店文本中的品级和物品类型（解析器和捡漏配置共用）"""
+
+# 品级映射
+RARITY_MAP = {
+    "凡品": "common",
+    "灵品": "spiritual",
+    "天品": "heavenly",
+    "帝品": "imperial",
+}
+
+# 物品类型
+ITEM_TYPES = {
+    "武器": "weapon",
+    "防具": "armor",
+    "丹药": "potion",
+    "功能丹": "functional_potion",
+    "物品": "item",
+}
@@ -1,6 +1,13 @@
+import atexit
+import copy
+import json
 import logging
 import logging.handlers
+import queue
+import random
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, Mapping, Optional
 import os
 import sys
 
@@ -11,28 +18,130 @@ if project_root not in sys.path:
 
 from src.utils.config import config
 
+# LogRecord 自带的属性，JSON 格式中不作为附加字段输出
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# 当前的后台写日志线程（重复调用 setup_logging 时先停止旧的）
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON
+
+    logger.info("用户 %s 点击了: %s", user_id, data, extra={"route": data}) 中，
+    extra 的字段会作为 JSON 的顶层字段输出，便于检索和统计。
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """按 logger 名称抽样 WARNING 以下的日志
+
+    rates 为 logger 名称 -> 保留比例（0~1），按最长的名称前缀匹配，
+    如 {"src.bot": 0.1} 同样作用于 src.bot 的子 logger。WARNING 及以上的日志总是保留。
+    """
+
+    def __init__(self, rates: Mapping[str, float]):
+        super().__init__()
+        self.rates = dict(rates)
+        self._resolved: Dict[str, Optional[float]] = {}
+        self.dropped = 0
+
+    def _rate(self, name: str) -> Optional[float]:
+        rate = self._resolved.get(name, False)
+        if rate is False:
+            rate = None
+            prefix = name
+            while prefix:
+                if prefix in self.rates:
+                    rate = float(self.rates[prefix])
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate is None or rate >= 1 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """把日志记录的快照放入队列
+
+    与标准的 QueueHandler.prepare 一样，在调用方线程中拼接 %-style 参数、把异常格式化为文本
+    （之后参数被修改也不影响日志内容，队列中也不会持有 traceback 的栈帧）；
+    但消息、异常文本仍分别保存在 msg 和 exc_text 中，由后台线程的 Formatter 按文本或 JSON 格式输出。
+    被抽样丢弃的记录不会进入这一步。
+    """
+
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
 
 def setup_logging():
-    """配置日志系统"""
+    """配置日志系统
+
+    处理器只向内存队列放入日志记录，按格式输出和文件、控制台的写入在后台线程中进行，
+    不会阻塞事件循环。
+    """
+    global _listener
+
     log_level = config.log_level
     log_file = config.log_file
-    
+    log_format = config.get("app.log_format", "text")
+
     # 创建日志目录
     Path(log_file).parent.mkdir(parents=True, exist_ok=True)
-    
+
     # 配置根日志器
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, log_level))
-    
+
     # 清除现有的处理器
+    stop_logging()
     root_logger.handlers.clear()
-    
+
     # 日志格式
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
+    if log_format == "json":
+        formatter = JsonLinesFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+
     # 文件处理器（轮转）
     file_handler = logging.handlers.RotatingFileHandler(
         log_file,
@@ -41,11 +150,36 @@ def setup_logging():
         encoding='utf-8'
     )
     file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
-    
+
     # 控制台处理器
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
-    
-    logging.info(f"日志系统已初始化，日志级别: {log_level}，日志文件: {log_file}")
+
+    # 调用方只把记录放入队列，由后台线程交给上面两个处理器
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(log_queue)
+    sampling = config.get("app.log_sampling")
+    if sampling:
+        queue_handler.addFilter(SamplingFilter(sampling))
+    root_logger.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
+
+    logging.info("日志系统已初始化，日志级别: %s，日志文件: %s，格式: %s", log_level, log_file, log_format)
+
+
+def stop_logging():
+    """停止后台写日志线程（写完队列中剩余的日志）"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -1,10 +1,30 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import ContextTypes
-from typing import List, Tuple
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from typing import Dict, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 购买按钮的 callback_data 前缀，后接按钮回调数据登记表（CallbackRegistry）的令牌
+BUY_CALLBACK_PREFIX = "buy_"
+
+
+def _build_keyboard(menu_items: List[Tuple[str, str]]) -> InlineKeyboardMarkup:
+    """每个按钮占一行的键盘"""
+    return InlineKeyboardMarkup([[InlineKeyboardButton(text, callback_data=callback)] for text, callback in menu_items])
+
+
+_BACK_SHOP_BUTTON = InlineKeyboardButton("🔙 返回商店菜单", callback_data="back_shop")
+
+
+def shop_button_key(item: dict) -> tuple:
+    """购买按钮携带的物品信息，相同时按钮可以沿用"""
+    return item.get("position", 0), item.get("name", ""), item.get("price", 0)
+
+
+def shop_buttons(items: List[dict], keyboard: InlineKeyboardMarkup) -> Dict[tuple, InlineKeyboardButton]:
+    """create_shop_items_keyboard 生成的键盘中每件物品的按钮（供下次生成时沿用）"""
+    return {shop_button_key(item): row[0] for item, row in zip(items, keyboard.inline_keyboard)}
+
 
 class MenuHelper:
     """菜单帮助类"""
@@ -58,25 +78,41 @@ class MenuHelper:
         ("🔙 返回主菜单", "back_main"),
     ]
 
+    # 固定菜单的键盘只构建一次（InlineKeyboardMarkup 创建后不可修改，可以安全共用）
+    MAIN_MENU_TEXT = "🎮 修仙游戏助手\n选择功能:"
+    MAIN_MENU_KEYBOARD = _build_keyboard(MAIN_MENU)
+
+    MENUS = {
+        "commands": ("📋 常用指令\n", _build_keyboard(COMMANDS_MENU)),
+        "equipment": ("⚔️ 装备系统\n", _build_keyboard(EQUIPMENT_MENU)),
+        "breakthrough": ("⚡ 突破系统\n", _build_keyboard(BREAKTHROUGH_MENU)),
+        "potion": ("💊 丹药系统\n", _build_keyboard(POTION_MENU)),
+        "shop": ("🏪 商店助手\n", _build_keyboard(SHOP_MENU)),
+    }
+
     @staticmethod
     def create_main_menu_keyboard() -> InlineKeyboardMarkup:
         """创建主菜单键盘"""
-        buttons = []
-        for text, callback in MenuHelper.MAIN_MENU:
-            buttons.append([InlineKeyboardButton(text, callback_data=callback)])
-        return InlineKeyboardMarkup(buttons)
+        return MenuHelper.MAIN_MENU_KEYBOARD
 
     @staticmethod
     def create_menu_keyboard(menu_items: List[Tuple[str, str]]) -> InlineKeyboardMarkup:
         """创建菜单键盘"""
-        buttons = []
-        for text, callback in menu_items:
-            buttons.append([InlineKeyboardButton(text, callback_data=callback)])
-        return InlineKeyboardMarkup(buttons)
+        return _build_keyboard(menu_items)
 
     @staticmethod
-    def create_shop_items_keyboard(items: List[dict]) -> InlineKeyboardMarkup:
-        """为商店物品创建购买按钮"""
+    def create_shop_items_keyboard(
+        items: List[dict],
+        registry,
+        reuse: Optional[Dict[tuple, InlineKeyboardButton]] = None
+    ) -> InlineKeyboardMarkup:
+        """为商店物品创建购买按钮
+
+        物品信息保存在 registry（按钮回调数据登记表，由处理器传入）中，按钮只携带短令牌（buy_<令牌>），
+        不受 callback_data 64 字节的限制。
+        reuse 为上一次生成的按钮（shop_button_key -> 按钮），位置、名称、价格都相同的物品直接沿用，不再登记新令牌；
+        沿用时刷新令牌的有效期，令牌已过期或被淘汰时重新登记。
+        """
         buttons = []
         
         for item in items:
@@ -84,41 +120,22 @@ class MenuHelper:
             position = item.get("position", 0)
             price = item.get("price", 0)
             
-            text = f"购买 {name} ({price}灵石)"
-            callback_data = f"buy_{position}_{name}"
+            button = reuse.get(shop_button_key(item)) if reuse else None
+            if button is not None and not registry.touch(button.callback_data[len(BUY_CALLBACK_PREFIX):]):
+                button = None
+            if button is None:
+                text = f"购买 {name} ({price}灵石)"
+                token = registry.register({"position": position, "name": name, "price": price})
+                button = InlineKeyboardButton(text, callback_data=BUY_CALLBACK_PREFIX + token)
             
-            buttons.append([InlineKeyboardButton(text, callback_data=callback_data)])
+            buttons.append([button])
         
         # 添加返回按钮
-        buttons.append([InlineKeyboardButton("🔙 返回商店菜单", callback_data="back_shop")])
+        buttons.append([_BACK_SHOP_BUTTON])
         
         return InlineKeyboardMarkup(buttons)
 
     @staticmethod
-    async def send_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """发送主菜单"""
-        message = "🎮 修仙游戏助手\n选择功能:"
-        await update.callback_query.edit_message_text(
-            text=message,
-            reply_markup=MenuHelper.create_main_menu_keyboard()
-        )
-
-    @staticmethod
-    async def send_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, menu_type: str):
-        """发送指定菜单"""
-        menus = {
-            "commands": ("📋 常用指令\n", MenuHelper.COMMANDS_MENU),
-            "equipment": ("⚔️ 装备系统\n", MenuHelper.EQUIPMENT_MENU),
-            "breakthrough": ("⚡ 突破系统\n", MenuHelper.BREAKTHROUGH_MENU),
-            "potion": ("💊 丹药系统\n", MenuHelper.POTION_MENU),
-            "shop": ("🏪 商店助手\n", MenuHelper.SHOP_MENU),
-        }
-        
-        if menu_type not in menus:
-            menu_type = "commands"
-        
-        title, menu_items = menus[menu_type]
-        await update.callback_query.edit_message_text(
-            text=title,
-            reply_markup=MenuHelper.create_menu_keyboard(menu_items)
-        )
+    def get_menu(menu_type: str) -> Tuple[str, InlineKeyboardMarkup]:
+        """菜单的标题和键盘（未知的菜单类型返回指令菜单）"""
+        return MenuHelper.MENUS.get(menu_type) or MenuHelper.MENUS["commands"]
@@ -0,0 +1,69 @@
+"""商店快照对比
+
+按 (名称, 品级, 类型) 把新旧两个物品列表对应起来（同名物品按出现顺序一一对应），
+一次哈希表构建加一次扫描，耗时与物品数成线性关系。
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Set, Tuple
+
+# (名称, 品级, 类型)
+ItemKey = Tuple[Any, Any, Any]
+
+
+def item_key(item: Dict[str, Any]) -> ItemKey:
+    """判断新旧快照中是否为同一件物品的键（不含位置和价格）"""
+    return item.get("name"), item.get("rarity"), item.get("type")
+
+
+@dataclass
+class ShopDiff:
+    """新快照相对上一个快照的变化"""
+    added: List[Dict[str, Any]] = field(default_factory=list)
+    removed: List[Dict[str, Any]] = field(default_factory=list)
+    price_changed: List[Tuple[Dict[str, Any], Dict[str, Any]]] = field(default_factory=list)  # (旧, 新)
+    unchanged: int = 0
+    # 新列表中新增物品的下标，以及价格变化物品的下标 -> 原价格（供展示时标注）
+    added_indexes: Set[int] = field(default_factory=set)
+    previous_prices: Dict[int, Any] = field(default_factory=dict)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed or self.price_changed)
+
+    def summary(self) -> str:
+        parts = []
+        if self.added:
+            parts.append(f"新增 {len(self.added)} 件")
+        if self.removed:
+            parts.append(f"下架 {len(self.removed)} 件")
+        if self.price_changed:
+            parts.append(f"{len(self.price_changed)} 件价格变化")
+        return "，".join(parts) if parts else "没有变化"
+
+
+def diff_items(old_items: List[Dict[str, Any]], new_items: List[Dict[str, Any]]) -> ShopDiff:
+    """对比两个物品列表"""
+    remaining: Dict[ItemKey, Deque[Dict[str, Any]]] = {}
+    for item in old_items:
+        remaining.setdefault(item_key(item), deque()).append(item)
+
+    diff = ShopDiff()
+    for index, item in enumerate(new_items):
+        candidates = remaining.get(item_key(item))
+        if not candidates:
+            diff.added.append(item)
+            diff.added_indexes.add(index)
+            continue
+        old = candidates.popleft()
+        if old.get("price") != item.get("price"):
+            diff.price_changed.append((old, item))
+            diff.previous_prices[index] = old.get("price")
+        else:
+            diff.unchanged += 1
+
+    # 没有对应上的旧物品，按原顺序列出
+    leftover = {id(item) for candidates in remaining.values() for item in candidates}
+    diff.removed = [item for item in old_items if id(item) in leftover]
+    return diff
@@ -1,10 +1,19 @@
+import io
 import re
-from typing import Dict, List, Any, Optional
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, Iterable, Iterator, Union
 from dataclasses import dataclass
 import logging
 
+from src.utils.constants import ITEM_TYPES, RARITY_MAP
+
+if TYPE_CHECKING:
+    from src.utils.shop_diff import ShopDiff
+
 logger = logging.getLogger(__name__)
 
+# 至少出现过这么多次的物品才标注历史均价（统计包含本次价格，次数太少时没有参考意义）
+MIN_PRICE_HISTORY = 3
+
 
 @dataclass
 class ShopItemData:
@@ -18,27 +27,74 @@ class ShopItemData:
     discount_percent: float
 
 
+def iter_lines(text: str) -> Iterator[str]:
+    """惰性地按行迭代文本（不构造完整的行列表）"""
+    return iter(io.StringIO(text))
+
+
 class ShopParser:
-    """商店文本解析器"""
-
-    # 品级映射
-    RARITY_MAP = {
-        "凡品": "common",
-        "灵品": "spiritual",
-        "天品": "heavenly",
-        "帝品": "imperial",
-    }
-
-    # 物品类型
-    ITEM_TYPES = {
-        "武器": "weapon",
-        "防具": "armor",
-        "丹药": "potion",
-        "功能丹": "functional_potion",
-        "物品": "item",
-    }
-
-    def parse_shop_text(self, shop_text: str) -> Dict[str, Any]:
+    """商店文本解析器
+
+    单遍扫描：逐行读取输入（字符串或任意行迭代器），同一次扫描中完成
+    物品提取和刷新时间识别。所有正则在类加载时编译一次，
+    每一行只被检查常数次，总耗时与输入长度成线性关系。
+    """
+
+    # 品级映射、物品类型（见 src/utils/constants.py）
+    RARITY_MAP = RARITY_MAP
+    ITEM_TYPES = ITEM_TYPES
+
+    # 物品行：数字. [品级] 物品名 (类型) [折扣]
+    # 物品名可以含括号（如 "流云琴(改)"），以行中最后一组 " (类型) [折扣]" 为准；
+    # 类型和折扣中不含括号，每个尝试位置最多扫描到下一个括号，单行匹配为线性时间
+    ITEM_PATTERN = re.compile(r'(\d+)\.\s*\[([^\]]+)\]\s+(.*\S)\s+\(([^()]+)\)\s*\[([^\[\]]+)\]')
+
+    # 价格行：价格: 342 灵石 (原价: 369)
+    PRICE_PATTERN = re.compile(r'价格:\s*(\d+)\s*灵石\s*\(原价:\s*(\d+)\)')
+
+    # 刷新时间：下次刷新时间: xxx
+    REFRESH_PATTERN = re.compile(r'下次刷新时间:\s*([^\n]+)')
+
+    # 折扣："7%折" 或 "+10%"
+    DISCOUNT_PATTERN = re.compile(r'([+-]?)(\d+(?:\.\d+)?)')
+
+    def __init__(self):
+        # 最近一次扫描中识别到的刷新时间
+        self.refresh_time: Optional[str] = None
+
+    def iter_items(self, lines: Iterable[str]) -> Iterator[ShopItemData]:
+        """逐行扫描并惰性产出物品
+
+        lines 可以是任意行迭代器（如文件对象、生成器），不会整体读入内存。
+        扫描过程中遇到的刷新时间保存在 self.refresh_time 中。
+        """
+        self.refresh_time = None
+        # 已匹配物品行、等待下一行价格信息
+        pending = None
+
+        for raw_line in lines:
+            line = raw_line.strip()
+
+            if pending is not None:
+                header, pending = pending, None
+                price_match = self.PRICE_PATTERN.search(line)
+                if price_match:
+                    yield self._build_item(header, price_match)
+                    continue
+
+            # 跳过标题和空行，顺带识别刷新时间
+            if not line or '===' in line or '提示:' in line:
+                continue
+            if '下次' in line:
+                if self.refresh_time is None:
+                    refresh_match = self.REFRESH_PATTERN.search(line)
+                    if refresh_match:
+                        self.refresh_time = refresh_match.group(1).strip()
+                continue
+
+            pending = self.ITEM_PATTERN.match(line)
+
+    def parse_shop_text(self, shop_text: Union[str, Iterable[str]]) -> Dict[str, Any]:
         """解析商店文本
         
         格式示例:
@@ -46,68 +102,40 @@ class ShopParser:
         1. [凡品] 流云琴 (武器) [7%折]
            价格: 342 灵石 (原价: 369)
         """
-        items = []
-        
-        # 分行处理
-        lines = shop_text.strip().split('\n')
+        lines = iter_lines(shop_text) if isinstance(shop_text, str) else shop_text
+        items = [self._item_to_dict(item) for item in self.iter_items(lines)]
         
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # 跳过标题和空行
-            if not line or '===' in line or '提示:' in line or '下次' in line:
-                i += 1
-                continue
-            
-            # 匹配物品行：数字. [品级] 物品名 (类型) [折扣]
-            match = re.match(r'(\d+)\.\s*\[([^\]]+)\]\s+(.+?)\s+\(([^)]+)\)\s*\[([^\]]+)\]', line)
-            
-            if match:
-                position = int(match.group(1))
-                rarity = match.group(2)
-                name = match.group(3).strip()
-                item_type = match.group(4).strip()
-                discount_str = match.group(5).strip()
-                
-                # 查找下一行的价格信息
-                if i + 1 < len(lines):
-                    price_line = lines[i + 1].strip()
-                    price_match = re.search(r'价格:\s*(\d+)\s*灵石\s*\(原价:\s*(\d+)\)', price_line)
-                    
-                    if price_match:
-                        current_price = int(price_match.group(1))
-                        original_price = int(price_match.group(2))
-                        
-                        # 解析折扣
-                        discount_percent = self._parse_discount(discount_str, current_price, original_price)
-                        
-                        item_data = ShopItemData(
-                            position=position,
-                            name=name,
-                            item_type=self.ITEM_TYPES.get(item_type, item_type),
-                            rarity=self.RARITY_MAP.get(rarity, rarity),
-                            price=current_price,
-                            original_price=original_price,
-                            discount_percent=discount_percent
-                        )
-                        items.append(item_data)
-                        i += 2
-                        continue
-            
-            i += 1
-        
-        return {
-            "items": [self._item_to_dict(item) for item in items],
+        result = {
+            "items": items,
             "count": len(items),
-            "raw_text": shop_text
+            "refresh_time": self.refresh_time,
         }
+        if isinstance(shop_text, str):
+            result["raw_text"] = shop_text
+        return result
+
+    def _build_item(self, header: "re.Match", price_match: "re.Match") -> ShopItemData:
+        """由物品行和价格行的匹配结果构建物品数据"""
+        position, rarity, name, item_type, discount_str = header.groups()
+        current_price = int(price_match.group(1))
+        original_price = int(price_match.group(2))
+        item_type = item_type.strip()
+
+        return ShopItemData(
+            position=int(position),
+            name=name.strip(),
+            item_type=self.ITEM_TYPES.get(item_type, item_type),
+            rarity=self.RARITY_MAP.get(rarity, rarity),
+            price=current_price,
+            original_price=original_price,
+            discount_percent=self._parse_discount(discount_str.strip(), current_price, original_price)
+        )
 
     @staticmethod
     def _parse_discount(discount_str: str, current_price: int, original_price: int) -> float:
         """解析折扣"""
         # 处理 "7%折" 或 "+10%" 的格式
-        match = re.search(r'([+-]?)(\d+(?:\.\d+)?)', discount_str)
+        match = ShopParser.DISCOUNT_PATTERN.search(discount_str)
         if match:
             sign = match.group(1)
             value = float(match.group(2))
@@ -142,20 +170,33 @@ class ShopParser:
     @staticmethod
     def extract_refresh_time(shop_text: str) -> Optional[str]:
         """提取下次刷新时间"""
-        match = re.search(r'下次刷新时间:\s*([^\n]+)', shop_text)
+        match = ShopParser.REFRESH_PATTERN.search(shop_text)
         if match:
             return match.group(1).strip()
         return None
 
     @staticmethod
-    def format_items_for_display(items: List[Dict[str, Any]]) -> str:
-        """格式化物品列表用于展示"""
+    def format_items_for_display(
+        items: List[Dict[str, Any]],
+        price_stats: Optional[Dict[Any, Any]] = None,
+        changes: Optional["ShopDiff"] = None
+    ) -> str:
+        """格式化物品列表用于展示
+
+        Args:
+            items: 物品列表
+            price_stats: 历史价格统计，(名称, 品级) -> ItemPriceStats（见 src/services/price_stats.py），
+                有足够历史记录的物品会标注与历史均价的差距
+            changes: 相对上一个快照的变化（见 src/utils/shop_diff.py），只标注新增、价格变化和下架的物品
+        """
         if not items:
             return "商店暂无物品"
         
         lines = ["📦 修仙商店物品列表\n"]
+        if changes is not None:
+            lines.insert(0, f"🔄 商店已更新：{changes.summary()}")
         
-        for item in items:
+        for index, item in enumerate(items):
             rarity_emoji = {
                 "common": "🟩",
                 "spiritual": "🟦", 
@@ -167,7 +208,20 @@ class ShopParser:
             discount_str = f"[{discount:+.0f}%]" if discount else ""
             
             line = f"{rarity_emoji} {item['position']}. {item['name']} ({item['type']})\n"
+            if changes is not None and index in changes.added_indexes:
+                line = "🆕 " + line
             line += f"   💰 {item['price']} 灵石 (原价: {item['original_price']}) {discount_str}"
+            if changes is not None and index in changes.previous_prices:
+                previous = changes.previous_prices[index]
+                arrow = "🔻" if previous is not None and item['price'] < previous else "🔺"
+                line += f"\n   {arrow} 上次 {previous} 灵石"
+            stats = price_stats.get((item['name'], item.get('rarity') or "")) if price_stats else None
+            if stats is not None and stats.count >= MIN_PRICE_HISTORY and stats.mean and item.get('price') is not None:
+                deviation = (item['price'] - stats.mean) / stats.mean * 100
+                line += f"\n   📊 历史均价 {stats.mean:.0f} ({deviation:+.0f}%)"
             lines.append(line)
         
+        if changes is not None and changes.removed:
+            lines.append("\n🗑️ 已下架: " + "、".join(item['name'] for item in changes.removed))
+        
         return "\n".join(lines)
@@ -0,0 +1,53 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+# 进程启动的参考时间点（导入本模块的时刻，main.py 最先导入）
+PROCESS_START = time.perf_counter()
+
+
+class StartupProfile:
+    """记录启动各阶段的耗时
+
+    阶段可以重叠（如 Telegram 初始化与数据库初始化并行），
+    报告中同时列出每个阶段相对进程启动的开始时间和耗时。
+    未启用时所有方法都是空操作。
+    """
+
+    def __init__(self, enabled: bool = False, origin: float = PROCESS_START):
+        self.enabled = enabled
+        self.origin = origin
+        self.phases: List[Tuple[str, float, float]] = []  # (名称, 开始, 结束)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """记录一个阶段（同步和异步代码中均可使用 with）"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start, time.perf_counter()))
+
+    def record(self, name: str, start: float, end: Optional[float] = None):
+        """记录一个已知开始时间的阶段（用于无法包在 with 中的阶段，如 run_polling 内部的初始化）"""
+        if self.enabled:
+            self.phases.append((name, start, end if end is not None else time.perf_counter()))
+
+    def report(self, total_end: Optional[float] = None) -> str:
+        """生成按开始时间排序的阶段耗时表"""
+        end = total_end if total_end is not None else time.perf_counter()
+        width = max([len(name) for name, _, _ in self.phases] + [8])
+        lines = [f"{'phase':<{width}}  {'start ms':>9}  {'took ms':>9}"]
+        for name, start, stop in sorted(self.phases, key=lambda p: p[1]):
+            lines.append(
+                f"{name:<{width}}  {(start - self.origin) * 1000:>9.1f}  {(stop - start) * 1000:>9.1f}"
+            )
+        lines.append(f"{'total':<{width}}  {0:>9.1f}  {(end - self.origin) * 1000:>9.1f}")
+        return "\n".join(lines)
+
+
+# 全局实例，由 main.py 根据 --startup-profile 启用
+startup_profile = StartupProfile()
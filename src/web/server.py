@@ -0,0 +1,102 @@
+import hmac
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+import logging
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+logger = logging.getLogger(__name__)
+
+# Telegram 在 webhook 请求中携带 secret_token 的请求头
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Web 备忘页面
+INDEX_PAGE = Path(project_root) / "web" / "index.html"
+
+
+class WebServer:
+    """进程内共享的 aiohttp HTTP 服务
+
+    webhook、Web 页面等 HTTP 接口都注册在同一个服务上（features.web_port），
+    路由需要在 start() 之前通过 add_route 注册。
+    """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 8080):
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self._runner: Optional[web.AppRunner] = None
+
+    def add_route(self, method: str, path: str, handler: Callable[[web.Request], Awaitable[web.StreamResponse]]):
+        """注册 HTTP 路由"""
+        self.app.router.add_route(method, path, handler)
+
+    def add_index_page(self):
+        """在 / 提供 Web 备忘页面"""
+        if INDEX_PAGE.exists():
+            async def index(request: web.Request) -> web.StreamResponse:
+                return web.FileResponse(INDEX_PAGE)
+            self.add_route("GET", "/", index)
+
+    async def start(self):
+        """启动 HTTP 服务"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info("HTTP 服务已启动: http://%s:%s", self.host, self.port)
+
+    async def stop(self):
+        """停止 HTTP 服务"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info("HTTP 服务已停止")
+
+
+def create_webhook_handler(application: Application, secret_token: Optional[str] = None):
+    """创建 webhook 请求处理函数：校验 secret_token 后把更新放入 Application 的更新队列"""
+
+    async def webhook(request: web.Request) -> web.Response:
+        if secret_token:
+            received = request.headers.get(SECRET_TOKEN_HEADER, "")
+            if not hmac.compare_digest(received, secret_token):
+                logger.warning("拒绝 secret_token 不匹配的 webhook 请求: %s", request.remote)
+                return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            if not isinstance(data, dict):
+                raise ValueError(f"请求体不是 JSON 对象: {type(data).__name__}")
+            update = Update.de_json(data, application.bot)
+        except (json.JSONDecodeError, ValueError, TypeError, KeyError) as e:
+            logger.warning("无法解析 webhook 请求: %s", e)
+            return web.Response(status=400)
+
+        if update is None:
+            return web.Response(status=400)
+
+        await application.update_queue.put(update)
+        return web.Response()
+
+    return webhook
+
+
+def create_metrics_handler():
+    """创建 Prometheus 指标抓取接口（指标在请求时才汇总）"""
+    from src.services.metrics import CONTENT_TYPE, registry
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    return metrics
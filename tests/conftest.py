@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# 确保 src 模块可以被导入
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.database.models import Database
+
+
+@pytest.fixture
+def db():
+    """内存 SQLite 数据库（每个测试一个）"""
+    database = Database("sqlite://")
+    database.init_db()
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def session(db):
+    with db.get_session() as session:
+        yield session
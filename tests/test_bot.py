@@ -0,0 +1,92 @@
+"""Bot 启动测试：数据库连接的重试与退避、可选组件的创建"""
+
+import asyncio
+
+import pytest
+
+from src import bot as bot_module
+from src.bot import XianxiaBot
+from src.utils.config import config
+
+
+@pytest.fixture
+def settings(tmp_path):
+    """测试用的配置（结束后恢复原配置）"""
+    previous = config.config
+    values = {
+        "telegram": {"bot_token": "123:TEST", "user_id": 1},
+        "database": {"url": f"sqlite:///{tmp_path / 'bot.db'}"},
+    }
+    yield values
+    config.load_dict(previous)
+
+
+def _bot(settings, **kwargs):
+    config.load_dict(settings)
+    return XianxiaBot(**kwargs)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录退避等待时间，不真正等待；抖动固定取上限"""
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(bot_module.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(bot_module.random, "uniform", lambda low, high: high)
+    return delays
+
+
+def _failing_init_db(failures):
+    calls = []
+
+    async def init_db():
+        calls.append(len(calls))
+        if len(calls) <= failures:
+            raise ConnectionError("connection refused")
+
+    return init_db, calls
+
+
+def test_retry_backoff_grows_and_is_capped(settings, monkeypatch):
+    bot = _bot(settings, retry_delay=1, max_retry_delay=3)
+    monkeypatch.setattr(bot_module.random, "uniform", lambda low, high: high)
+    assert [bot._retry_backoff(attempt) for attempt in range(4)] == [1, 2, 3, 3]
+
+    # 抖动取下限时等待一半
+    monkeypatch.setattr(bot_module.random, "uniform", lambda low, high: low)
+    assert [bot._retry_backoff(attempt) for attempt in range(4)] == [0.5, 1, 1.5, 1.5]
+
+
+def test_init_database_retries_until_success(settings, sleeps, monkeypatch):
+    bot = _bot(settings, max_retries=5, retry_delay=1, max_retry_delay=3)
+    init_db, calls = _failing_init_db(failures=3)
+    monkeypatch.setattr(bot.db, "init_db", init_db)
+
+    assert asyncio.run(bot._init_database()) is bot.db
+    assert len(calls) == 4
+    assert sleeps == [1, 2, 3]
+
+
+def test_init_database_gives_up_after_max_retries(settings, sleeps, monkeypatch):
+    bot = _bot(settings, max_retries=3, retry_delay=1)
+    init_db, calls = _failing_init_db(failures=10)
+    monkeypatch.setattr(bot.db, "init_db", init_db)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(bot._init_database())
+    assert len(calls) == 3
+    assert len(sleeps) == 2  # 最后一次失败后不再等待
+
+
+def test_optional_components_follow_config(settings):
+    settings["database"]["persistence"] = False
+    settings["scheduler"] = {"maintenance_interval": 0}
+    bot = _bot(settings)
+    assert bot.persistence is None
+    assert bot.maintenance is None
+
+    settings["database"]["log_partitioning"] = True
+    assert _bot(settings).maintenance is not None
@@ -0,0 +1,77 @@
+"""按钮回调数据登记表测试"""
+
+import pytest
+
+from src.services import callback_registry as module
+from src.services.callback_registry import CallbackRegistry, base62
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的 time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr(module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_base62():
+    assert base62(0) == "0"
+    assert base62(61) == "z"
+    assert base62(62) == "10"
+    assert len(base62(2 ** CallbackRegistry.TOKEN_BITS - 1)) <= 9
+
+
+def test_register_and_get():
+    registry = CallbackRegistry()
+    token = registry.register({"name": "流云琴"})
+    assert len(("buy_" + token).encode()) <= 64
+    assert registry.get(token) == {"name": "流云琴"}
+    assert registry.get("missing") is None
+    assert registry.stats()["hits"] == 1
+    assert registry.stats()["misses"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    registry = CallbackRegistry(ttl=60)
+    token = registry.register("payload")
+    clock[0] += 59
+    assert registry.get(token) == "payload"
+    clock[0] += 1
+    assert registry.get(token) is None
+    assert registry.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    registry = CallbackRegistry(max_size=2)
+    first = registry.register(1)
+    second = registry.register(2)
+    registry.get(first)  # first 变为最近使用
+    third = registry.register(3)
+
+    assert registry.get(second) is None
+    assert registry.get(first) == 1
+    assert registry.get(third) == 3
+    assert registry.stats()["evictions"] == 1
+
+
+def test_touch_extends_ttl(clock):
+    registry = CallbackRegistry(ttl=60)
+    token = registry.register("payload")
+    clock[0] += 50
+    assert registry.touch(token)
+    clock[0] += 50  # 已超过最初的有效期
+    assert registry.get(token) == "payload"
+    clock[0] += 60
+    assert not registry.touch(token)
+    assert registry.stats()["size"] == 0
+    assert not registry.touch("missing")
+
+
+def test_touch_protects_from_eviction():
+    registry = CallbackRegistry(max_size=2)
+    first = registry.register(1)
+    second = registry.register(2)
+    registry.touch(first)
+    registry.register(3)
+    assert registry.get(first) == 1
+    assert registry.get(second) is None
@@ -0,0 +1,75 @@
+"""配置快照与热加载测试"""
+
+import os
+
+import pytest
+
+from src.utils.config import ConfigManager, ConfigSnapshot
+
+
+def _write(path, content, mtime):
+    path.write_text(content, encoding="utf-8")
+    # 显式设置修改时间，不依赖文件系统的时间精度
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "config.yaml"
+    _write(path, "telegram:\n  game_bot_user_id: 100\nshop:\n  deal_percentile: 10\n", 1000)
+    return path
+
+
+def test_snapshot_flattens_keys():
+    snapshot = ConfigSnapshot.from_dict({"telegram": {"game_bot_id": "42"}, "shop": {"deal_rarities": ["帝品"]}})
+    assert snapshot.get("telegram.game_bot_id") == "42"
+    assert snapshot.game_bot_user_id == 42
+    assert snapshot.get("shop.deal_rarities") == ("帝品",)
+    assert snapshot.get("missing", 5) == 5
+    with pytest.raises(TypeError):
+        snapshot.values["shop"]["deal_rarities"] = ()
+
+
+def test_unchanged_file_is_not_reloaded(config_file):
+    manager = ConfigManager(str(config_file))
+    snapshot = manager.snapshot
+    assert not manager.reload_if_changed()
+    assert manager.snapshot is snapshot
+
+
+def test_edited_file_swaps_snapshot(config_file):
+    manager = ConfigManager(str(config_file))
+    old = manager.snapshot
+
+    _write(config_file, "telegram:\n  game_bot_user_id: 200\nshop:\n  deal_percentile: 5\n", 2000)
+    assert manager.reload_if_changed()
+
+    new = manager.snapshot
+    assert new is not old
+    assert (new.game_bot_user_id, new.get("shop.deal_percentile"), new.mtime) == (200, 5, 2000)
+    assert manager.get("shop.deal_percentile") == 5
+    # 持有旧快照的读取方看到的仍是完整的旧配置
+    assert (old.game_bot_user_id, old.get("shop.deal_percentile")) == (100, 10)
+
+
+def test_invalid_file_keeps_previous_snapshot(config_file):
+    manager = ConfigManager(str(config_file))
+    snapshot = manager.snapshot
+
+    _write(config_file, "telegram: [unclosed\n", 2000)
+    assert not manager.reload_if_changed()
+    assert manager.snapshot is snapshot
+    assert manager.get("telegram.game_bot_user_id") == 100
+    # 同一个出错的版本不再重复解析
+    assert not manager.reload_if_changed()
+
+    # 修复后的文件正常加载
+    _write(config_file, "telegram:\n  game_bot_user_id: 300\n", 3000)
+    assert manager.reload_if_changed()
+    assert manager.snapshot.game_bot_user_id == 300
+
+
+def test_missing_file_keeps_defaults(tmp_path):
+    manager = ConfigManager(str(tmp_path / "missing.yaml"))
+    assert manager.snapshot.game_bot_username == "美奈"
+    assert not manager.reload_if_changed()
@@ -0,0 +1,141 @@
+"""转发指令与游戏Bot回复的关联测试"""
+
+import asyncio
+
+import pytest
+
+from src.services.correlation import CommandCorrelator, command_type
+
+CHAT_ID = 100
+
+
+def test_reply_matches_oldest_pending_command():
+    async def scenario():
+        correlator = CommandCorrelator()
+        first = correlator.register(CHAT_ID, "签到")
+        second = correlator.register(CHAT_ID, "闭关")
+
+        assert correlator.resolve(CHAT_ID, "签到成功") is first
+        assert await correlator.wait(first) == "签到成功"
+        assert correlator.resolve(CHAT_ID, "开始闭关") is second
+        assert await correlator.wait(second) == "开始闭关"
+        assert len(correlator) == 0
+        assert correlator.stats()["resolved"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_quoted_reply_matches_by_message_id():
+    async def scenario():
+        correlator = CommandCorrelator()
+        first = correlator.register(CHAT_ID, "签到")
+        second = correlator.register(CHAT_ID, "闭关")
+        correlator.attach_message(first, 10)
+        correlator.attach_message(second, 11)
+
+        assert correlator.resolve(CHAT_ID, "开始闭关", reply_to_message_id=11) is second
+        assert correlator.resolve(CHAT_ID, "签到成功", reply_to_message_id=99) is first
+        assert len(correlator) == 0
+
+    asyncio.run(scenario())
+
+
+def test_replies_from_two_users_out_of_order():
+    async def scenario():
+        correlator = CommandCorrelator()
+        # 两个用户的指令发往同一个游戏Bot聊天，回复的到达顺序与发送顺序相反
+        first_user = correlator.register(CHAT_ID, "我的信息")
+        second_user = correlator.register(CHAT_ID, "丹药背包")
+
+        assert correlator.resolve(CHAT_ID, "【丹药背包】\n回春丹 x3") is second_user
+        assert correlator.resolve(CHAT_ID, "【我的信息】\n境界: 筑基期") is first_user
+        assert await correlator.wait(first_user) == "【我的信息】\n境界: 筑基期"
+        assert await correlator.wait(second_user) == "【丹药背包】\n回春丹 x3"
+
+    asyncio.run(scenario())
+
+
+def test_ambiguous_reply_is_dropped():
+    async def scenario():
+        correlator = CommandCorrelator()
+        first = correlator.register(CHAT_ID, "签到")
+        second = correlator.register(CHAT_ID, "闭关")
+
+        # 回复中看不出是哪条指令：不按顺序猜测
+        assert correlator.resolve(CHAT_ID, "操作成功") is None
+        assert not first.future.done() and not second.future.done()
+        assert correlator.stats()["unmatched"] == 1
+        assert len(correlator) == 2
+
+    asyncio.run(scenario())
+
+
+def test_same_type_commands_resolve_in_order():
+    async def scenario():
+        correlator = CommandCorrelator()
+        first = correlator.register(CHAT_ID, "购买 流云琴")
+        other = correlator.register(CHAT_ID, "签到")
+        second = correlator.register(CHAT_ID, "购买 回春丹")
+
+        assert correlator.resolve(CHAT_ID, "购买成功") is first
+        assert correlator.resolve(CHAT_ID, "购买失败：灵石不足") is second
+        assert correlator.resolve(CHAT_ID, "今日已签到") is other
+
+    asyncio.run(scenario())
+
+
+def test_command_type():
+    assert command_type("购买 流云琴") == "购买"
+    assert command_type("【签到】") == "签到"
+    assert command_type("") == ""
+
+
+def test_unmatched_reply_is_counted():
+    async def scenario():
+        correlator = CommandCorrelator()
+        correlator.register(CHAT_ID, "签到")
+        assert correlator.resolve(CHAT_ID + 1, "你好") is None
+        assert correlator.stats()["unmatched"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_wait_times_out_and_removes_command():
+    async def scenario():
+        correlator = CommandCorrelator()
+        pending = correlator.register(CHAT_ID, "签到", timeout=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await correlator.wait(pending)
+        assert len(correlator) == 0
+        assert correlator.resolve(CHAT_ID, "签到成功") is None
+        assert correlator.stats()["timeouts"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_oldest_command_is_dropped_when_full():
+    async def scenario():
+        correlator = CommandCorrelator(max_pending=2)
+        oldest = correlator.register(CHAT_ID, "签到")
+        correlator.register(CHAT_ID, "闭关")
+        correlator.register(CHAT_ID, "出关")
+
+        assert len(correlator) == 2
+        assert oldest.future.cancelled()
+        with pytest.raises(asyncio.TimeoutError):
+            await correlator.wait(oldest)
+
+    asyncio.run(scenario())
+
+
+def test_sweep_removes_expired_commands():
+    async def scenario():
+        correlator = CommandCorrelator()
+        expired = correlator.register(CHAT_ID, "签到", timeout=1)
+        alive = correlator.register(CHAT_ID, "闭关", timeout=100)
+
+        assert correlator.sweep(expired.deadline) == 1
+        assert expired.future.cancelled()
+        assert correlator.resolve(CHAT_ID, "开始闭关") is alive
+
+    asyncio.run(scenario())
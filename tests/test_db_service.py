@@ -0,0 +1,113 @@
+"""数据库服务测试（内存 SQLite）"""
+
+from sqlalchemy import event, func, select
+
+from src.database.models import ShopItem, ShopRawText, ShopSnapshot, User
+from src.services.db_service import ShopService, UserService
+
+USER_ID = 1
+
+
+def _item(position, name, price, rarity="common", item_type="weapon"):
+    return {
+        "position": position,
+        "name": name,
+        "type": item_type,
+        "rarity": rarity,
+        "price": price,
+        "original_price": price + 10,
+        "discount_percent": -5.0,
+    }
+
+
+def _shop(*items, raw_text=None):
+    data = {"items": list(items), "count": len(items), "refresh_time": None}
+    if raw_text is not None:
+        data["raw_text"] = raw_text
+    return data
+
+
+def test_save_snapshot_writes_shop_items(session):
+    snapshot = ShopService.save_shop_snapshot(session, USER_ID, _shop(_item(1, "流云琴", 342), _item(2, "回春丹", 95, item_type="potion")))
+
+    rows = session.scalars(select(ShopItem).order_by(ShopItem.position)).all()
+    assert [(row.snapshot_id, row.position, row.name, row.item_type, row.current_price, row.original_price) for row in rows] == [
+        (snapshot.id, 1, "流云琴", "weapon", 342, 352),
+        (snapshot.id, 2, "回春丹", "potion", 95, 105),
+    ]
+    assert all(row.created_at == snapshot.created_at for row in rows)
+
+
+def test_save_snapshot_without_items(session):
+    ShopService.save_shop_snapshot(session, USER_ID, _shop())
+    assert session.scalar(select(func.count()).select_from(ShopItem)) == 0
+    assert session.scalar(select(func.count()).select_from(ShopSnapshot)) == 1
+
+
+def test_repeated_paste_reuses_snapshot(session):
+    first = ShopService.save_shop_snapshot(session, USER_ID, _shop(_item(1, "流云琴", 342), raw_text="商店 A"))
+    seen_at = first.last_seen_at
+    # 物品相同、原始文本不同（空白、标题变化）仍视为同一快照
+    second = ShopService.save_shop_snapshot(session, USER_ID, _shop(_item(1, "流云琴", 342), raw_text="商店 A \n"))
+
+    assert second.id == first.id
+    assert second.last_seen_at >= seen_at
+    assert session.scalar(select(func.count()).select_from(ShopSnapshot)) == 1
+    assert session.scalar(select(func.count()).select_from(ShopItem)) == 1
+
+
+def test_changed_items_create_new_snapshot(session):
+    first = ShopService.save_shop_snapshot(session, USER_ID, _shop(_item(1, "流云琴", 342)))
+    second = ShopService.save_shop_snapshot(session, USER_ID, _shop(_item(1, "流云琴", 300)))
+    other_user = ShopService.save_shop_snapshot(session, USER_ID + 1, _shop(_item(1, "流云琴", 342)))
+
+    assert len({first.id, second.id, other_user.id}) == 3
+    assert first.content_hash == other_user.content_hash != second.content_hash
+
+
+def test_raw_text_is_compressed_and_shared(session):
+    raw_text = "=== 修仙商店 ===\n" * 50
+    first = ShopService.save_shop_snapshot(session, USER_ID, _shop(_item(1, "流云琴", 342), raw_text=raw_text))
+    second = ShopService.save_shop_snapshot(session, USER_ID + 1, _shop(_item(1, "流云琴", 342), raw_text=raw_text))
+
+    assert first.raw_text_id is not None
+    assert second.raw_text_id == first.raw_text_id
+    assert "raw_text" not in first.snapshot_data
+    assert session.scalar(select(func.count()).select_from(ShopRawText)) == 1
+    assert ShopService.get_raw_text(session, first) == raw_text
+
+
+def test_get_or_create_users_keeps_existing(session):
+    existing = UserService.update_user_info(session, 1, {"username": "道友", "spiritual_stones": 500})
+    created_at = existing.created_at
+
+    users = UserService.get_or_create_users(session, [1, 2, 3])
+
+    assert sorted(users) == [1, 2, 3]
+    # 已存在的用户不被改写
+    assert (users[1].username, users[1].spiritual_stones, users[1].created_at) == ("道友", 500, created_at)
+    assert users[2].level == "初入凡间"
+    assert session.scalar(select(func.count()).select_from(User)) == 3
+
+
+def test_upsert_users_updates_and_creates(session):
+    UserService.get_or_create_user(session, 1)
+    users = UserService.upsert_users(session, {1: {"level": "筑基期"}, 2: {"level": "炼气期", "unknown": 1}, 3: {}})
+    assert {user_id: user.level for user_id, user in users.items()} == {1: "筑基期", 2: "炼气期", 3: "初入凡间"}
+
+
+def test_upsert_users_is_one_statement_per_group(db):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0])
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    with db.get_session() as session:
+        UserService.get_or_create_user(session, 1)
+        UserService.get_or_create_user(session, 1)
+        UserService.update_user_info(session, 1, {"exp": 12.5})
+        UserService.upsert_users(session, {2: {}, 3: {}})
+    event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+    assert statements == ["INSERT"] * 4
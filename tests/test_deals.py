@@ -0,0 +1,162 @@
+"""捡漏提醒测试：t-digest 的精度、判定规则和价格分布的保存"""
+
+import bisect
+import random
+
+import pytest
+from sqlalchemy import select
+
+from src.database.models import ItemPriceSketch
+from src.services.db_service import ShopService
+from src.services.deals import (
+    DealSettings,
+    TDigest,
+    detect_deals,
+    sketch_insert_missing,
+    sketch_placeholder_rows,
+)
+from src.utils.config import ConfigSnapshot
+
+
+def _exact_cdf(values, x):
+    """小于 x 的比例（等于 x 的记一半），与 TDigest.cdf 的定义一致"""
+    below = bisect.bisect_left(values, x)
+    equal = bisect.bisect_right(values, x) - below
+    return (below + equal / 2) / len(values)
+
+
+@pytest.mark.parametrize("distribution", ["uniform", "lognormal"])
+def test_cdf_accuracy(distribution):
+    rng = random.Random(42)
+    if distribution == "uniform":
+        values = [rng.uniform(100, 500) for _ in range(20000)]
+    else:
+        values = [rng.lognormvariate(5, 0.5) for _ in range(20000)]
+
+    digest = TDigest(compression=50)
+    for value in values:
+        digest.add(value)
+    values.sort()
+
+    assert digest.count == len(values)
+    assert len(digest.centroids) <= digest.compression + 1
+    for q in (0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9):
+        x = values[int(q * len(values))]
+        # 低分位（捡漏关心的区间）误差更小
+        tolerance = 0.005 if q <= 0.1 else 0.02
+        assert digest.cdf(x) == pytest.approx(_exact_cdf(values, x), abs=tolerance)
+    assert digest.cdf(values[0] - 1) == 0.0
+    assert digest.cdf(values[-1] + 1) == 1.0
+
+
+def test_cdf_with_repeated_prices():
+    digest = TDigest()
+    for price in [100] * 10 + [200] * 10:
+        digest.add(price)
+    assert digest.cdf(100) == pytest.approx(0.25)
+    assert digest.cdf(150) == pytest.approx(0.5)
+    assert digest.cdf(200) == pytest.approx(0.75)
+
+
+def test_round_trip_keeps_adding_in_order():
+    rng = random.Random(7)
+    digest = TDigest(compression=20)
+    for _ in range(500):
+        digest.add(rng.randint(100, 300))
+
+    restored = TDigest.from_dict(digest.to_dict())
+    for _ in range(500):
+        restored.add(rng.randint(100, 300))
+
+    means = [mean for mean, _ in restored.centroids]
+    assert means == sorted(means)
+    assert sum(weight for _, weight in restored.centroids) == restored.count == 1000
+
+
+def _item(name, price, rarity="imperial", position=1):
+    return {"position": position, "name": name, "type": "weapon", "rarity": rarity, "price": price}
+
+
+def _history(*prices, compression=50):
+    digest = TDigest(compression)
+    for price in prices:
+        digest.add(price)
+    return digest
+
+
+def test_detect_deals_flags_low_prices():
+    sketches = {("流云琴", "imperial"): _history(*range(300, 400))}
+    settings = DealSettings(percentile=10, min_samples=10)
+
+    deals = detect_deals([_item("流云琴", 305), _item("流云琴", 350, position=2)], sketches, settings)
+
+    assert [deal.item["price"] for deal in deals] == [305]
+    assert deals[0].percentile < 10
+    assert deals[0].samples == 100
+    # 当前价格加入了分布
+    assert sketches[("流云琴", "imperial")].count == 102
+
+
+def test_detect_deals_needs_enough_history():
+    sketches = {}
+    settings = DealSettings(percentile=10, min_samples=10)
+    assert detect_deals([_item("回春丹", 10)], sketches, settings) == []
+    assert sketches[("回春丹", "imperial")].count == 1
+
+
+def test_detect_deals_filters_rarities():
+    sketches = {
+        ("流云琴", "imperial"): _history(*range(300, 400)),
+        ("玄铁甲", "common"): _history(*range(300, 400)),
+    }
+    settings = DealSettings(percentile=10, min_samples=10, rarities=frozenset({"imperial"}))
+
+    deals = detect_deals([_item("流云琴", 300), _item("玄铁甲", 300, rarity="common", position=2)], sketches, settings)
+    assert [deal.item["name"] for deal in deals] == ["流云琴"]
+
+
+def test_insert_missing_keeps_existing_sketches(session):
+    existing = _history(100, 200)
+    session.add(ItemPriceSketch(name="流云琴", rarity="imperial", count=2, digest=existing.to_dict()))
+    session.flush()
+
+    keys = [("流云琴", "imperial"), ("回春丹", "")]
+    session.execute(sketch_insert_missing("sqlite"), sketch_placeholder_rows(keys, 50))
+    rows = {(row.name, row.rarity): row for row in session.scalars(select(ItemPriceSketch))}
+
+    assert rows[("流云琴", "imperial")].count == 2
+    assert rows[("回春丹", "")].count == 0
+    assert TDigest.from_dict(rows[("回春丹", "")].digest).count == 0
+
+
+def test_saved_snapshots_accumulate_sketches(session):
+    for user_id, price in enumerate([300, 320, 340], 1):
+        shop = {"items": [_item("流云琴", price)], "count": 1, "refresh_time": None}
+        ShopService.save_shop_snapshot(session, user_id, shop)
+
+    row = session.get(ItemPriceSketch, ("流云琴", "imperial"))
+    digest = TDigest.from_dict(row.digest)
+    assert row.count == digest.count == 3
+    assert (digest.min, digest.max) == (300, 340)
+
+
+def test_save_uses_injected_deal_settings(session):
+    settings = DealSettings(percentile=50, min_samples=3)
+    for user_id, price in enumerate([300, 320, 340], 1):
+        shop = {"items": [_item("流云琴", price)], "count": 1, "refresh_time": None}
+        ShopService.save_shop_snapshot(session, user_id, shop, deal_settings=settings)
+
+    cheap = {"items": [_item("流云琴", 290)], "count": 1, "refresh_time": None}
+    deals = []
+    ShopService.save_shop_snapshot(session, 4, cheap, deals=deals)
+    assert deals == []  # 默认参数要求至少 10 次记录
+
+    deals = []
+    ShopService.save_shop_snapshot(session, 5, {**cheap, "items": [_item("流云琴", 280)]}, deals=deals, deal_settings=settings)
+    assert [(deal.item["price"], deal.samples) for deal in deals] == [(280, 4)]
+
+
+def test_settings_from_config_snapshot():
+    snapshot = ConfigSnapshot.from_dict({"shop": {"deal_percentile": 5, "deal_min_samples": 3, "deal_rarities": ["帝品"]}})
+    settings = DealSettings.from_config(snapshot)
+    assert (settings.percentile, settings.min_samples, settings.rarities) == (5, 3, frozenset({"imperial"}))
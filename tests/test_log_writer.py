@@ -0,0 +1,117 @@
+"""操作日志批量写入器测试"""
+
+import asyncio
+
+from sqlalchemy import select
+
+from src.database.models import AsyncDatabase, OperationLog
+from src.services import log_writer
+from src.services.log_writer import OperationLogWriter
+
+
+def _run(tmp_path, scenario):
+    async def main():
+        db = AsyncDatabase(f"sqlite:///{tmp_path / 'logs.db'}")
+        await db.init_db()
+        try:
+            return await scenario(db)
+        finally:
+            await db.close()
+
+    return asyncio.run(main())
+
+
+async def _rows(db):
+    async with db.get_session() as session:
+        result = await session.scalars(select(OperationLog).order_by(OperationLog.id))
+        return [(row.user_id, row.operation_type, row.operation_content, row.success) for row in result]
+
+
+def test_full_batch_is_written_without_waiting_for_interval(tmp_path):
+    async def scenario(db):
+        writer = OperationLogWriter(db, batch_size=3, flush_interval=60)
+        await writer.start()
+        for i in range(3):
+            await writer.log(i, "command", f"签到 {i}")
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if writer.written:
+                break
+        rows = await _rows(db)
+        await writer.stop()
+        return writer.stats(), rows
+
+    stats, rows = _run(tmp_path, scenario)
+    assert rows == [(i, "command", f"签到 {i}", True) for i in range(3)]
+    assert stats["batches"] == 1
+
+
+def test_partial_batch_is_flushed_after_interval(tmp_path):
+    async def scenario(db):
+        writer = OperationLogWriter(db, batch_size=100, flush_interval=0.05)
+        await writer.start()
+        await writer.log(1, "shop", success=False)
+        await asyncio.sleep(0.01)
+        before = len(await _rows(db))
+        await asyncio.sleep(0.2)
+        after = await _rows(db)
+        await writer.stop()
+        return before, after
+
+    before, after = _run(tmp_path, scenario)
+    assert before == 0
+    assert after == [(1, "shop", None, False)]
+
+
+def test_full_queue_applies_backpressure(tmp_path):
+    async def scenario(db):
+        writer = OperationLogWriter(db, batch_size=10, max_queue_size=2)
+        # 后台任务未启动：前两条入队，第三条等待空间
+        await writer.log(1, "command")
+        await writer.log(2, "command")
+        blocked = asyncio.create_task(writer.log(3, "command"))
+        await asyncio.sleep(0.01)
+        waiting = not blocked.done()
+
+        await writer.start()
+        await asyncio.wait_for(blocked, 1)
+        await writer.stop()
+        return waiting, writer.stats(), await _rows(db)
+
+    waiting, stats, rows = _run(tmp_path, scenario)
+    assert waiting
+    assert stats["backpressure_waits"] == 1
+    assert [row[0] for row in rows] == [1, 2, 3]
+
+
+def test_stop_drains_queue(tmp_path):
+    async def scenario(db):
+        writer = OperationLogWriter(db, batch_size=4, flush_interval=60)
+        await writer.start()
+        for i in range(10):
+            await writer.log(i, "command")
+        await writer.stop()
+        return writer.stats(), await _rows(db)
+
+    stats, rows = _run(tmp_path, scenario)
+    assert [row[0] for row in rows] == list(range(10))
+    assert stats["written"] == 10
+    assert stats["queue_size"] == 0
+    assert stats["batches"] == 3
+
+
+def test_failed_batch_is_counted(tmp_path, monkeypatch):
+    async def broken(session, records):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(log_writer.AsyncOperationService, "log_operations", staticmethod(broken))
+
+    async def scenario(db):
+        writer = OperationLogWriter(db, batch_size=2, flush_interval=60)
+        await writer.start()
+        await writer.log(1, "command")
+        await writer.stop()
+        return writer.stats()
+
+    stats = _run(tmp_path, scenario)
+    assert stats["failed"] == 1 and stats["written"] == 0
@@ -0,0 +1,63 @@
+"""日志处理器测试"""
+
+import json
+import logging
+import queue
+import sys
+
+from src.utils.logger import JsonLinesFormatter, RecordQueueHandler, SamplingFilter
+
+
+def _record(msg, *args, level=logging.INFO, name="src.test", exc_info=None):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, exc_info)
+
+
+def test_queued_record_is_a_snapshot():
+    log_queue = queue.SimpleQueue()
+    handler = RecordQueueHandler(log_queue)
+    items = ["流云琴"]
+    handler.handle(_record("物品: %s", items))
+    items.append("回春丹")  # 入队后修改参数不影响日志内容
+
+    record = log_queue.get_nowait()
+    assert record.getMessage() == "物品: ['流云琴']"
+    assert record.args is None
+
+
+def test_exception_is_formatted_before_queueing():
+    log_queue = queue.SimpleQueue()
+    handler = RecordQueueHandler(log_queue)
+    try:
+        raise ValueError("坏数据")
+    except ValueError:
+        handler.handle(_record("出错了", level=logging.ERROR, exc_info=sys.exc_info()))
+
+    record = log_queue.get_nowait()
+    assert record.exc_info is None
+    assert "ValueError: 坏数据" in record.exc_text
+    assert record.msg == "出错了"
+
+    entry = json.loads(JsonLinesFormatter().format(record))
+    assert entry["msg"] == "出错了"
+    assert "ValueError: 坏数据" in entry["exc"]
+
+    text = logging.Formatter("%(message)s").format(record)
+    assert text.startswith("出错了\n") and "ValueError: 坏数据" in text
+
+
+def test_json_formatter_outputs_extra_fields():
+    record = _record("用户 %s 点击了: %s", 1, "menu_shop")
+    record.route = "menu_shop"
+    entry = json.loads(JsonLinesFormatter().format(record))
+    assert entry["msg"] == "用户 1 点击了: menu_shop"
+    assert entry["route"] == "menu_shop"
+    assert entry["level"] == "INFO"
+
+
+def test_sampling_filter_uses_longest_prefix_and_keeps_warnings():
+    sampling = SamplingFilter({"src": 1.0, "src.bot": 0.0})
+    assert sampling.filter(_record("x", name="src.handlers"))
+    assert not sampling.filter(_record("x", name="src.bot.updates"))
+    assert sampling.filter(_record("x", name="src.bot", level=logging.WARNING))
+    assert sampling.filter(_record("x", name="other"))
+    assert sampling.dropped == 1
@@ -0,0 +1,135 @@
+"""数据保留与清理测试"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from src.database.models import AsyncDatabase, OperationLog, ShopItem, ShopRawText, ShopSnapshot
+from src.services.maintenance import MaintenanceService, _next_month, _partition_month, _partition_name
+
+NOW = datetime.utcnow()
+
+
+def _run(tmp_path, scenario):
+    async def main():
+        db = AsyncDatabase(f"sqlite:///{tmp_path / 'maintenance.db'}")
+        await db.init_db()
+        try:
+            return await scenario(db)
+        finally:
+            await db.close()
+
+    return asyncio.run(main())
+
+
+async def _seed_snapshots(db, user_id, ages_in_days, raw_text_id=None):
+    """按给定的天数（距今）为用户添加快照，每个快照两条物品明细，返回快照 ID（与 ages 顺序相同）"""
+    ids = []
+    async with db.get_session() as session:
+        for age in ages_in_days:
+            seen_at = NOW - timedelta(days=age)
+            snapshot = ShopSnapshot(
+                user_id=user_id, snapshot_data={"items": []}, raw_text_id=raw_text_id,
+                created_at=seen_at, last_seen_at=seen_at
+            )
+            session.add(snapshot)
+            await session.flush()
+            session.add_all([
+                ShopItem(snapshot_id=snapshot.id, name=f"物品{n}", position=n, current_price=100, created_at=seen_at)
+                for n in (1, 2)
+            ])
+            ids.append(snapshot.id)
+        await session.commit()
+    return ids
+
+
+async def _ids(db, column):
+    async with db.get_session() as session:
+        return set((await session.execute(select(column))).scalars())
+
+
+def test_prune_by_count_keeps_newest_per_user(tmp_path):
+    async def scenario(db):
+        # 用户 1 有 5 个快照（ages 越小越新），用户 2 只有 2 个
+        user1 = await _seed_snapshots(db, 1, [5, 1, 4, 2, 3])
+        user2 = await _seed_snapshots(db, 2, [10, 9])
+        service = MaintenanceService(db, history_days=0, max_snapshots=3, chunk_size=1)
+        report = await service.prune_snapshots_by_count()
+        return user1, user2, report, await _ids(db, ShopSnapshot.id), await _ids(db, ShopItem.snapshot_id)
+
+    user1, user2, report, snapshots, item_snapshots = _run(tmp_path, scenario)
+    expected = {user1[1], user1[3], user1[4]} | set(user2)  # 用户 1 最新的 3 个（1、2、3 天前）
+    assert snapshots == expected
+    assert item_snapshots == expected
+    assert report.rows_removed == 2
+
+
+def test_prune_by_count_breaks_ties_by_id(tmp_path):
+    async def scenario(db):
+        ids = await _seed_snapshots(db, 1, [1, 1, 1])
+        await MaintenanceService(db, max_snapshots=2).prune_snapshots_by_count()
+        return ids, await _ids(db, ShopSnapshot.id)
+
+    ids, remaining = _run(tmp_path, scenario)
+    assert remaining == {ids[1], ids[2]}
+
+
+def test_prune_by_age_in_chunks(tmp_path):
+    async def scenario(db):
+        old = await _seed_snapshots(db, 1, [40, 35, 31, 32, 50])
+        recent = await _seed_snapshots(db, 2, [29, 0])
+        report = await MaintenanceService(db, history_days=30, chunk_size=2).prune_snapshots_by_age()
+        return old, recent, report, await _ids(db, ShopSnapshot.id), await _ids(db, ShopItem.snapshot_id)
+
+    old, recent, report, snapshots, item_snapshots = _run(tmp_path, scenario)
+    assert report.rows_removed == len(old)
+    assert snapshots == set(recent)
+    assert item_snapshots == set(recent)
+
+
+def test_prune_orphan_raw_texts(tmp_path):
+    async def scenario(db):
+        async with db.get_session() as session:
+            texts = [ShopRawText(content_hash=f"hash{i}", data=b"x", size=1) for i in range(3)]
+            session.add_all(texts)
+            await session.commit()
+            used = texts[0].id
+        await _seed_snapshots(db, 1, [1], raw_text_id=used)
+        # 第二个文本没有被引用，第三个只被将要清理的旧快照引用
+        await _seed_snapshots(db, 2, [60], raw_text_id=texts[2].id)
+
+        service = MaintenanceService(db, history_days=30, max_snapshots=0, log_retention_days=0)
+        reports = await service.run()
+        return used, reports, await _ids(db, ShopRawText.id)
+
+    used, reports, remaining = _run(tmp_path, scenario)
+    assert remaining == {used}
+    assert [report.rows_removed for report in reports] == [1, 2]
+
+
+def test_prune_operation_logs(tmp_path):
+    async def scenario(db):
+        async with db.get_session() as session:
+            session.add_all([
+                OperationLog(user_id=1, operation_type="command", created_at=NOW - timedelta(days=age))
+                for age in (0, 10, 31, 45)
+            ])
+            await session.commit()
+        report = await MaintenanceService(db, log_retention_days=30, chunk_size=1).prune_operation_logs()
+        async with db.get_session() as session:
+            remaining = sorted((await session.execute(select(OperationLog.created_at))).scalars())
+        return report, remaining
+
+    report, remaining = _run(tmp_path, scenario)
+    assert report.rows_removed == 2
+    assert all(NOW - created_at < timedelta(days=30) for created_at in remaining)
+    assert len(remaining) == 2
+
+
+def test_partition_names():
+    month = datetime(2024, 12, 1)
+    assert _partition_name(month) == "operation_logs_y2024m12"
+    assert _partition_month("operation_logs_y2024m12") == month
+    assert _partition_month("operation_logs_default") is None
+    assert _next_month(month) == datetime(2025, 1, 1)
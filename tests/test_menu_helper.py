@@ -0,0 +1,62 @@
+"""购买按钮测试"""
+
+import pytest
+
+from src.services import callback_registry as registry_module
+from src.services.callback_registry import CallbackRegistry
+from src.utils.menu_helper import BUY_CALLBACK_PREFIX, MenuHelper, shop_buttons
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的 time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr(registry_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def registry():
+    return CallbackRegistry(ttl=3600)
+
+
+def _items(*prices):
+    return [{"position": i, "name": f"物品{i}", "price": price} for i, price in enumerate(prices, 1)]
+
+
+def _tokens(keyboard):
+    return [row[0].callback_data[len(BUY_CALLBACK_PREFIX):] for row in keyboard.inline_keyboard[:-1]]
+
+
+def test_buttons_carry_registered_tokens(clock, registry):
+    items = _items(342, 95)
+    keyboard = MenuHelper.create_shop_items_keyboard(items, registry)
+
+    assert [registry.get(token) for token in _tokens(keyboard)] == items
+    assert keyboard.inline_keyboard[-1][0].callback_data == "back_shop"
+
+
+def test_reused_buttons_keep_token_and_refresh_ttl(clock, registry):
+    old_items = _items(342, 95)
+    old = MenuHelper.create_shop_items_keyboard(old_items, registry)
+    clock[0] += registry.ttl - 1
+
+    new_items = _items(342, 80)
+    new = MenuHelper.create_shop_items_keyboard(new_items, registry, shop_buttons(old_items, old))
+    old_tokens, new_tokens = _tokens(old), _tokens(new)
+    assert new_tokens[0] == old_tokens[0]
+    assert new_tokens[1] != old_tokens[1]
+
+    # 沿用的按钮从本次生成起重新计算有效期
+    clock[0] += 2
+    assert registry.get(new_tokens[0]) == new_items[0]
+
+
+def test_expired_button_is_registered_again(clock, registry):
+    items = _items(342)
+    old = MenuHelper.create_shop_items_keyboard(items, registry)
+    clock[0] += registry.ttl + 1
+
+    new = MenuHelper.create_shop_items_keyboard(items, registry, shop_buttons(items, old))
+    assert _tokens(new) != _tokens(old)
+    assert registry.get(_tokens(new)[0]) == items[0]
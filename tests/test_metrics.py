@@ -0,0 +1,59 @@
+"""指标注册表与数据库计时测试"""
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from src.services import metrics
+from src.services.metrics import Gauge, MetricsRegistry, instrument_engine, stats_collector
+
+
+def test_collectors_with_same_name_are_replaced():
+    registry = MetricsRegistry()
+    registry.add_collector(stats_collector("outbox", lambda: {"queued": 1}, "发送队列"))
+    registry.add_collector(stats_collector("outbox", lambda: {"queued": 2}, "发送队列"))
+
+    gauges = [m for m in registry.collect() if m.name == "outbox_queued"]
+    assert len(gauges) == 1
+    assert list(gauges[0].samples()) == [("outbox_queued", {}, 2)]
+
+
+def test_failing_collector_does_not_break_scrape():
+    registry = MetricsRegistry()
+
+    def broken():
+        raise RuntimeError("boom")
+
+    def working():
+        gauge = Gauge("ok", "正常")
+        gauge.set(1)
+        yield gauge
+
+    registry.add_collector(broken)
+    registry.add_collector(working)
+    assert [m.name for m in registry.collect()] == ["ok"]
+
+
+def test_pool_timing_survives_dispose(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}", poolclass=QueuePool)
+    instrument_engine(engine)
+    held = metrics.DB_POOL_HELD.child()
+    connect = metrics.DB_CONNECT.child()
+
+    def use_connection():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    held_before, connect_before = held.count, connect.count
+    use_connection()
+    assert held.count == held_before + 1
+    assert connect.count == connect_before + 1
+
+    engine.dispose()  # 重建连接池后计时仍然生效
+    use_connection()
+    assert held.count == held_before + 2
+    assert connect.count == connect_before + 2
+
+    instrument_engine(engine)
+    pool_collectors = [m for m in metrics.registry.collect() if m.name == "db_pool_size"]
+    assert len(pool_collectors) == 1
+    engine.dispose()
@@ -0,0 +1,159 @@
+"""限流发送队列测试"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, RetryAfter
+
+from src.services.outbox import OutboundScheduler, TokenBucket
+
+
+class FakeBot:
+    """记录调用的 Bot；fail 中的异常按顺序在前几次调用时抛出"""
+
+    def __init__(self, delay: float = 0.0, fail=()):
+        self.delay = delay
+        self.fail = list(fail)
+        self.calls = []
+
+    async def _call(self, method, **kwargs):
+        self.calls.append((method, kwargs))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise self.fail.pop(0)
+        return SimpleNamespace(**{"message_id": len(self.calls), **kwargs})
+
+    async def send_message(self, **kwargs):
+        return await self._call("send_message", **kwargs)
+
+    async def edit_message_text(self, **kwargs):
+        return await self._call("edit_message_text", **kwargs)
+
+    async def answer_callback_query(self, **kwargs):
+        return await self._call("answer_callback_query", **kwargs)
+
+
+def _callback_query(query_id="q1", user_id=7, chat_id=100, message_id=5):
+    return SimpleNamespace(
+        id=query_id,
+        from_user=SimpleNamespace(id=user_id),
+        message=SimpleNamespace(chat_id=chat_id, message_id=message_id),
+    )
+
+
+def run(scenario):
+    return asyncio.run(scenario())
+
+
+def test_token_bucket_delay():
+    bucket = TokenBucket(rate=2, capacity=2)
+    bucket.consume(0.0)
+    bucket.consume(0.0)
+    assert bucket.delay(0.0) == pytest.approx(0.5)
+    assert bucket.delay(0.5) == 0
+
+
+def test_messages_in_a_chat_are_sent_in_order():
+    async def scenario():
+        bot = FakeBot()
+        outbox = OutboundScheduler(bot, global_rate=1000, chat_rate=1000, chat_burst=1000)
+        await outbox.start()
+        futures = [outbox.send_message(100, f"消息 {i}") for i in range(5)]
+        results = await asyncio.gather(*futures)
+        await outbox.stop()
+        assert [call[1]["text"] for call in bot.calls] == [f"消息 {i}" for i in range(5)]
+        assert [result.text for result in results] == [f"消息 {i}" for i in range(5)]
+        assert outbox.stats()["sent"] == 5
+
+    run(scenario)
+
+
+def test_queued_edits_are_coalesced():
+    async def scenario():
+        bot = FakeBot()
+        outbox = OutboundScheduler(bot, global_rate=1000, chat_rate=1000, chat_burst=1000)
+        # 未启动时排队，三次编辑合并为最后一次
+        futures = [outbox.edit_message_text(100, 5, f"第 {i} 次") for i in range(3)]
+        await outbox.start()
+        await asyncio.gather(*futures)
+        await outbox.stop()
+        assert [call[1]["text"] for call in bot.calls] == ["第 2 次"]
+        assert outbox.stats()["coalesced"] == 2
+
+    run(scenario)
+
+
+def test_retry_after_is_retried():
+    async def scenario():
+        bot = FakeBot(fail=[RetryAfter(0)])
+        outbox = OutboundScheduler(bot, global_rate=1000, chat_rate=1000, chat_burst=1000)
+        await outbox.start()
+        result = await outbox.send_message(100, "你好")
+        await outbox.stop()
+        assert result.text == "你好"
+        assert len(bot.calls) == 2
+        assert outbox.stats()["retries"] == 1
+
+    run(scenario)
+
+
+def test_gives_up_after_max_retries():
+    async def scenario():
+        bot = FakeBot(fail=[RetryAfter(0)] * 3)
+        outbox = OutboundScheduler(bot, global_rate=1000, chat_rate=1000, chat_burst=1000, max_retries=2)
+        await outbox.start()
+        with pytest.raises(RetryAfter):
+            await outbox.send_message(100, "你好")
+        await outbox.stop()
+        assert outbox.stats()["failed"] == 1
+
+    run(scenario)
+
+
+def test_not_modified_is_not_counted_as_failure():
+    async def scenario():
+        bot = FakeBot(fail=[BadRequest("Message is not modified")])
+        outbox = OutboundScheduler(bot)
+        await outbox.start()
+        with pytest.raises(BadRequest):
+            await outbox.edit_message_text(100, 5, "相同内容")
+        await outbox.stop()
+        assert outbox.stats()["failed"] == 0
+
+    run(scenario)
+
+
+def test_callback_answers_do_not_wait_behind_messages():
+    async def scenario():
+        bot = FakeBot()
+        # 每个聊天每 10 秒一条消息：应答不受该限制
+        outbox = OutboundScheduler(bot, global_rate=1000, chat_rate=0.1, chat_burst=1)
+        await outbox.start()
+        query = _callback_query()
+        outbox.send_message(query.message.chat_id, "第一条")
+        outbox.edit_callback_message(query, "排队中")
+        answer = outbox.answer_callback_query(query)
+        await asyncio.wait_for(answer, 1)
+        assert ("answer_callback_query", {"callback_query_id": "q1"}) in bot.calls
+        assert [call[0] for call in bot.calls].count("edit_message_text") == 0
+        await outbox.stop(timeout=0.1)
+
+    run(scenario)
+
+
+def test_stop_with_operation_in_flight_returns_promptly():
+    async def scenario():
+        bot = FakeBot(delay=0.05)
+        outbox = OutboundScheduler(bot)
+        await outbox.start()
+        future = outbox.send_message(100, "你好")
+        await asyncio.sleep(0.01)  # 请求已发出、尚未返回
+        start = time.perf_counter()
+        await outbox.stop(timeout=3)
+        assert time.perf_counter() - start < 1
+        assert future.done() and future.result().text == "你好"
+
+    run(scenario)
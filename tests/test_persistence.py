@@ -0,0 +1,104 @@
+"""会话状态持久化测试"""
+
+import asyncio
+
+from src.database.models import AsyncDatabase
+from src.services.persistence import DatabasePersistence
+
+
+def _run(tmp_path, scenario, **kwargs):
+    async def main():
+        db = AsyncDatabase(f"sqlite:///{tmp_path / 'state.db'}")
+        await db.init_db()
+        try:
+            return await scenario(db, DatabasePersistence(db, **kwargs))
+        finally:
+            await db.close()
+
+    return asyncio.run(main())
+
+
+def _fail_first(persistence, times):
+    """前 times 次写入抛出异常"""
+    write = persistence._write
+    calls = []
+
+    async def flaky(batch):
+        calls.append(dict(batch))
+        if len(calls) <= times:
+            raise ConnectionError("database unavailable")
+        await write(batch)
+
+    persistence._write = flaky
+    return calls
+
+
+def test_staged_data_is_written_and_read_back(tmp_path):
+    async def scenario(db, persistence):
+        await persistence.update_user_data(1, {"awaiting_shop_input": True})
+        await persistence.update_chat_data(2, {"last": "shop"})
+        await persistence.flush()
+
+        reloaded = DatabasePersistence(db)
+        return persistence.stats(), await reloaded.get_user_data(), await reloaded.get_chat_data()
+
+    stats, users, chats = _run(tmp_path, scenario)
+    assert stats["written"] == 2 and stats["pending"] == 0
+    assert users == {1: {"awaiting_shop_input": True}}
+    assert chats == {2: {"last": "shop"}}
+
+
+def test_failed_batch_is_retried_without_new_updates(tmp_path):
+    async def scenario(db, persistence):
+        calls = _fail_first(persistence, 2)
+        await persistence.update_user_data(1, {"step": 1})
+        # 写入失败后没有新的暂存，后台任务仍按退避重试
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if persistence.written:
+                break
+        return persistence.stats(), len(calls), await DatabasePersistence(db).get_user_data()
+
+    stats, attempts, users = _run(tmp_path, scenario, retry_delay=0.01)
+    assert attempts == 3
+    assert stats["failed"] == 2 and stats["pending"] == 0
+    assert users == {1: {"step": 1}}
+
+
+def test_updates_during_backoff_join_the_retry(tmp_path):
+    async def scenario(db, persistence):
+        calls = _fail_first(persistence, 1)
+        await persistence.update_user_data(1, {"step": 1})
+        await asyncio.sleep(0.01)
+        await persistence.update_user_data(1, {"step": 2})
+        await persistence.update_user_data(2, {"step": 1})
+        await persistence._flush_task
+        return calls, await DatabasePersistence(db).get_user_data()
+
+    calls, users = _run(tmp_path, scenario, retry_delay=0.05)
+    assert len(calls) == 2
+    assert len(calls[1]) == 2  # 新数据覆盖了失败的条目，并与之一起写入
+    assert users == {1: {"step": 2}, 2: {"step": 1}}
+
+
+def test_flush_does_not_wait_for_backoff(tmp_path):
+    async def scenario(db, persistence):
+        _fail_first(persistence, 1)
+        await persistence.update_user_data(1, {"step": 1})
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(persistence.flush(), 1)
+        return persistence.stats()
+
+    stats = _run(tmp_path, scenario, retry_delay=60)
+    assert stats["pending"] == 0 and stats["written"] == 1
+
+
+def test_unchanged_data_is_skipped(tmp_path):
+    async def scenario(db, persistence):
+        await persistence.update_user_data(1, {"step": 1})
+        await persistence.flush()
+        await persistence.update_user_data(1, {"step": 1})
+        return persistence.stats()
+
+    stats = _run(tmp_path, scenario)
+    assert stats["unchanged"] == 1 and stats["pending"] == 0 and stats["batches"] == 1
@@ -0,0 +1,119 @@
+"""历史价格统计测试：增量合并的结果应与按全部样本计算的结果一致"""
+
+import statistics
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from src.database.models import ItemPriceStats, ShopSnapshot
+from src.services.db_service import ShopService
+from src.services.price_stats import PriceAggregate, aggregate_items, backfill, price_key
+
+# 每个快照中 流云琴 的价格（同一快照可出现多次）
+SNAPSHOT_PRICES = [[342, 300], [410], [288, 350, 395], [342]]
+
+
+def _shop(prices, potion_price):
+    items = [
+        {"position": i, "name": "流云琴", "rarity": "rare", "type": "weapon", "price": price}
+        for i, price in enumerate(prices, 1)
+    ]
+    items.append({"position": len(items) + 1, "name": "回春丹", "rarity": None, "type": "potion", "price": potion_price})
+    return {"items": items, "count": len(items), "refresh_time": None}
+
+
+def test_aggregate_matches_statistics():
+    prices = [342, 300, 410, 288, 350, 395]
+    aggregate = PriceAggregate()
+    for price in prices:
+        aggregate.add(price)
+
+    assert aggregate.count == len(prices)
+    assert aggregate.mean == pytest.approx(statistics.mean(prices))
+    assert aggregate.m2 / (aggregate.count - 1) == pytest.approx(statistics.variance(prices))
+    assert (aggregate.min_price, aggregate.max_price) == (288, 410)
+
+
+def test_aggregate_items_groups_by_name_and_rarity():
+    seen_at = datetime(2024, 1, 1)
+    aggregates = aggregate_items(_shop([342, 300], 95)["items"] + [{"name": "流云琴", "price": None}], seen_at)
+
+    assert set(aggregates) == {("流云琴", "rare"), ("回春丹", "")}
+    assert aggregates[("流云琴", "rare")].count == 2
+    assert aggregates[("回春丹", "")].last_seen_at == seen_at
+
+
+def test_upsert_merge_matches_full_sample(session):
+    for user_id, prices in enumerate(SNAPSHOT_PRICES, 1):
+        ShopService.save_shop_snapshot(session, user_id, _shop(prices, 90 + user_id))
+
+    samples = [price for prices in SNAPSHOT_PRICES for price in prices]
+    stats = session.get(ItemPriceStats, ("流云琴", "rare"))
+    assert stats.count == len(samples)
+    assert stats.mean == pytest.approx(statistics.mean(samples))
+    assert stats.variance == pytest.approx(statistics.variance(samples))
+    assert (stats.min_price, stats.max_price) == (min(samples), max(samples))
+
+    potion = session.get(ItemPriceStats, price_key("回春丹", None))
+    assert potion.count == len(SNAPSHOT_PRICES)
+    assert potion.variance == pytest.approx(statistics.variance([91, 92, 93, 94]))
+
+
+def test_returned_stats_include_new_snapshot(session):
+    ShopService.save_shop_snapshot(session, 1, _shop([342], 95))
+    price_stats = {}
+    ShopService.save_shop_snapshot(session, 2, _shop([300], 95), price_stats=price_stats)
+
+    stats = price_stats[("流云琴", "rare")]
+    assert stats.count == 2
+    assert stats.mean == pytest.approx(321)
+
+
+def test_repeated_snapshot_is_not_counted_twice(session):
+    ShopService.save_shop_snapshot(session, 1, _shop([342], 95))
+    ShopService.save_shop_snapshot(session, 1, _shop([342], 95))
+
+    assert session.get(ItemPriceStats, ("流云琴", "rare")).count == 1
+
+
+def test_backfill_matches_incremental(db):
+    with db.get_session() as session:
+        for user_id, prices in enumerate(SNAPSHOT_PRICES, 1):
+            ShopService.save_shop_snapshot(session, user_id, _shop(prices, 90 + user_id))
+        incremental = {
+            (row.name, row.rarity): (row.count, row.mean, row.m2, row.min_price, row.max_price)
+            for row in session.scalars(select(ItemPriceStats))
+        }
+
+    assert backfill(db, batch_size=3) == len(incremental)
+
+    with db.get_session() as session:
+        rebuilt = {(row.name, row.rarity): row for row in session.scalars(select(ItemPriceStats))}
+    assert set(rebuilt) == set(incremental)
+    for key, (count, mean, m2, min_price, max_price) in incremental.items():
+        row = rebuilt[key]
+        assert (row.count, row.min_price, row.max_price) == (count, min_price, max_price)
+        assert row.mean == pytest.approx(mean)
+        assert row.m2 == pytest.approx(m2)
+
+
+def test_backfill_reads_snapshots_without_shop_items(db):
+    legacy_at = datetime(2023, 6, 1)
+    with db.get_session() as session:
+        # shop_items 上线前保存的快照：只有 snapshot_data
+        for prices in SNAPSHOT_PRICES[:2]:
+            session.add(ShopSnapshot(user_id=1, snapshot_data=_shop(prices, 90), created_at=legacy_at))
+        session.commit()
+        for user_id, prices in enumerate(SNAPSHOT_PRICES[2:], 2):
+            ShopService.save_shop_snapshot(session, user_id, _shop(prices, 90))
+
+    backfill(db)
+
+    samples = [price for prices in SNAPSHOT_PRICES for price in prices]
+    with db.get_session() as session:
+        stats = session.get(ItemPriceStats, ("流云琴", "rare"))
+        assert stats.count == len(samples)
+        assert stats.mean == pytest.approx(statistics.mean(samples))
+        assert stats.variance == pytest.approx(statistics.variance(samples))
+        assert session.get(ItemPriceStats, ("回春丹", "")).count == len(SNAPSHOT_PRICES)
@@ -0,0 +1,97 @@
+"""按钮回调路由测试"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.handlers.router import CallbackRouter
+
+
+def _update(data):
+    return SimpleNamespace(callback_query=SimpleNamespace(data=data))
+
+
+def _router(calls):
+    router = CallbackRouter()
+
+    @router.exact("back_main", "menu_shop")
+    async def exact(update, context):
+        calls.append(("exact", update.callback_query.data))
+
+    @router.prefix("cmd_")
+    async def command(update, context, callback_data):
+        calls.append(("cmd", callback_data))
+
+    @router.prefix("cmd_equip")
+    async def equip(update, context, callback_data):
+        calls.append(("equip", callback_data))
+
+    @router.fallback
+    async def fallback(update, context, callback_data):
+        calls.append(("fallback", callback_data))
+
+    return router
+
+
+def test_dispatch_picks_exact_then_longest_prefix_then_fallback():
+    calls = []
+    router = _router(calls)
+
+    async def scenario():
+        for data in ("back_main", "menu_shop", "cmd_check_in", "cmd_equip_item", "cmd_", "unknown", None):
+            await router.dispatch(_update(data), None)
+
+    asyncio.run(scenario())
+    assert calls == [
+        ("exact", "back_main"),
+        ("exact", "menu_shop"),
+        ("cmd", "cmd_check_in"),
+        ("equip", "cmd_equip_item"),
+        ("cmd", "cmd_"),
+        ("fallback", "unknown"),
+        ("fallback", ""),
+    ]
+    assert router.unmatched == 2
+
+
+def test_exact_route_wins_over_prefix():
+    calls = []
+    router = _router(calls)
+
+    @router.exact("cmd_special")
+    async def special(update, context):
+        calls.append(("special", None))
+
+    asyncio.run(router.dispatch(_update("cmd_special"), None))
+    assert calls == [("special", None)]
+
+
+def test_duplicate_routes_are_rejected():
+    router = _router([])
+    with pytest.raises(ValueError):
+        router.exact("back_main")(lambda update, context: None)
+    with pytest.raises(ValueError):
+        router.prefix("cmd_")(lambda update, context, data: None)
+
+
+def test_unmatched_without_fallback_returns_none():
+    router = CallbackRouter()
+    assert asyncio.run(router.dispatch(_update("anything"), None)) is None
+    assert router.unmatched == 1
+
+
+def test_route_statistics():
+    router = CallbackRouter()
+
+    @router.prefix("boom_")
+    async def boom(update, context, callback_data):
+        raise RuntimeError(callback_data)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.dispatch(_update("boom_1"), None))
+
+    stats = router.stats()["routes"]["boom_*"]
+    assert stats["calls"] == 1
+    assert stats["errors"] == 1
+    assert stats["latency"]["count"] == 1
@@ -0,0 +1,48 @@
+"""商店快照对比测试"""
+
+from src.utils.shop_diff import diff_items
+
+
+def _item(name, price, rarity="common", item_type="weapon"):
+    return {"name": name, "price": price, "rarity": rarity, "type": item_type}
+
+
+def test_identical_lists():
+    items = [_item("流云琴", 342), _item("回春丹", 95, item_type="potion")]
+    diff = diff_items(items, [dict(item) for item in items])
+    assert not diff.changed
+    assert diff.unchanged == 2
+    assert diff.summary() == "没有变化"
+
+
+def test_added_removed_and_price_changed():
+    old = [_item("流云琴", 342), _item("玄铁甲", 120, item_type="armor"), _item("回春丹", 95)]
+    new = [_item("回春丹", 80), _item("流云琴", 342), _item("紫霄剑", 500)]
+    diff = diff_items(old, new)
+
+    assert diff.added == [new[2]]
+    assert diff.added_indexes == {2}
+    assert diff.removed == [old[1]]
+    assert diff.price_changed == [(old[2], new[0])]
+    assert diff.previous_prices == {0: 95}
+    assert diff.unchanged == 1
+    assert diff.summary() == "新增 1 件，下架 1 件，1 件价格变化"
+
+
+def test_same_name_different_rarity_or_type_are_different_items():
+    old = [_item("流云琴", 342, rarity="common")]
+    new = [_item("流云琴", 342, rarity="imperial"), _item("流云琴", 342, item_type="armor")]
+    diff = diff_items(old, new)
+    assert diff.added_indexes == {0, 1}
+    assert diff.removed == old
+
+
+def test_duplicates_are_matched_in_order():
+    old = [_item("回春丹", 95), _item("回春丹", 100), _item("回春丹", 110)]
+    new = [_item("回春丹", 95), _item("回春丹", 105)]
+    diff = diff_items(old, new)
+
+    assert diff.unchanged == 1
+    assert diff.price_changed == [(old[1], new[1])]
+    assert diff.previous_prices == {1: 100}
+    assert diff.removed == [old[2]]
@@ -0,0 +1,67 @@
+"""商店文本解析测试
+
+期望结果与改写前的解析器（逐行 re.match，物品名为 (.+?)）的输出一致。
+"""
+
+import time
+
+from src.utils.shop_parser import ShopParser, iter_lines
+
+SHOP_TEXT = """=== 修仙商店 ===
+1. [凡品] 流云琴(改) (武器) [7%折]
+   价格: 342 灵石 (原价: 369)
+2. [灵品] 玄铁甲 (下品) (防具) [+10%]
+   价格: 550 灵石 (原价: 500)
+3. [天品] 回春丹 (丹药) [5%折]
+   价格: 95 灵石 (原价: 100)
+4. [帝品] 混沌珠（残） (物品) [-3%]
+   价格: 970 灵石 (原价: 1000)
+下次刷新时间: 2024-01-01 12:00:00
+"""
+
+EXPECTED_ITEMS = [
+    {"position": 1, "name": "流云琴(改)", "type": "weapon", "rarity": "common",
+     "price": 342, "original_price": 369, "discount_percent": -7.0},
+    {"position": 2, "name": "玄铁甲 (下品)", "type": "armor", "rarity": "spiritual",
+     "price": 550, "original_price": 500, "discount_percent": 10.0},
+    {"position": 3, "name": "回春丹", "type": "potion", "rarity": "heavenly",
+     "price": 95, "original_price": 100, "discount_percent": -5.0},
+    {"position": 4, "name": "混沌珠（残）", "type": "item", "rarity": "imperial",
+     "price": 970, "original_price": 1000, "discount_percent": -3.0},
+]
+
+
+def test_parse_shop_text_matches_baseline():
+    result = ShopParser().parse_shop_text(SHOP_TEXT)
+    assert result["items"] == EXPECTED_ITEMS
+    assert result["count"] == 4
+    assert result["refresh_time"] == "2024-01-01 12:00:00"
+    assert result["raw_text"] == SHOP_TEXT
+
+
+def test_iter_items_accepts_line_iterator():
+    parser = ShopParser()
+    items = [ShopParser._item_to_dict(item) for item in parser.iter_items(iter_lines(SHOP_TEXT))]
+    assert items == EXPECTED_ITEMS
+    assert parser.refresh_time == "2024-01-01 12:00:00"
+
+
+def test_item_line_without_price_is_skipped():
+    text = "1. [凡品] 流云琴 (武器) [7%折]\n2. [凡品] 青锋剑 (武器) [+5%]\n   价格: 105 灵石 (原价: 100)\n"
+    items = ShopParser().parse_shop_text(text)["items"]
+    assert [item["name"] for item in items] == ["青锋剑"]
+
+
+def test_unknown_rarity_and_type_are_kept():
+    text = "1. [仙品] 九天玄火 (法宝) [+0%]\n   价格: 100 灵石 (原价: 100)\n"
+    item = ShopParser().parse_shop_text(text)["items"][0]
+    assert item["rarity"] == "仙品"
+    assert item["type"] == "法宝"
+
+
+def test_item_pattern_is_linear_on_pathological_lines():
+    # 大量未闭合的括号和方括号不会引起回溯爆炸
+    for line in ("1. [凡品] " + " (a" * 20000, "1. [凡品] x" + " (a) [" * 20000, "1. [凡品] a" + " " * 20000 + "x"):
+        start = time.perf_counter()
+        assert ShopParser.ITEM_PATTERN.match(line) is None
+        assert time.perf_counter() - start < 0.5
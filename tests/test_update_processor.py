@@ -0,0 +1,111 @@
+"""按用户串行的更新处理器测试"""
+
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from src.services.update_processor import UserOrderedUpdateProcessor
+
+
+def _update(update_id, user_id):
+    user = User(user_id, f"user{user_id}", is_bot=False)
+    chat = Chat(user_id, Chat.PRIVATE)
+    message = Message(update_id, datetime.now(), chat, from_user=user, text="/shop")
+    return Update(update_id, message=message)
+
+
+class _Recorder:
+    """记录处理顺序和最大并发数"""
+
+    def __init__(self):
+        self.events = []
+        self.active = 0
+        self.max_active = 0
+
+    async def handle(self, name, delay=0.01):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.events.append(("start", name))
+        await asyncio.sleep(delay)
+        self.events.append(("end", name))
+        self.active -= 1
+
+
+def test_same_user_updates_run_in_order():
+    async def scenario():
+        processor = UserOrderedUpdateProcessor(max_concurrent_updates=8)
+        recorder = _Recorder()
+        await asyncio.gather(*(
+            processor.process_update(_update(i, 1), recorder.handle(i, delay=0.01 * (5 - i)))
+            for i in range(5)
+        ))
+        return processor, recorder
+
+    processor, recorder = asyncio.run(scenario())
+    # 前一个更新结束后下一个才开始，即使后到的更新更快
+    assert recorder.events == [event for i in range(5) for event in (("start", i), ("end", i))]
+    assert recorder.max_active == 1
+    assert processor.stats()["processed"] == 5
+    assert processor._slots == {}
+
+
+def test_different_users_run_concurrently_up_to_limit():
+    async def scenario():
+        processor = UserOrderedUpdateProcessor(max_concurrent_updates=3)
+        recorder = _Recorder()
+        await asyncio.gather(*(
+            processor.process_update(_update(i, 100 + i), recorder.handle(i))
+            for i in range(6)
+        ))
+        return processor, recorder
+
+    processor, recorder = asyncio.run(scenario())
+    assert recorder.max_active == 3
+    assert processor.stats()["active"] == 0
+    assert processor.stats()["waiting"] == 0
+
+
+def test_busy_user_does_not_block_others():
+    async def scenario():
+        processor = UserOrderedUpdateProcessor(max_concurrent_updates=2)
+        recorder = _Recorder()
+        busy = [processor.process_update(_update(i, 1), recorder.handle(f"busy{i}")) for i in range(5)]
+        other = processor.process_update(_update(99, 2), recorder.handle("other"))
+        await asyncio.gather(*busy, other)
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    # 用户 1 排队的更新不占并发名额，用户 2 的更新不必等它们全部处理完
+    assert recorder.events.index(("end", "other")) < recorder.events.index(("start", "busy2"))
+
+
+def test_unordered_users_are_not_serialized():
+    async def scenario():
+        processor = UserOrderedUpdateProcessor(max_concurrent_updates=4, unordered=lambda user_id: user_id == 7)
+        recorder = _Recorder()
+        await asyncio.gather(*(
+            processor.process_update(_update(i, 7), recorder.handle(i)) for i in range(4)
+        ))
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert recorder.max_active == 4
+
+
+def test_wait_statistics_per_user():
+    async def scenario():
+        processor = UserOrderedUpdateProcessor(max_concurrent_updates=4, tracked_users=1)
+        recorder = _Recorder()
+        await asyncio.gather(*(
+            processor.process_update(_update(i, 1), recorder.handle(i)) for i in range(3)
+        ))
+        await processor.process_update(_update(10, 2), recorder.handle(10))
+        return processor
+
+    processor = asyncio.run(scenario())
+    waits = processor.user_waits()
+    # 只保留最近活跃的 tracked_users 个用户
+    assert [w["user_id"] for w in waits] == [2]
+    assert waits[0]["count"] == 1
+    assert processor.max_wait > 0
@@ -0,0 +1,46 @@
+"""webhook 请求处理测试"""
+
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from src.web.server import SECRET_TOKEN_HEADER, create_webhook_handler
+
+SECRET = "s3cret"
+
+
+def _post(body, headers=None):
+    """向 webhook 发送一个请求，返回 (状态码, 放入更新队列的更新)"""
+    async def scenario():
+        application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+        app = web.Application()
+        app.router.add_post("/webhook", create_webhook_handler(application, SECRET))
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post("/webhook", data=body, headers={SECRET_TOKEN_HEADER: SECRET, **(headers or {})})
+        updates = []
+        while not application.update_queue.empty():
+            updates.append(application.update_queue.get_nowait())
+        return response.status, updates
+
+    return asyncio.run(scenario())
+
+
+def test_valid_update_is_queued():
+    status, updates = _post('{"update_id": 42}')
+    assert status == 200
+    assert [update.update_id for update in updates] == [42]
+
+
+def test_wrong_secret_token_is_rejected():
+    status, updates = _post('{"update_id": 42}', headers={SECRET_TOKEN_HEADER: "wrong"})
+    assert status == 403
+    assert updates == []
+
+
+def test_invalid_bodies_are_rejected():
+    for body in ("not json", "[]", "42", '"text"', "null"):
+        status, updates = _post(body)
+        assert status == 400, body
+        assert updates == []